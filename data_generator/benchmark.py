@@ -0,0 +1,267 @@
+"""
+MetricFlow — Data Generator Benchmark
+Times each generator stage at several user counts and tracks peak memory,
+so regressions in throughput or footprint show up before a full refresh.
+
+    python -m data_generator.benchmark --vectorized --scales 1000 10000 100000
+    python -m data_generator.benchmark --vectorized --save-baseline
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import replace
+from datetime import datetime
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from data_generator import generate
+from data_generator.config import GeneratorConfig
+
+SCALES = [1_000, 10_000, 100_000, 1_000_000]
+# Sessions are built in the same pass as events, so "events" times and measures both
+STAGES = ["users", "subscriptions", "payments", "events", "marketing_touches"]
+RESULTS_PATH = Path("data/benchmarks/generator.json")
+BASELINE_PATH = Path("data/benchmarks/generator_baseline.json")
+
+console = Console()
+
+
+class _PeakRSS:
+    """Background sampler of this process's resident set size.
+
+    ``ru_maxrss`` only ever grows, so it cannot attribute a peak to one
+    stage; instead a thread polls ``/proc/self/statm`` and :meth:`reset`
+    starts a new high-water mark. Where ``/proc`` is unavailable the
+    process-wide ``ru_maxrss`` is reported.
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self._interval = interval
+        self._page = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self._statm = Path("/proc/self/statm")
+        self._peak = self._rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+
+    def _rss(self) -> int:
+        if self._statm.exists():
+            return int(self._statm.read_text().split()[1]) * self._page
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self._interval):
+            self._peak = max(self._peak, self._rss())
+
+    def __enter__(self) -> Self:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def reset(self) -> None:
+        self._peak = self._rss()
+
+    @property
+    def peak(self) -> int:
+        return max(self._peak, self._rss())
+
+
+def _record(rows: int, seconds: float, peak: int) -> dict:
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 1) if seconds > 0 else None,
+        "peak_rss_mb": round(peak / 2**20, 1),
+    }
+
+
+def bench_scale(cfg: GeneratorConfig) -> dict[str, dict]:
+    """Run every generator stage once for ``cfg.num_users`` and measure it.
+
+    With ``cfg.stream_events`` events and sessions go through
+    :func:`~data_generator.generate.write_events_parquet` into a temporary
+    directory, as a streaming run writes them. Sessions come out of the
+    events pass and cannot be timed apart from it, so they are folded into
+    the ``events`` stage rather than reported as a stage of their own.
+    Nothing else is written to disk.
+    """
+    generate.console.quiet = True
+    rng = np.random.default_rng(cfg.seed) if cfg.columnar else None
+    keys = generate.KeySpace(cfg.id_format)
+    results = {}
+    with _PeakRSS() as rss:
+        def stage(name, fn, *args):
+            rss.reset()
+            start = time.perf_counter()
+            out = fn(*args)
+            results[name] = _record(len(out), time.perf_counter() - start, rss.peak)
+            return out
+
+        users = stage("users", generate.generate_users, cfg, rng, keys)
+        subs = stage("subscriptions", generate.generate_subscriptions, users, cfg, rng, keys)
+        stage("payments", generate.generate_payments, subs, cfg, rng, keys)
+        if cfg.stream_events:
+            rss.reset()
+            start = time.perf_counter()
+            with tempfile.TemporaryDirectory() as tmp:
+                rows = generate.write_events_parquet(
+                    generate.iter_event_chunks(users, subs, cfg, rng, keys), Path(tmp), cfg,
+                )
+            seconds = time.perf_counter() - start
+        else:
+            rss.reset()
+            start = time.perf_counter()
+            events, sessions = generate.generate_events_and_sessions(users, subs, cfg, rng, keys)
+            seconds = time.perf_counter() - start
+            rows = {"events": len(events)}
+            del events, sessions
+        results["events"] = _record(rows["events"], seconds, rss.peak)
+        stage("marketing_touches", generate.generate_marketing, users, cfg, rng, keys)
+    return results
+
+
+def run_benchmark(cfg: GeneratorConfig, scales: list[int] = SCALES) -> dict:
+    """Benchmark every stage at each scale, each scale in a fresh process.
+
+    A new process per scale keeps allocator state and cached arrays from a
+    smaller run out of the next one's peak RSS. If a scale's process dies
+    (typically the OOM killer) it is listed under ``failed`` and larger
+    scales are skipped.
+    """
+    results = {}
+    failed = []
+    for scale in sorted(scales):
+        console.print(f"[bold blue]Benchmarking {scale:,} users...[/]")
+        try:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                results[str(scale)] = pool.submit(bench_scale, replace(cfg, num_users=scale)).result()
+        except BrokenProcessPool:
+            console.print(f"[bold red]✗ {scale:,} users: worker died (out of memory?); skipping larger scales[/]")
+            failed = [s for s in sorted(scales) if s >= scale]
+            break
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "config": {
+            "vectorized": cfg.vectorized,
+            "stream_events": cfg.stream_events,
+            "events_chunk_users": cfg.events_chunk_users,
+            "id_format": cfg.id_format,
+            "categorical": cfg.categorical,
+            "seed": cfg.seed,
+        },
+        "results": results,
+        "failed": failed,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.2) -> list[str]:
+    """Describe every stage that got slower or larger than the baseline.
+
+    A stage regresses when its throughput drops, or its peak RSS grows, by
+    more than ``tolerance`` (a fraction). Scales or stages missing from
+    either report are ignored.
+    """
+    regressions = []
+    for scale, stages in current["results"].items():
+        for name, now in stages.items():
+            before = baseline.get("results", {}).get(scale, {}).get(name)
+            if before is None:
+                continue
+            if before["rows_per_sec"] and now["rows_per_sec"] is not None \
+                    and now["rows_per_sec"] < before["rows_per_sec"] * (1 - tolerance):
+                regressions.append(
+                    f"{name} @ {int(scale):,} users: {now['rows_per_sec']:,.0f} rows/s "
+                    f"vs {before['rows_per_sec']:,.0f} baseline"
+                )
+            if now["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+                regressions.append(
+                    f"{name} @ {int(scale):,} users: peak RSS {now['peak_rss_mb']:,.0f} MB "
+                    f"vs {before['peak_rss_mb']:,.0f} MB baseline"
+                )
+    return regressions
+
+
+def _print_report(report: dict) -> None:
+    table = Table(title="Generator benchmark")
+    for column in ("users", "stage", "rows", "seconds", "rows/sec", "peak RSS (MB)"):
+        table.add_column(column, justify="left" if column == "stage" else "right")
+    for scale, stages in report["results"].items():
+        for name, r in stages.items():
+            table.add_row(
+                f"{int(scale):,}", name, f"{r['rows']:,}", f"{r['seconds']:.3f}",
+                f"{r['rows_per_sec'] or 0:,.0f}", f"{r['peak_rss_mb']:,.1f}",
+            )
+    console.print(table)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the MetricFlow data generator.")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES, help="user counts to benchmark")
+    parser.add_argument("--vectorized", action="store_true", help="use the columnar NumPy engine")
+    parser.add_argument("--stream-events", action="store_true",
+                        help="stream events and sessions to Parquet in bounded-memory chunks")
+    parser.add_argument("--events-chunk-users", type=int, default=GeneratorConfig.events_chunk_users,
+                        help="users per event chunk with --stream-events")
+    parser.add_argument("--id-format", choices=["uuid", "int", "hex"], default="uuid")
+    parser.add_argument("--categorical", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=RESULTS_PATH, help="where to write the JSON results")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed fractional drop in rows/sec or growth in peak RSS")
+    args = parser.parse_args(argv)
+
+    cfg = GeneratorConfig(
+        vectorized=args.vectorized,
+        stream_events=args.stream_events,
+        events_chunk_users=args.events_chunk_users,
+        id_format=args.id_format,
+        categorical=args.categorical,
+        seed=args.seed,
+    )
+    report = run_benchmark(cfg, args.scales)
+    _print_report(report)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    console.print(f"Results → {args.output}")
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2))
+        console.print(f"Baseline → {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        console.print(f"[yellow]No baseline at {args.baseline}; run with --save-baseline to create one[/]")
+        return 0
+    regressions = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+    regressions += [f"{scale:,} users: benchmark did not complete" for scale in report["failed"]]
+    for line in regressions:
+        console.print(f"[bold red]✗ {line}[/]")
+    if regressions:
+        return 1
+    console.print("[bold green]✅ No regressions against baseline[/]")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -66,6 +66,28 @@ class GeneratorConfig:
         "alert_configured",
     ])
 
+    # Performance
+    vectorized: bool = False  # columnar NumPy engine instead of per-row Python loops
+    stream_events: bool = False  # write events chunk by chunk instead of one DataFrame
+    events_chunk_users: int = 5_000  # users per event chunk; bounds peak memory
+    workers: int = 1  # >1 generates that many user shards in separate processes
+    seed: int = 42  # seeds the columnar engine and per-shard RNGs
+    id_format: str = "uuid"  # "uuid" (random hex), "int" (sequential int64) or "hex" (sequential, hex-rendered)
+    categorical: bool = False  # store low-cardinality columns as pandas category / Arrow dictionary
+
     # Output
     output_dir: str = "data/raw"
     parquet_compression: str = "snappy"
+    partition_output: bool = False  # Hive-partition time-series datasets by month
+    row_group_size: int | None = None  # rows per Parquet row group (None = writer default)
+    sort_output: bool = False  # sort rows by user_id then time within each file
+    write_parquet: bool = True  # False only with a direct DuckDB load (generate_and_load)
+
+    def __post_init__(self) -> None:
+        if self.id_format not in ("uuid", "int", "hex"):
+            raise ValueError(f"id_format must be 'uuid', 'int' or 'hex', got {self.id_format!r}")
+
+    @property
+    def columnar(self) -> bool:
+        """Whether the columnar engine runs; compact IDs and categoricals require it."""
+        return self.vectorized or self.id_format != "uuid" or self.categorical
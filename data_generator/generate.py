@@ -6,21 +6,59 @@ Produces Parquet files optimized for DuckDB analytics.
 
 from __future__ import annotations
 
+import argparse
 import hashlib
-import os
+import json
 import random
+import shutil
 import uuid
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
 from datetime import date, datetime, timedelta
+from itertools import pairwise
 from pathlib import Path
 
+import duckdb
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from faker import Faker
 from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn
 
 from data_generator.config import GeneratorConfig
 
+DATASETS = ["users", "subscriptions", "payments", "events", "sessions", "marketing_touches"]
+ID_COLUMNS = {
+    "users": "user_id",
+    "subscriptions": "subscription_id",
+    "payments": "payment_id",
+    "events": "event_id",
+    "sessions": "session_id_unique",
+    "marketing_touches": "touch_id",
+}
+GENERATION_FILE = "_generation.json"
+DB_PATH = "data/metricflow.duckdb"
+
+# Month partition column derived from each time-series dataset's timestamp
+PARTITION_COLUMNS = {
+    "events": ("event_timestamp", "event_month"),
+    "sessions": ("session_start", "session_month"),
+    "payments": ("payment_date", "payment_month"),
+    "marketing_touches": ("touch_timestamp", "touch_month"),
+}
+SORT_KEYS = {
+    "users": ["user_id"],
+    "subscriptions": ["user_id", "started_at"],
+    "payments": ["user_id", "payment_date"],
+    "events": ["user_id", "event_timestamp"],
+    "sessions": ["user_id", "session_start"],
+    "marketing_touches": ["user_id", "touch_timestamp"],
+}
+
 fake = Faker()
 Faker.seed(42)
 np.random.seed(42)
@@ -35,16 +73,116 @@ def _id() -> str:
     return uuid.uuid4().hex[:12]
 
 
+def _ids(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Vectorized counterpart of :func:`_id`: ``n`` random 12-char hex IDs."""
+    raw = rng.bytes(6 * n).hex().encode("ascii")
+    return np.frombuffer(raw, dtype="S12").astype("U12").astype(object)
+
+
+class KeySpace:
+    """Allocates row identifiers for the columnar engine.
+
+    With ``id_format="uuid"`` keys are random 12-char hex strings like
+    :func:`_id`. Otherwise each dataset gets sequential 64-bit keys whose top
+    16 bits hold the shard index, so keys never collide within or across
+    shards; ``"hex"`` renders them as fixed-width 16-char hex strings.
+    """
+
+    SHARD_BITS = 48
+
+    def __init__(self, id_format: str = "uuid", shard: int = 0) -> None:
+        self.id_format = id_format
+        self.base = shard << self.SHARD_BITS
+        self._next: dict[str, int] = {}
+
+    def resume(self, dataset: str, last_key: int) -> None:
+        """Continue ``dataset`` after an already-issued key."""
+        self._next[dataset] = max(self._next.get(dataset, 1), last_key - self.base + 1)
+
+    def take(self, dataset: str, n: int, rng: np.random.Generator) -> np.ndarray:
+        if self.id_format == "uuid":
+            return _ids(n, rng)
+        start = self._next.get(dataset, 1)
+        self._next[dataset] = start + n
+        keys = self.base + np.arange(start, start + n, dtype=np.int64)
+        if self.id_format == "int":
+            return keys
+        raw = keys.astype(">u8").tobytes().hex().encode("ascii")
+        return np.frombuffer(raw, dtype="S16").astype("U16").astype(object)
+
+
+def _categorical_dtypes(cfg: GeneratorConfig) -> dict[str, pd.CategoricalDtype]:
+    """Fixed category sets so every chunk and shard shares one dictionary."""
+    plans = list(cfg.plans.keys())
+    channels = list(cfg.acquisition_channels)
+    return {
+        column: pd.CategoricalDtype(categories)
+        for column, categories in {
+            "country": _COUNTRIES,
+            "acquisition_channel": channels,
+            "channel": channels,
+            "initial_plan": plans,
+            "plan": plans,
+            "company_size": _COMPANY_SIZES,
+            "industry": _INDUSTRIES,
+            "change_type": list(_CHANGE_TYPES),
+            "billing_interval": ["monthly", "annual"],
+            "currency": ["USD"],
+            "payment_method": ["credit_card", "debit_card", "paypal", "wire_transfer"],
+            "status": _PAYMENT_STATUSES,
+            "event_type": list(cfg.event_types),
+            "platform": _PLATFORMS,
+            "page_url": _PAGE_URLS,
+            "campaign": _CAMPAIGNS,
+            "touch_type": _TOUCH_TYPES,
+        }.items()
+    }
+
+
+def _encode(df: pd.DataFrame, cfg: GeneratorConfig) -> pd.DataFrame:
+    """Apply ``cfg.categorical`` dictionary encoding to a columnar-engine frame."""
+    if not cfg.categorical:
+        return df
+    dtypes = _categorical_dtypes(cfg)
+    return df.astype({c: dtypes[c] for c in df.columns if c in dtypes})
+
+
+def _keys(cfg: GeneratorConfig, keys: KeySpace | None = None) -> KeySpace:
+    return keys if keys is not None else KeySpace(cfg.id_format)
+
+
+def _rng(rng: np.random.Generator | None = None) -> np.random.Generator:
+    """Return ``rng``, or a Generator seeded from the global NumPy state.
+
+    Drawing the seed from the legacy global state keeps the columnar engine
+    reproducible under the module-level ``np.random.seed`` call.
+    """
+    if rng is not None:
+        return rng
+    return np.random.default_rng(np.random.randint(0, 2**31 - 1))
+
+
+def _choice(rng: np.random.Generator, options: list, size: int, weights=None) -> np.ndarray:
+    """Draw ``size`` values from ``options`` with optional relative ``weights``."""
+    p = None
+    if weights is not None:
+        p = np.asarray(weights, dtype=float)
+        p = p / p.sum()
+    return np.asarray(options, dtype=object)[rng.choice(len(options), size=size, p=p)]
+
+
 def _date_range(start: date, end: date) -> list[date]:
     days = (end - start).days
     return [start + timedelta(days=i) for i in range(days + 1)]
 
 
+_MONTH_WEIGHTS = {1: 1.4, 2: 1.1, 3: 1.0, 4: 0.9, 5: 0.85, 6: 0.8,
+                  7: 0.75, 8: 0.9, 9: 1.3, 10: 1.1, 11: 1.0, 12: 0.7}
+
+
 def _seasonal_weight(d: date) -> float:
     """Simulate seasonal signup patterns: peaks in Jan, Sep."""
-    month_weights = {1: 1.4, 2: 1.1, 3: 1.0, 4: 0.9, 5: 0.85, 6: 0.8,
-                     7: 0.75, 8: 0.9, 9: 1.3, 10: 1.1, 11: 1.0, 12: 0.7}
-    return month_weights.get(d.month, 1.0)
+    return _MONTH_WEIGHTS.get(d.month, 1.0)
 
 
 def _growth_curve(d: date, start: date) -> float:
@@ -53,12 +191,46 @@ def _growth_curve(d: date, start: date) -> float:
     return 1.0 + 0.8 * np.log1p(months)
 
 
+def _signup_days(cfg: GeneratorConfig, since: date | None = None) -> np.ndarray:
+    """Candidate signup days: the whole history, or the days after ``since``."""
+    first = np.datetime64(cfg.history_start, "D") if since is None else np.datetime64(since, "D") + 1
+    return np.arange(first, np.datetime64(cfg.history_end, "D") + 1)
+
+
+def _signup_weights(days: np.ndarray, start: date) -> np.ndarray:
+    """Vectorized ``_seasonal_weight * _growth_curve`` over a datetime64[D] array."""
+    months = days.astype("datetime64[M]").astype(np.int64)
+    month_of_year = months % 12 + 1
+    seasonal = np.array([_MONTH_WEIGHTS[m] for m in range(1, 13)])[month_of_year - 1]
+    elapsed = months - np.datetime64(start, "M").astype(np.int64)
+    return seasonal * (1.0 + 0.8 * np.log1p(elapsed))
+
+
+_COUNTRIES = ["US", "UK", "CA", "DE", "FR", "AU", "IN", "BR", "JP", "Other"]
+_COUNTRY_WEIGHTS = [50, 12, 10, 8, 5, 5, 4, 3, 2, 1]
+_COMPANY_SIZES = ["1-10", "11-50", "51-200", "201-1000", "1000+"]
+_COMPANY_SIZE_WEIGHTS = [0.35, 0.30, 0.20, 0.10, 0.05]
+_INDUSTRIES = [
+    "Technology", "Finance", "Healthcare", "Education", "Retail",
+    "Manufacturing", "Media", "Consulting", "Non-profit", "Government",
+]
+
+# Pool sizes for Faker-backed columns in the columnar engine
+_NAME_POOL_SIZE = 5_000
+_DOMAIN_POOL_SIZE = 64
+
+
 # ---------------------------------------------------------------------------
 # Users
 # ---------------------------------------------------------------------------
 
-def generate_users(cfg: GeneratorConfig) -> pd.DataFrame:
+def generate_users(
+    cfg: GeneratorConfig, rng: np.random.Generator | None = None, keys: KeySpace | None = None,
+) -> pd.DataFrame:
     console.print("[bold blue]Generating users...[/]")
+    if cfg.columnar:
+        return _generate_users_vectorized(cfg, _rng(rng), _keys(cfg, keys))
+
     dates = _date_range(cfg.history_start, cfg.history_end)
     
     # Distribute signups across dates with seasonality + growth
@@ -106,12 +278,61 @@ def generate_users(cfg: GeneratorConfig) -> pd.DataFrame:
     return pd.DataFrame(users)
 
 
+def _generate_users_vectorized(
+    cfg: GeneratorConfig, rng: np.random.Generator, keys: KeySpace,
+    n: int | None = None, since: date | None = None,
+) -> pd.DataFrame:
+    """Columnar user generation: every column is drawn in bulk with NumPy.
+
+    Names and email domains are sampled by index from small Faker-built pools,
+    so Faker is called a few thousand times regardless of ``num_users``.
+    ``n`` and ``since`` generate that many signups after ``since`` only.
+    """
+    n = cfg.num_users if n is None else n
+    days = _signup_days(cfg, since)
+    weights = _signup_weights(days, cfg.history_start)
+    signup_days = days[rng.choice(len(days), size=n, p=weights / weights.sum())]
+
+    hours = rng.integers(6, 24, size=n)
+    minutes = rng.integers(0, 60, size=n)
+    signup_ts = (signup_days.astype("datetime64[m]")
+                 + (hours * 60 + minutes).astype("timedelta64[m]"))
+
+    plan_names = list(cfg.plans.keys())
+    name_pool = np.array([fake.name() for _ in range(_NAME_POOL_SIZE)], dtype=object)
+    domain_pool = np.array([fake.free_email_domain() for _ in range(_DOMAIN_POOL_SIZE)])
+
+    user_ids = keys.take("users", n, rng)
+    domains = domain_pool[rng.integers(0, _DOMAIN_POOL_SIZE, size=n)]
+    emails = np.char.add(np.char.add(np.char.add("user_", user_ids.astype(str)), "@"), domains)
+
+    return _encode(pd.DataFrame({
+        "user_id": user_ids,
+        "email": emails.astype(object),
+        "name": name_pool[rng.integers(0, _NAME_POOL_SIZE, size=n)],
+        "signup_date": signup_days.astype(object),
+        "signup_timestamp": signup_ts.astype("datetime64[ns]"),
+        "country": _choice(rng, _COUNTRIES, n, _COUNTRY_WEIGHTS),
+        "acquisition_channel": _choice(rng, cfg.acquisition_channels, n),
+        "initial_plan": _choice(rng, plan_names, n, [cfg.plans[p]["weight"] for p in plan_names]),
+        "company_size": _choice(rng, _COMPANY_SIZES, n, _COMPANY_SIZE_WEIGHTS),
+        "industry": _choice(rng, _INDUSTRIES, n),
+        "is_verified": rng.random(n) < 0.85,
+    }), cfg)
+
+
 # ---------------------------------------------------------------------------
 # Subscriptions (with upgrades, downgrades, churns)
 # ---------------------------------------------------------------------------
 
-def generate_subscriptions(users_df: pd.DataFrame, cfg: GeneratorConfig) -> pd.DataFrame:
+def generate_subscriptions(
+    users_df: pd.DataFrame, cfg: GeneratorConfig, rng: np.random.Generator | None = None,
+    keys: KeySpace | None = None,
+) -> pd.DataFrame:
     console.print("[bold blue]Generating subscriptions...[/]")
+    if cfg.columnar:
+        return _generate_subscriptions_vectorized(users_df, cfg, _rng(rng), _keys(cfg, keys))
+
     plan_order = ["free", "starter", "professional", "enterprise"]
     churn_mult = {
         "free": cfg.churn_multiplier_free,
@@ -185,12 +406,125 @@ def generate_subscriptions(users_df: pd.DataFrame, cfg: GeneratorConfig) -> pd.D
     return pd.DataFrame(subs)
 
 
+_PLAN_ORDER = ["free", "starter", "professional", "enterprise"]
+_REACTIVATION_WEIGHTS = [0.2, 0.4, 0.3, 0.1]
+_CHANGE_TYPES = np.array(["active", "upgrade", "downgrade", "churned", "renewed"], dtype=object)
+_ACTIVE, _UPGRADE, _DOWNGRADE, _CHURNED, _RENEWED = range(5)
+
+
+def _generate_subscriptions_vectorized(
+    users_df: pd.DataFrame, cfg: GeneratorConfig, rng: np.random.Generator, keys: KeySpace,
+) -> pd.DataFrame:
+    """Batched state machine over all users at once.
+
+    Each pass advances every still-open user by one plan period, applying the
+    same geometric durations and upgrade/downgrade/churn/reactivation rules as
+    the per-user loop. The number of passes is bounded by the longest
+    subscription chain rather than by the number of users.
+    """
+    plan_index = {p: i for i, p in enumerate(_PLAN_ORDER)}
+    plan = users_df["initial_plan"].astype(object).map(plan_index).to_numpy(dtype=np.int64)
+    start = users_df["signup_date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    owner, _, plan, start, end, change, monthly = _subscription_passes(
+        np.arange(len(users_df)), plan, start, cfg, rng,
+    )
+    return _subscriptions_frame(
+        keys.take("subscriptions", len(owner), rng), users_df["user_id"].to_numpy()[owner],
+        plan, start, end, change, monthly, cfg,
+    )
+
+
+def _subscription_passes(
+    owner: np.ndarray, plan: np.ndarray, start: np.ndarray, cfg: GeneratorConfig,
+    rng: np.random.Generator, min_months: np.ndarray | None = None,
+) -> tuple[np.ndarray, ...]:
+    """Run the subscription state machine from the given open periods.
+
+    ``start`` is in days since the epoch. ``min_months`` optionally
+    conditions the first period's duration on having already lasted that
+    long, which is how appended windows resume open subscriptions (the
+    geometric duration is memoryless). Returns ``(owner, step, plan, start,
+    end, change, monthly)`` arrays ordered per owner, chronologically.
+    """
+    horizon = np.datetime64(cfg.history_end, "D").astype(np.int64)
+    churn_rate = cfg.base_monthly_churn_rate * np.array([
+        cfg.churn_multiplier_free, cfg.churn_multiplier_starter,
+        cfg.churn_multiplier_pro, cfg.churn_multiplier_enterprise,
+    ])
+    live = start < horizon
+    owner, plan, start = owner[live], plan[live], start[live]
+    elapsed = min_months[live] - 1 if min_months is not None else 0
+
+    passes = [tuple(np.empty(0, dtype=np.int64) for _ in range(6)) + (np.empty(0, dtype=bool),)]
+    step = 0
+    while owner.size:
+        n = owner.size
+        monthly_churn = churn_rate[plan]
+        months = np.maximum(1, rng.geometric(monthly_churn)) + elapsed
+        end = np.minimum(start + months * 30, horizon)
+        rand = rng.random(n)
+
+        active = end >= horizon
+        upgrade = ~active & (rand < 0.15) & (plan < 3)
+        downgrade = ~active & ~upgrade & (rand < 0.22) & (plan > 0)
+        churned = ~active & ~upgrade & ~downgrade & (rand < 0.22 + monthly_churn * 3)
+        change = np.full(n, _RENEWED)
+        change[active] = _ACTIVE
+        change[upgrade] = _UPGRADE
+        change[downgrade] = _DOWNGRADE
+        change[churned] = _CHURNED
+
+        passes.append((owner, np.full(n, step), plan, start, end, change, rng.random(n) < 0.7))
+
+        # Transition to the next period
+        reactivated = churned & (rng.random(n) < 0.15)
+        next_plan = np.where(
+            reactivated,
+            rng.choice(len(_PLAN_ORDER), size=n, p=_REACTIVATION_WEIGHTS),
+            plan + upgrade - downgrade,
+        )
+        next_start = np.where(reactivated, end + rng.integers(30, 181, size=n), end)
+        keep = (~active & ~churned | reactivated) & (next_start < horizon)
+        owner, plan, start = owner[keep], next_plan[keep], next_start[keep]
+        elapsed = 0
+        step += 1
+
+    owner, steps, plan, start, end, change, monthly = (np.concatenate(c) for c in zip(*passes))
+    order = np.lexsort((steps, owner))  # per-user chronological, like the loop
+    return tuple(a[order] for a in (owner, steps, plan, start, end, change, monthly))
+
+
+def _subscriptions_frame(
+    subscription_ids: np.ndarray, user_ids: np.ndarray, plan: np.ndarray, start: np.ndarray,
+    end: np.ndarray, change: np.ndarray, monthly: np.ndarray, cfg: GeneratorConfig,
+) -> pd.DataFrame:
+    ended = end.astype("datetime64[D]")
+    ended[change == _ACTIVE] = np.datetime64("NaT")
+    prices = np.array([cfg.plans[p]["price"] for p in _PLAN_ORDER])
+    return _encode(pd.DataFrame({
+        "subscription_id": subscription_ids,
+        "user_id": user_ids,
+        "plan": np.asarray(_PLAN_ORDER, dtype=object)[plan],
+        "price": prices[plan],
+        "started_at": start.astype("datetime64[D]").astype(object),
+        "ended_at": ended.astype(object),
+        "change_type": _CHANGE_TYPES[change],
+        "billing_interval": np.where(monthly, "monthly", "annual").astype(object),
+    }), cfg)
+
+
 # ---------------------------------------------------------------------------
 # Payments
 # ---------------------------------------------------------------------------
 
-def generate_payments(subs_df: pd.DataFrame, cfg: GeneratorConfig) -> pd.DataFrame:
+def generate_payments(
+    subs_df: pd.DataFrame, cfg: GeneratorConfig, rng: np.random.Generator | None = None,
+    keys: KeySpace | None = None,
+) -> pd.DataFrame:
     console.print("[bold blue]Generating payments...[/]")
+    if cfg.columnar:
+        return _generate_payments_vectorized(subs_df, cfg, _rng(rng), _keys(cfg, keys))
+
     payments = []
     
     for _, sub in subs_df.iterrows():
@@ -232,13 +566,132 @@ def generate_payments(subs_df: pd.DataFrame, cfg: GeneratorConfig) -> pd.DataFra
     return pd.DataFrame(payments)
 
 
+_PAYMENT_STATUSES = ["succeeded", "failed", "refunded"]
+_PAYMENT_STATUS_WEIGHTS = [0.94, 0.04, 0.02]
+
+
+def _generate_payments_vectorized(
+    subs_df: pd.DataFrame, cfg: GeneratorConfig, rng: np.random.Generator, keys: KeySpace,
+    since: date | None = None,
+) -> pd.DataFrame:
+    """Expand billing schedules with ``np.repeat`` instead of per-payment dicts.
+
+    Annual subscriptions pay once at start; monthly ones pay every 30 days
+    while before the end date, i.e. ``ceil((end - start) / 30)`` times.
+    With ``since``, only payments dated on or after it are produced.
+    """
+    paid = subs_df[subs_df["price"].to_numpy() != 0]
+    start = paid["started_at"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    end = (paid["ended_at"].fillna(cfg.history_end).to_numpy()
+           .astype("datetime64[D]").astype(np.int64))
+    annual = paid["billing_interval"].to_numpy() == "annual"
+    price = paid["price"].to_numpy(dtype=float)
+
+    counts = np.where(annual, 1, np.maximum(0, -((start - end) // 30)))
+    first = np.zeros(len(paid), dtype=np.int64)
+    if since is not None:
+        cutoff = np.datetime64(since, "D").astype(np.int64)
+        first = np.where(annual, start < cutoff, np.maximum(0, -((start - cutoff) // 30)))
+        counts = np.maximum(0, counts - first)
+    total = int(counts.sum())
+    row = np.repeat(np.arange(len(paid)), counts)
+    offset = first[row] + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    is_annual = annual[row]
+
+    discount = np.where(rng.random(total) < 0.6, 0.85, 1.0)
+    jitter = 1 + rng.uniform(-0.02, 0.02, size=total)
+    amount = np.where(is_annual, price[row] * 12 * discount, price[row] * jitter)
+    method = np.where(
+        is_annual,
+        _choice(rng, ["credit_card", "debit_card", "paypal", "wire_transfer"], total),
+        _choice(rng, ["credit_card", "debit_card", "paypal"], total),
+    )
+
+    return _encode(pd.DataFrame({
+        "payment_id": keys.take("payments", total, rng),
+        "subscription_id": paid["subscription_id"].to_numpy()[row],
+        "user_id": paid["user_id"].to_numpy()[row],
+        "amount": np.round(amount, 2),
+        "currency": "USD",
+        "payment_date": (start[row] + offset * 30).astype("datetime64[D]").astype(object),
+        "payment_method": method,
+        "status": _choice(rng, _PAYMENT_STATUSES, total, _PAYMENT_STATUS_WEIGHTS),
+        "billing_interval": np.where(is_annual, "annual", "monthly").astype(object),
+    }), cfg)
+
+
 # ---------------------------------------------------------------------------
 # Events (product usage)
 # ---------------------------------------------------------------------------
 
-def generate_events(users_df: pd.DataFrame, subs_df: pd.DataFrame, cfg: GeneratorConfig) -> pd.DataFrame:
+def generate_events(
+    users_df: pd.DataFrame, subs_df: pd.DataFrame, cfg: GeneratorConfig,
+    rng: np.random.Generator | None = None, keys: KeySpace | None = None,
+) -> pd.DataFrame:
     console.print("[bold blue]Generating events (this takes a moment)...[/]")
-    
+    if cfg.columnar:
+        return pd.concat([e for e, _ in iter_event_chunks(users_df, subs_df, cfg, rng, keys)], ignore_index=True)
+    return _generate_events_loop(subs_df, cfg)
+
+
+def generate_events_and_sessions(
+    users_df: pd.DataFrame, subs_df: pd.DataFrame, cfg: GeneratorConfig,
+    rng: np.random.Generator | None = None, keys: KeySpace | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Events and the sessions they form.
+
+    The columnar engine builds sessions in the same pass as the events; the
+    loop engine aggregates them from the finished events table.
+    """
+    if not cfg.columnar:
+        events = generate_events(users_df, subs_df, cfg, rng, keys)
+        return events, generate_sessions(events, rng, keys)
+    console.print("[bold blue]Generating events and sessions (this takes a moment)...[/]")
+    chunks = list(iter_event_chunks(users_df, subs_df, cfg, rng, keys))
+    return (pd.concat([events for events, _ in chunks], ignore_index=True),
+            pd.concat([sessions for _, sessions in chunks], ignore_index=True))
+
+
+def iter_event_chunks(
+    users_df: pd.DataFrame, subs_df: pd.DataFrame, cfg: GeneratorConfig,
+    rng: np.random.Generator | None = None, keys: KeySpace | None = None, since: date | None = None,
+) -> Iterator[tuple[pd.DataFrame, pd.DataFrame]]:
+    """Yield ``(events, sessions)`` for ``cfg.events_chunk_users`` users at a time.
+
+    Only one chunk of events is materialised at once, so peak memory is set
+    by the chunk size rather than by the total number of events. Chunks never
+    split a user, so their sessions are complete. ``since`` (columnar engine
+    only) skips days before that date.
+    """
+    if cfg.columnar:
+        rng, keys = _rng(rng), _keys(cfg, keys)
+    # Positional codes: random ids may repeat at scale, so user_id cannot be an index.
+    # A repeated id goes with its first row, keeping all of its periods in one chunk.
+    user_codes, uniques = pd.factorize(users_df["user_id"])
+    first = np.empty(len(uniques), dtype=np.int64)
+    first[user_codes[::-1]] = np.arange(len(user_codes))[::-1]
+    chunk_users = max(1, cfg.events_chunk_users)
+    codes = first[uniques.get_indexer(subs_df["user_id"])] // chunk_users
+    order = np.argsort(codes, kind="stable")
+    n_chunks = -(-len(users_df) // chunk_users)
+    bounds = np.searchsorted(codes[order], np.arange(n_chunks + 1))
+    for lo, hi in pairwise(bounds):
+        chunk = subs_df.iloc[order[lo:hi]]
+        if cfg.columnar:
+            yield _generate_events_vectorized(chunk, cfg, rng, keys, since)
+        else:
+            events = _generate_events_loop(chunk, cfg)
+            yield events, _aggregate_sessions(events)
+
+
+_EVENT_COLUMNS = ["event_id", "user_id", "event_type", "event_timestamp", "session_id", "platform", "page_url"]
+_SESSION_COLUMNS = [
+    "user_id", "session_id", "session_start", "session_end", "event_count", "platform",
+    "duration_seconds", "session_id_unique",
+]
+
+
+def _generate_events_loop(subs_df: pd.DataFrame, cfg: GeneratorConfig) -> pd.DataFrame:
     # Build user activity periods
     user_periods = {}
     for _, sub in subs_df.iterrows():
@@ -297,28 +750,178 @@ def generate_events(users_df: pd.DataFrame, subs_df: pd.DataFrame, cfg: Generato
                         ]) if random.random() < 0.7 else None,
                     })
     
-    return pd.DataFrame(events)
+    return pd.DataFrame(events, columns=_EVENT_COLUMNS)
+
+
+_PLAN_ACTIVITY = {"free": 2, "starter": 5, "professional": 12, "enterprise": 20}
+_EVENT_TYPE_WEIGHTS = [20, 15, 10, 12, 8, 5, 3, 2, 8, 4, 2, 3, 5, 3]
+_EVENT_HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 12, 14, 14, 12, 10, 12, 14, 13, 11, 9, 7, 5, 4, 3, 2, 1]
+_PLATFORMS = ["web", "mobile_ios", "mobile_android", "api"]
+_PLATFORM_WEIGHTS = [0.55, 0.20, 0.15, 0.10]
+_PAGE_URLS = [
+    "/dashboard", "/reports", "/settings", "/billing",
+    "/integrations", "/team", "/analytics", "/api-docs",
+]
+
+
+def _generate_events_vectorized(
+    subs_df: pd.DataFrame, cfg: GeneratorConfig, rng: np.random.Generator, keys: KeySpace,
+    since: date | None = None,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Columnar event and session generation for one chunk of subscription periods.
+
+    Active days are sampled without replacement per period by ranking random
+    keys within each period; events per day, types, timestamps and platforms
+    are then drawn in bulk. Each event lands in one of four session slots of
+    its user-day, as in the loop engine; events are laid out grouped by
+    session so session start, end, size and platform fall out of
+    ``reduceat`` over contiguous runs instead of a groupby.
+    """
+    start = subs_df["started_at"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    end = (subs_df["ended_at"].fillna(cfg.history_end).to_numpy()
+           .astype("datetime64[D]").astype(np.int64))
+    daily = subs_df["plan"].astype(object).map(_PLAN_ACTIVITY).fillna(3).to_numpy(dtype=np.int64)
+    if since is not None:
+        start = np.maximum(start, np.datetime64(since, "D").astype(np.int64))
+    days_active = end - start
+    keep = days_active > 0
+    user_ids = subs_df["user_id"].to_numpy()[keep]
+    start, daily, days_active = start[keep], daily[keep], days_active[keep]
+
+    rate = np.minimum(0.85, 0.3 + daily * 0.03)
+    n_days = np.minimum(np.maximum(1, (days_active * rate).astype(np.int64)), days_active)
+
+    # Pick n_days of each period's days: smallest random keys within the period
+    period = np.repeat(np.arange(len(start)), days_active)
+    day_offset = np.arange(len(period)) - np.repeat(np.cumsum(days_active) - days_active, days_active)
+    ranked = np.argsort(period + rng.random(len(period)), kind="stable")
+    rank = np.empty_like(ranked)
+    rank[ranked] = day_offset
+    chosen = rank < n_days[period]
+    period, day_offset = period[chosen], day_offset[chosen]  # already sorted by (period, day)
+
+    per_day = np.minimum(np.maximum(1, rng.poisson(daily[period])), 30)
+    total = int(per_day.sum())
+    # (user-day, slot 0-3) session key per event, sorted so sessions are contiguous
+    slot_key = np.sort(np.repeat(np.arange(len(period)) * 4, per_day) + rng.integers(0, 4, size=total))
+    day = slot_key // 4
+    owner = period[day]
+    event_day = start[owner] + day_offset[day]
+
+    seconds = (
+        rng.choice(24, size=total, p=np.divide(_EVENT_HOUR_WEIGHTS, sum(_EVENT_HOUR_WEIGHTS))) * 3600
+        + rng.integers(0, 60, size=total) * 60
+        + rng.integers(0, 60, size=total)
+    )
+    timestamps = event_day * 86_400 + seconds
+    platform = _choice(rng, _PLATFORMS, total, _PLATFORM_WEIGHTS)
+    page_url = _choice(rng, _PAGE_URLS, total)
+    page_url[rng.random(total) >= 0.7] = None
+
+    first = np.flatnonzero(np.r_[True, slot_key[1:] != slot_key[:-1]]) if total else np.empty(0, np.int64)
+    event_count = np.diff(np.r_[first, total])
+    session_ids = keys.take("sessions", len(first), rng)
+    if total:
+        session_start = np.minimum.reduceat(timestamps, first)
+        session_end = np.maximum.reduceat(timestamps, first)
+    else:
+        session_start = session_end = np.empty(0, np.int64)
+
+    events = pd.DataFrame({
+        "event_id": keys.take("events", total, rng),
+        "user_id": user_ids[owner],
+        "event_type": _choice(rng, cfg.event_types, total, _EVENT_TYPE_WEIGHTS),
+        "event_timestamp": timestamps.astype("datetime64[s]").astype("datetime64[ns]"),
+        "session_id": np.repeat(session_ids, event_count),
+        "platform": platform,
+        "page_url": page_url,
+    })
+    sessions = pd.DataFrame({
+        "user_id": user_ids[owner[first]],
+        "session_id": session_ids,
+        "session_start": session_start.astype("datetime64[s]").astype("datetime64[ns]"),
+        "session_end": session_end.astype("datetime64[s]").astype("datetime64[ns]"),
+        "event_count": event_count,
+        "platform": platform[first],
+        "duration_seconds": (session_end - session_start + rng.exponential(120, len(first))).astype(int),
+        "session_id_unique": session_ids,
+    })
+    return _encode(events, cfg), _encode(sessions, cfg)
+
+
+def write_events_parquet(
+    chunks: Iterable[tuple[pd.DataFrame, pd.DataFrame]], output: Path, cfg: GeneratorConfig,
+    part: str | None = None,
+) -> dict[str, int]:
+    """Stream event chunks and their sessions to Parquet without holding either table.
+
+    Without ``cfg.partition_output`` each dataset's chunks go into one file
+    (see :func:`_dataset_path`) through its own ``ParquetWriter``, one or
+    more row groups per chunk; with it, each chunk is written into the
+    month partitions. Returns the number of events and sessions written.
+    """
+    rows = {"events": 0, "sessions": 0}
+    writers = {}
+    try:
+        for i, frames in enumerate(chunks):
+            for name, chunk in zip(rows, frames):
+                if chunk.empty:
+                    continue
+                rows[name] += len(chunk)
+                if cfg.partition_output:
+                    _write_dataset(chunk, output, name, cfg, part=f"{part or 'part'}-{i:05d}")
+                    continue
+                if cfg.sort_output:
+                    chunk = chunk.sort_values(SORT_KEYS[name], kind="stable")
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if name not in writers:
+                    schema = pa.schema([
+                        f.with_type(pa.string()) if pa.types.is_null(f.type) else f
+                        for f in table.schema
+                    ]).remove_metadata()
+                    path = _dataset_path(output, name, part)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    writers[name] = pq.ParquetWriter(path, schema, compression=cfg.parquet_compression)
+                writer = writers[name]
+                writer.write_table(table.cast(writer.schema), row_group_size=cfg.row_group_size)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return rows
 
 
 # ---------------------------------------------------------------------------
 # Sessions
 # ---------------------------------------------------------------------------
 
-def generate_sessions(events_df: pd.DataFrame) -> pd.DataFrame:
+def generate_sessions(
+    events_df: pd.DataFrame, rng: np.random.Generator | None = None, keys: KeySpace | None = None,
+) -> pd.DataFrame:
     console.print("[bold blue]Generating sessions...[/]")
-    
-    sessions = events_df.groupby(["user_id", "session_id"]).agg(
+    return _aggregate_sessions(events_df, rng, keys)
+
+
+def _aggregate_sessions(
+    events_df: pd.DataFrame, rng: np.random.Generator | None = None, keys: KeySpace | None = None,
+) -> pd.DataFrame:
+    if events_df.empty:
+        return pd.DataFrame(columns=_SESSION_COLUMNS)
+    sessions = events_df.groupby(["user_id", "session_id"], observed=True).agg(
         session_start=("event_timestamp", "min"),
         session_end=("event_timestamp", "max"),
         event_count=("event_id", "count"),
         platform=("platform", "first"),
     ).reset_index()
     
+    exponential = rng.exponential if rng is not None else np.random.exponential
     sessions["duration_seconds"] = (
         (sessions["session_end"] - sessions["session_start"]).dt.total_seconds() + 
-        np.random.exponential(120, len(sessions))  # add reading time
+        exponential(120, len(sessions))  # add reading time
     ).astype(int)
-    sessions["session_id_unique"] = [_id() for _ in range(len(sessions))]
+    sessions["session_id_unique"] = (
+        (keys or KeySpace()).take("sessions", len(sessions), rng) if rng is not None
+        else [_id() for _ in range(len(sessions))]
+    )
     
     return sessions
 
@@ -327,16 +930,25 @@ def generate_sessions(events_df: pd.DataFrame) -> pd.DataFrame:
 # Marketing Touches
 # ---------------------------------------------------------------------------
 
-def generate_marketing(users_df: pd.DataFrame, cfg: GeneratorConfig) -> pd.DataFrame:
+_CAMPAIGNS = [
+    "spring_promo_2023", "summer_launch_2023", "black_friday_2023",
+    "new_year_2024", "product_hunt_launch", "webinar_series_q2",
+    "partner_referral_prog", "content_seo_push", "retargeting_q3",
+    "enterprise_outreach", "free_trial_campaign", "upgrade_nudge",
+]
+_TOUCH_TYPES = ["impression", "click", "email_open", "webinar_attend"]
+
+
+def generate_marketing(
+    users_df: pd.DataFrame, cfg: GeneratorConfig, rng: np.random.Generator | None = None,
+    keys: KeySpace | None = None,
+) -> pd.DataFrame:
     console.print("[bold blue]Generating marketing touches...[/]")
+    if cfg.columnar:
+        return _generate_marketing_vectorized(users_df, cfg, _rng(rng), _keys(cfg, keys))
+
     touches = []
-    
-    campaigns = [
-        "spring_promo_2023", "summer_launch_2023", "black_friday_2023",
-        "new_year_2024", "product_hunt_launch", "webinar_series_q2",
-        "partner_referral_prog", "content_seo_push", "retargeting_q3",
-        "enterprise_outreach", "free_trial_campaign", "upgrade_nudge",
-    ]
+    campaigns = _CAMPAIGNS
     
     for _, user in users_df.iterrows():
         signup = user["signup_date"]
@@ -350,7 +962,7 @@ def generate_marketing(users_df: pd.DataFrame, cfg: GeneratorConfig) -> pd.DataF
                 "campaign": random.choice(campaigns),
                 "channel": user["acquisition_channel"] if i == n_pre - 1 else random.choice(cfg.acquisition_channels),
                 "touch_timestamp": datetime.combine(touch_date, datetime.min.time().replace(hour=random.randint(8, 22))),
-                "touch_type": random.choice(["impression", "click", "email_open", "webinar_attend"]),
+                "touch_type": random.choice(_TOUCH_TYPES),
                 "is_converting_touch": i == n_pre - 1,
                 "cost": round(random.uniform(0.5, 15.0), 2) if "paid" in user["acquisition_channel"] else 0,
             })
@@ -358,6 +970,35 @@ def generate_marketing(users_df: pd.DataFrame, cfg: GeneratorConfig) -> pd.DataF
     return pd.DataFrame(touches)
 
 
+def _generate_marketing_vectorized(
+    users_df: pd.DataFrame, cfg: GeneratorConfig, rng: np.random.Generator, keys: KeySpace,
+) -> pd.DataFrame:
+    """Columnar pre-signup touches: 1-5 per user, the last one converting."""
+    n_pre = rng.integers(1, 6, size=len(users_df))
+    total = int(n_pre.sum())
+    owner = np.repeat(np.arange(len(users_df)), n_pre)
+    converting = np.arange(total) - np.repeat(np.cumsum(n_pre) - n_pre, n_pre) == n_pre[owner] - 1
+
+    signup = users_df["signup_date"].to_numpy().astype("datetime64[D]")[owner]
+    touch_ts = (signup - rng.integers(1, 61, size=total).astype("timedelta64[D]")).astype("datetime64[h]")
+    touch_ts = touch_ts + rng.integers(8, 23, size=total).astype("timedelta64[h]")
+
+    acquisition = users_df["acquisition_channel"].to_numpy()[owner]
+    paid = pd.Series(acquisition).str.contains("paid", regex=False).to_numpy()
+    cost = np.where(paid, np.round(rng.uniform(0.5, 15.0, size=total), 2), 0)
+
+    return _encode(pd.DataFrame({
+        "touch_id": keys.take("marketing_touches", total, rng),
+        "user_id": users_df["user_id"].to_numpy()[owner],
+        "campaign": _choice(rng, _CAMPAIGNS, total),
+        "channel": np.where(converting, acquisition, _choice(rng, cfg.acquisition_channels, total)),
+        "touch_timestamp": touch_ts.astype("datetime64[ns]"),
+        "touch_type": _choice(rng, _TOUCH_TYPES, total),
+        "is_converting_touch": converting,
+        "cost": cost,
+    }), cfg)
+
+
 # ---------------------------------------------------------------------------
 # Seeds (reference data)
 # ---------------------------------------------------------------------------
@@ -383,8 +1024,242 @@ def generate_seeds(cfg: GeneratorConfig) -> dict[str, pd.DataFrame]:
 # Main Generator
 # ---------------------------------------------------------------------------
 
-def run(cfg: GeneratorConfig | None = None) -> None:
+def _clear_dataset(output: Path, name: str) -> None:
+    """Remove a dataset's previous output in either single-file or sharded layout."""
+    (output / f"{name}.parquet").unlink(missing_ok=True)
+    shutil.rmtree(output / name, ignore_errors=True)
+
+
+def dataset_files(output: Path, name: str) -> list[Path]:
+    """All Parquet files of a dataset: the single file and/or its directory parts."""
+    files = [output / f"{name}.parquet"] if (output / f"{name}.parquet").exists() else []
+    return files + sorted((output / name).rglob("*.parquet"))
+
+
+def _dataset_path(output: Path, name: str, part: str | None = None) -> Path:
+    """``<name>.parquet``, or ``<name>/<part>.parquet`` for shard and append parts."""
+    return output / name / f"{part}.parquet" if part else output / f"{name}.parquet"
+
+
+def _write_dataset(
+    df: pd.DataFrame, output: Path, name: str, cfg: GeneratorConfig, part: str | None = None,
+) -> Path:
+    """Write a dataset, or one part of it, using the configured layout.
+
+    With ``cfg.partition_output`` the time-series datasets are Hive-partitioned
+    by month (``events/event_month=2024-03/part-0.parquet``) so DuckDB can
+    prune whole partitions; ``cfg.sort_output`` and ``cfg.row_group_size``
+    keep row-group min/max statistics tight for the rest.
+    """
+    if cfg.sort_output and name in SORT_KEYS:
+        df = df.sort_values(SORT_KEYS[name], kind="stable", ignore_index=True)
+    if cfg.partition_output and name in PARTITION_COLUMNS:
+        source, month = PARTITION_COLUMNS[name]
+        table = pa.Table.from_pandas(df, preserve_index=False).append_column(
+            month, pa.array(df[source].to_numpy().astype("datetime64[M]").astype(str)),
+        )
+        row_groups = {}
+        if cfg.row_group_size:
+            row_groups = {"max_rows_per_group": cfg.row_group_size, "min_rows_per_group": cfg.row_group_size}
+        ds.write_dataset(
+            table, output / name, format="parquet",
+            partitioning=ds.partitioning(pa.schema([(month, pa.string())]), flavor="hive"),
+            basename_template=f"{part or 'part'}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            file_options=ds.ParquetFileFormat().make_write_options(compression=cfg.parquet_compression),
+            **row_groups,
+        )
+        return output / name
+    path = _dataset_path(output, name, part)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(path, compression=cfg.parquet_compression, index=False, row_group_size=cfg.row_group_size)
+    return path
+
+
+def _write_generation(output: Path, cfg: GeneratorConfig) -> None:
+    """Record the generated window so append runs know where to resume."""
+    meta = {
+        "history_start": cfg.history_start.isoformat(),
+        "history_end": cfg.history_end.isoformat(),
+        "seed": cfg.seed,
+        "id_format": cfg.id_format,
+        "categorical": cfg.categorical,
+        "partition_output": cfg.partition_output,
+    }
+    (output / GENERATION_FILE).write_text(json.dumps(meta, indent=2))
+
+
+def _arrow(df: pd.DataFrame) -> pa.Table:
+    """Arrow view of a frame as DuckDB should store it.
+
+    Dictionary columns are decoded (``read_parquet`` yields VARCHAR for them
+    too) and all-null columns typed as strings; numeric and timestamp
+    columns convert without copying.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, f in enumerate(table.schema):
+        if pa.types.is_dictionary(f.type):
+            table = table.set_column(i, f.name, table.column(i).cast(f.type.value_type))
+        elif pa.types.is_null(f.type):
+            table = table.set_column(i, f.name, table.column(i).cast(pa.string()))
+    return table.replace_schema_metadata(None)
+
+
+def load_arrow(con: duckdb.DuckDBPyConnection, name: str, df: pd.DataFrame, replace: bool = True) -> None:
+    """Create (or with ``replace=False`` append to) table ``name`` from ``df`` via Arrow."""
+    con.register("_incoming", _arrow(df))
+    try:
+        if replace:
+            con.execute(f"CREATE OR REPLACE TABLE {name} AS SELECT * FROM _incoming")
+        else:
+            con.execute(f"INSERT INTO {name} BY NAME SELECT * FROM _incoming")
+    finally:
+        con.unregister("_incoming")
+
+
+def _load_chunks(
+    chunks: Iterable[tuple[pd.DataFrame, pd.DataFrame]], con: duckdb.DuckDBPyConnection,
+) -> Iterator[tuple[pd.DataFrame, pd.DataFrame]]:
+    """Pass event chunks through, inserting events and sessions into their tables on the way."""
+    first = {"events": True, "sessions": True}
+    for frames in chunks:
+        for name, df in zip(first, frames):
+            if not df.empty:
+                load_arrow(con, name, df, replace=first[name])
+                first[name] = False
+        yield frames
+
+
+def _run_single(
+    cfg: GeneratorConfig, output: Path, con: duckdb.DuckDBPyConnection | None = None,
+) -> dict[str, int]:
+    rng = np.random.default_rng(cfg.seed) if cfg.columnar else None
+    keys = KeySpace(cfg.id_format)
+    users = generate_users(cfg, rng, keys)
+    subs = generate_subscriptions(users, cfg, rng, keys)
+    payments = generate_payments(subs, cfg, rng, keys)
+    if cfg.stream_events:
+        console.print("[bold blue]Streaming events and sessions (this takes a moment)...[/]")
+        chunks = iter_event_chunks(users, subs, cfg, rng, keys)
+        if con is not None:
+            chunks = _load_chunks(chunks, con)
+        if cfg.write_parquet:
+            _clear_dataset(output, "events")
+            _clear_dataset(output, "sessions")
+            streamed = write_events_parquet(chunks, output, cfg)
+        else:
+            streamed = {"events": 0, "sessions": 0}
+            for events, sessions in chunks:
+                streamed["events"] += len(events)
+                streamed["sessions"] += len(sessions)
+    else:
+        events, sessions = generate_events_and_sessions(users, subs, cfg, rng, keys)
+    marketing = generate_marketing(users, cfg, rng, keys)
+    
+    # Write Parquet files
+    datasets = {
+        "users": users,
+        "subscriptions": subs,
+        "payments": payments,
+        "marketing_touches": marketing,
+    }
+    if not cfg.stream_events:
+        datasets["events"] = events
+        datasets["sessions"] = sessions
+    
+    console.print(f"\n[bold blue]Writing {'Parquet files' if cfg.write_parquet else 'DuckDB tables'}...[/]")
+    for name, df in datasets.items():
+        path = f"duckdb:{name}"
+        if cfg.write_parquet:
+            _clear_dataset(output, name)
+            path = _write_dataset(df, output, name, cfg)
+        if con is not None:
+            load_arrow(con, name, df)
+        console.print(f"  ✓ {name}: {len(df):>12,} rows → {path}")
+    counts = {name: len(df) for name, df in datasets.items()}
+    if cfg.stream_events:
+        for name, n in streamed.items():
+            path = f"duckdb:{name}"
+            if cfg.write_parquet:
+                path = output / name if cfg.partition_output else _dataset_path(output, name)
+            console.print(f"  ✓ {name}: {n:>12,} rows → {path}")
+        counts.update(streamed)
+    return counts
+
+
+def generate_shard(cfg: GeneratorConfig, shard: int, num_shards: int) -> dict[str, int]:
+    """Generate one shard of the user population and write its files.
+
+    Every random draw comes from the shard's own ``SeedSequence`` child, so a
+    shard's output depends only on ``cfg.seed``, the shard index and
+    ``num_shards`` — not on scheduling or on the other shards. Files are
+    written to ``<output_dir>/<dataset>/shard-NNNNN.parquet`` (or into the
+    dataset's month partitions).
+    """
+    seq = np.random.SeedSequence(cfg.seed).spawn(num_shards)[shard]
+    legacy_seed = int(seq.generate_state(1)[0])
+    Faker.seed(legacy_seed)
+    random.seed(legacy_seed)
+    np.random.seed(legacy_seed)
+    rng = np.random.default_rng(seq)
+    keys = KeySpace(cfg.id_format, shard)
+
+    num_users = cfg.num_users // num_shards + (shard < cfg.num_users % num_shards)
+    shard_cfg = replace(cfg, num_users=num_users, vectorized=True)
+    output = Path(cfg.output_dir)
+    part = f"shard-{shard:05d}"
+
+    users = generate_users(shard_cfg, rng, keys)
+    subs = generate_subscriptions(users, shard_cfg, rng, keys)
+    datasets = {
+        "users": users,
+        "subscriptions": subs,
+        "payments": generate_payments(subs, shard_cfg, rng, keys),
+    }
+    counts = {}
+    if cfg.stream_events:
+        counts.update(write_events_parquet(
+            iter_event_chunks(users, subs, shard_cfg, rng, keys), output, shard_cfg, part,
+        ))
+    else:
+        datasets["events"], datasets["sessions"] = generate_events_and_sessions(users, subs, shard_cfg, rng, keys)
+    datasets["marketing_touches"] = generate_marketing(users, shard_cfg, rng, keys)
+
+    for name, df in datasets.items():
+        _write_dataset(df, output, name, cfg, part)
+        counts[name] = len(df)
+    return counts
+
+
+def _run_sharded(cfg: GeneratorConfig, output: Path) -> dict[str, int]:
+    num_shards = cfg.workers
+    for name in DATASETS:
+        _clear_dataset(output, name)
+
+    counts = dict.fromkeys(DATASETS, 0)
+    with ProcessPoolExecutor(max_workers=cfg.workers) as pool:
+        futures = [pool.submit(generate_shard, cfg, shard, num_shards) for shard in range(num_shards)]
+        for future in futures:
+            for name, n in future.result().items():
+                counts[name] += n
+
+    console.print(f"\n[bold blue]Wrote {num_shards} shards per dataset[/]")
+    for name in DATASETS:
+        console.print(f"  ✓ {name}: {counts[name]:>12,} rows → {output / name}/")
+    return counts
+
+
+def run(cfg: GeneratorConfig | None = None, con: duckdb.DuckDBPyConnection | None = None) -> None:
+    """Generate every dataset; with ``con``, also load each one into DuckDB.
+
+    ``cfg.write_parquet=False`` (only valid with ``con``) skips the Parquet
+    files entirely.
+    """
     cfg = cfg or GeneratorConfig()
+    if con is None and not cfg.write_parquet:
+        raise ValueError("write_parquet=False needs a DuckDB connection to load into")
+    if con is not None and cfg.workers > 1:
+        raise ValueError("loading into DuckDB runs in one process; use workers=1 or load the shards afterwards")
     output = Path(cfg.output_dir)
     output.mkdir(parents=True, exist_ok=True)
     seed_dir = Path("dbt_metricflow/seeds")
@@ -393,42 +1268,218 @@ def run(cfg: GeneratorConfig | None = None) -> None:
     console.print("[bold green]━━━ MetricFlow Data Generator ━━━[/]")
     console.print(f"  Users: {cfg.num_users:,}")
     console.print(f"  Period: {cfg.history_start} → {cfg.history_end}")
+    if cfg.workers > 1:
+        console.print(f"  Workers: {cfg.workers} (seed {cfg.seed})")
     console.print()
     
     # Generate each dataset
-    users = generate_users(cfg)
-    subs = generate_subscriptions(users, cfg)
-    payments = generate_payments(subs, cfg)
-    events = generate_events(users, subs, cfg)
-    sessions = generate_sessions(events)
-    marketing = generate_marketing(users, cfg)
+    counts = _run_sharded(cfg, output) if cfg.workers > 1 else _run_single(cfg, output, con)
     seeds = generate_seeds(cfg)
     
-    # Write Parquet files
-    datasets = {
-        "users": users,
-        "subscriptions": subs,
-        "payments": payments,
-        "events": events,
-        "sessions": sessions,
-        "marketing_touches": marketing,
-    }
-    
-    console.print("\n[bold blue]Writing Parquet files...[/]")
-    for name, df in datasets.items():
-        path = output / f"{name}.parquet"
-        df.to_parquet(path, compression=cfg.parquet_compression, index=False)
-        console.print(f"  ✓ {name}: {len(df):>12,} rows → {path}")
-    
     # Write seed CSVs
     for name, df in seeds.items():
         path = seed_dir / f"{name}.csv"
         df.to_csv(path, index=False)
         console.print(f"  ✓ seed/{name}: {len(df)} rows → {path}")
     
-    total = sum(len(df) for df in datasets.values())
-    console.print(f"\n[bold green]✅ Generated {total:,} total rows across {len(datasets)} datasets[/]")
+    if cfg.write_parquet:
+        _write_generation(output, cfg)
+    total = sum(counts.values())
+    console.print(f"\n[bold green]✅ Generated {total:,} total rows across {len(counts)} datasets[/]")
+
+
+def generate_and_load(cfg: GeneratorConfig | None = None, db_path: str = DB_PATH) -> None:
+    """Generate and register every dataset in ``db_path`` straight from Arrow.
+
+    Replaces ``run`` followed by ``scripts/load_to_duckdb.py``: tables are
+    created from the in-memory Arrow data, so nothing is encoded to Parquet
+    and read back unless ``cfg.write_parquet`` asks for the files as well.
+    """
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect(db_path)
+    try:
+        run(cfg, con)
+    finally:
+        con.close()
+    console.print(f"[bold green]✅ Loaded into {db_path}[/]")
+
+
+# ---------------------------------------------------------------------------
+# Incremental append
+# ---------------------------------------------------------------------------
+
+def _last_key(files: list[Path], column: str, id_format: str) -> int:
+    last = pc.max(pq.read_table([str(f) for f in files], columns=[column])[column]).as_py()
+    if last is None:
+        return 0
+    return int(last, 16) if id_format == "hex" else int(last)
+
+
+def append(cfg: GeneratorConfig) -> dict[str, int]:
+    """Extend existing output in ``cfg.output_dir`` up to ``cfg.history_end``.
+
+    Open subscriptions resume from where the previous window stopped: their
+    remaining duration is drawn conditioned on having lasted until the old
+    end date. Only new signups and the new window's payments, events,
+    sessions and marketing touches are generated; they are written as
+    ``<dataset>/append-YYYYMMDD.parquet`` (or month partitions) next to the existing files. The
+    subscriptions table is rewritten, since resumed rows change state.
+    """
+    output = Path(cfg.output_dir)
+    meta_path = output / GENERATION_FILE
+    if not meta_path.exists():
+        raise FileNotFoundError(f"{meta_path} not found; run a full generation first")
+    meta = json.loads(meta_path.read_text())
+    prev_end = date.fromisoformat(meta["history_end"])
+    if cfg.history_end <= prev_end:
+        console.print(f"[yellow]Output already covers {prev_end}; nothing to append[/]")
+        return {}
+    cfg = replace(
+        cfg, history_start=date.fromisoformat(meta["history_start"]), vectorized=True,
+        id_format=meta["id_format"], categorical=meta["categorical"],
+        partition_output=meta.get("partition_output", False),
+    )
+    console.print("[bold green]━━━ MetricFlow Data Generator (append) ━━━[/]")
+    console.print(f"  Window: {prev_end} → {cfg.history_end}")
+    console.print()
+
+    rng = np.random.default_rng([cfg.seed, prev_end.toordinal()])
+    keys = KeySpace(cfg.id_format)
+    if cfg.id_format != "uuid":
+        for name, column in ID_COLUMNS.items():
+            files = dataset_files(output, name)
+            if files:
+                keys.resume(name, _last_key(files, column, cfg.id_format))
+
+    # New signups at the historical rate for the new days
+    n_existing = sum(pq.ParquetFile(f).metadata.num_rows for f in dataset_files(output, "users"))
+    old_weight = _signup_weights(_signup_days(replace(cfg, history_end=prev_end)), cfg.history_start).sum()
+    new_weight = _signup_weights(_signup_days(cfg, since=prev_end), cfg.history_start).sum()
+    console.print("[bold blue]Generating users...[/]")
+    users = _generate_users_vectorized(
+        cfg, rng, keys, n=int(rng.poisson(n_existing * new_weight / old_weight)), since=prev_end,
+    )
+
+    # Resume open subscriptions, then start new users' subscriptions
+    console.print("[bold blue]Generating subscriptions...[/]")
+    subs = pq.read_table([str(f) for f in dataset_files(output, "subscriptions")]).to_pandas()
+    is_open = (subs["change_type"].astype(object) == "active").to_numpy()
+    carried = subs[is_open]
+    plan_index = {p: i for i, p in enumerate(_PLAN_ORDER)}
+    start = carried["started_at"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    cutoff = np.datetime64(prev_end, "D").astype(np.int64)
+    owner, steps, plan, start, end, change, monthly = _subscription_passes(
+        np.arange(len(carried)), carried["plan"].astype(object).map(plan_index).to_numpy(dtype=np.int64),
+        start, cfg, rng, min_months=np.maximum(1, -((start - cutoff) // 30)),
+    )
+    resumed = steps == 0
+    ids = np.empty(len(owner), dtype=object)
+    ids[resumed] = carried["subscription_id"].to_numpy()[owner[resumed]]
+    ids[~resumed] = keys.take("subscriptions", int((~resumed).sum()), rng)
+    monthly[resumed] = (carried["billing_interval"].astype(object).to_numpy() == "monthly")[owner[resumed]]
+    changed = pd.concat([
+        _subscriptions_frame(
+            ids.astype(subs["subscription_id"].dtype), carried["user_id"].to_numpy()[owner],
+            plan, start, end, change, monthly, cfg,
+        ),
+        _generate_subscriptions_vectorized(users, cfg, rng, keys),
+    ], ignore_index=True)
+
+    console.print("[bold blue]Generating payments...[/]")
+    datasets = {
+        "users": users,
+        "payments": _generate_payments_vectorized(changed, cfg, rng, keys, since=prev_end),
+    }
+    console.print("[bold blue]Streaming events (this takes a moment)...[/]")
+    part = f"append-{cfg.history_end:%Y%m%d}"
+    counts = write_events_parquet(
+        iter_event_chunks(pd.DataFrame({"user_id": changed["user_id"].unique()}), changed, cfg, rng, keys,
+                          since=prev_end),
+        output, cfg, part,
+    )
+    console.print("[bold blue]Generating marketing touches...[/]")
+    datasets["marketing_touches"] = _generate_marketing_vectorized(users, cfg, rng, keys)
+
+    console.print("\n[bold blue]Writing Parquet files...[/]")
+    for name, df in datasets.items():
+        _write_dataset(df, output, name, cfg, part)
+        counts[name] = len(df)
+    subscriptions = pd.concat([subs[~is_open], changed], ignore_index=True)
+    staged = _write_dataset(subscriptions, output / ".staging", "subscriptions", cfg)
+    _clear_dataset(output, "subscriptions")
+    staged.rename(output / "subscriptions.parquet")
+    staged.parent.rmdir()
+    counts["subscriptions"] = len(changed)
+
+    for name in DATASETS:
+        console.print(f"  ✓ {name}: {counts[name]:>12,} new or resumed rows")
+    _write_generation(output, cfg)
+    console.print(f"\n[bold green]✅ Appended {sum(counts.values()):,} rows through {cfg.history_end}[/]")
+    return counts
+
+
+def parse_args(argv: list[str] | None = None) -> tuple[GeneratorConfig, argparse.Namespace]:
+    """The ``GeneratorConfig`` a command line resolves to, plus the raw arguments."""
+    parser = argparse.ArgumentParser(description="Generate synthetic MetricFlow data.")
+    parser.add_argument("--num-users", type=int, help="number of users to generate")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="generate N shards in N processes (implies --vectorized)")
+    parser.add_argument("--seed", type=int, default=42, help="seed for the columnar and sharded engines")
+    parser.add_argument("--vectorized", action="store_true", help="use the columnar NumPy engine")
+    parser.add_argument("--stream-events", action="store_true", help="write events in bounded-memory chunks")
+    parser.add_argument("--events-chunk-users", type=int,
+                        help="users per streamed events chunk (with --stream-events)")
+    parser.add_argument("--id-format", choices=["uuid", "int", "hex"], default="uuid",
+                        help="row identifiers: random hex, sequential int64, or sequential hex")
+    parser.add_argument("--categorical", action="store_true",
+                        help="dictionary-encode low-cardinality string columns")
+    parser.add_argument("--partition", action="store_true",
+                        help="Hive-partition events, sessions, payments and touches by month")
+    parser.add_argument("--row-group-size", type=int, help="rows per Parquet row group")
+    parser.add_argument("--sort", action="store_true", help="sort rows by user_id and time within files")
+    parser.add_argument("--output-dir", help="directory for Parquet output")
+    parser.add_argument("--duckdb", nargs="?", const=DB_PATH, metavar="PATH",
+                        help=f"also load every table straight into DuckDB (default {DB_PATH})")
+    parser.add_argument("--no-parquet", action="store_true", help="with --duckdb, skip writing Parquet files")
+    parser.add_argument("--history-end", type=date.fromisoformat, help="last day to generate (YYYY-MM-DD)")
+    parser.add_argument("--append", action="store_true",
+                        help="extend existing output up to --history-end instead of regenerating")
+    args = parser.parse_args(argv)
+    if args.no_parquet and not args.duckdb:
+        parser.error("--no-parquet requires --duckdb")
+
+    overrides = {
+        "workers": args.workers,
+        "seed": args.seed,
+        "vectorized": args.vectorized,
+        "stream_events": args.stream_events,
+        "id_format": args.id_format,
+        "categorical": args.categorical,
+        "partition_output": args.partition,
+        "row_group_size": args.row_group_size,
+        "sort_output": args.sort,
+        "write_parquet": not args.no_parquet,
+    }
+    if args.num_users is not None:
+        overrides["num_users"] = args.num_users
+    if args.events_chunk_users is not None:
+        overrides["events_chunk_users"] = args.events_chunk_users
+    if args.output_dir is not None:
+        overrides["output_dir"] = args.output_dir
+    if args.history_end is not None:
+        overrides["history_end"] = args.history_end
+    return GeneratorConfig(**overrides), args
+
+
+def main(argv: list[str] | None = None) -> None:
+    cfg, args = parse_args(argv)
+    if args.append:
+        append(cfg)
+    elif args.duckdb:
+        generate_and_load(cfg, args.duckdb)
+    else:
+        run(cfg)
 
 
 if __name__ == "__main__":
-    run()
+    main()
@@ -1,68 +1,328 @@
-"""MetricFlow — Revenue Anomaly Detection using Isolation Forest."""
+"""MetricFlow — Revenue Anomaly Detection using Isolation Forest.
+
+A full run refits the scaler and model on all history and rewrites
+``ml_outputs.revenue_anomalies``. Between scheduled refits, incremental
+runs reuse the latest model in the model registry and score only the days
+after the last scored one, so a daily run costs the same however long the
+history is.
+:func:`run_series` scores one series per plan, country and channel
+combination in a single batched pass.
+"""
 
 from __future__ import annotations
+
+import argparse
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
 from pathlib import Path
-import duckdb
+
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 
+from ml_pipeline import registry
+from ml_pipeline.db import connect, output_connection
+from ml_pipeline.features import load_query, to_frame
+
 DB_PATH = "data/metricflow.duckdb"
 OUTPUT_DIR = Path("ml_pipeline/outputs")
 
+REFIT_DAYS = 7  # incremental runs fall back to a full refit once the model is this old
+WARMUP_ROWS = 7  # prior days needed to rebuild the 7-day rolling features
+FEATURES = ["daily_revenue", "unique_payers", "transaction_count"]
+REVENUE_COLUMNS = ["payment_date", "recognized_mrr", "user_id", "payment_status"]  # read by DAILY_SQL
+DAILY_SQL = """
+    SELECT payment_date, sum(recognized_mrr) as daily_revenue,
+           count(distinct user_id) as unique_payers, count(*) as transaction_count
+    FROM intermediate.int_revenue_normalized
+    WHERE payment_status = 'succeeded'{since}
+    GROUP BY 1 ORDER BY 1
+"""
 
-def run() -> dict:
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    print("🚨 Revenue Anomaly Detection Pipeline")
 
-    con = duckdb.connect(DB_PATH, read_only=True)
-    df = con.execute("""
-        SELECT payment_date, sum(recognized_mrr) as daily_revenue,
-               count(distinct user_id) as unique_payers, count(*) as transaction_count
-        FROM intermediate.int_revenue_normalized
-        WHERE payment_status = 'succeeded'
-        GROUP BY 1 ORDER BY 1
-    """).fetchdf()
-    con.close()
-
-    features = ["daily_revenue", "unique_payers", "transaction_count"]
-    # Add rolling features
-    for col in features:
+def add_features(df: pd.DataFrame) -> list[str]:
+    """Add rolling and pct-change features in place; returns the model's columns."""
+    for col in FEATURES:
         df[f"{col}_rolling_7d"] = df[col].rolling(7, min_periods=1).mean()
         df[f"{col}_pct_change"] = df[col].pct_change().fillna(0)
+    return FEATURES + [f"{c}_rolling_7d" for c in FEATURES] + [f"{c}_pct_change" for c in FEATURES]
 
-    feature_cols = features + [f"{c}_rolling_7d" for c in features] + [f"{c}_pct_change" for c in features]
-    X = df[feature_cols].fillna(0)
 
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+def scoring_state() -> tuple[pd.Timestamp, pd.Timestamp] | None:
+    """(last scored date, first warm-up date) from ml_outputs, or None if nothing is scored."""
+    con = connect(DB_PATH, read_only=True)
+    try:
+        exists = con.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE schema_name = 'ml_outputs' AND table_name = 'revenue_anomalies'"
+        ).fetchone()[0]
+        if not exists:
+            return None
+        last, warmup = con.execute(f"""
+            SELECT max(payment_date), min(payment_date) FROM (
+                SELECT payment_date FROM ml_outputs.revenue_anomalies ORDER BY payment_date DESC LIMIT {WARMUP_ROWS}
+            )
+        """).fetchone()
+    finally:
+        con.close()
+    return None if last is None else (pd.Timestamp(last), pd.Timestamp(warmup))
+
 
-    model = IsolationForest(contamination=0.03, random_state=42, n_estimators=200)
+def _full(df: pd.DataFrame, feature_cols: list[str], retrain: bool = False) -> pd.DataFrame:
+    """Refit scaler and model on every day, register them, and score all days.
+
+    A scaler and model already fitted on the same revenue history are
+    loaded from the model registry instead, unless ``retrain`` is set;
+    they keep the ``fitted_on`` date of the run that fitted them.
+    """
+    X = df[feature_cols].fillna(0)
+    cached = registry.entry(
+        __file__, ["intermediate.int_revenue_normalized"], {}, columns=REVENUE_COLUMNS, db_path=DB_PATH,
+    )
+    loaded = None if retrain else cached.load()
+    if loaded:
+        saved, _ = loaded
+        scaler, model = saved["scaler"], saved["model"]
+        X_scaled = scaler.transform(X)
+    else:
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
+        model = IsolationForest(contamination=0.03, random_state=42, n_estimators=200).fit(X_scaled)
+        cached.save({"scaler": scaler, "model": model, "fitted_on": date.today()}, {"days": len(X)})
     df["anomaly_score"] = model.decision_function(X_scaled)
     df["is_anomaly"] = model.predict(X_scaled) == -1
+    return df
 
-    n_anomalies = df["is_anomaly"].sum()
+
+def run(mode: str = "auto", refit_days: int = REFIT_DAYS, retrain: bool = False) -> dict:
+    """Score revenue days; ``mode`` is "full", "incremental" or "auto".
+
+    "auto" runs incrementally while the latest registered model was fitted
+    less than ``refit_days`` ago and earlier scores exist, and refits
+    otherwise.
+    ``retrain`` forces a full refit that bypasses the model registry.
+    """
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    print("🚨 Revenue Anomaly Detection Pipeline")
+
+    latest = registry.latest(__file__)
+    saved = latest.load()[0] if latest is not None else None
+    state = scoring_state() if saved is not None else None
+    if mode == "auto" and retrain:
+        mode = "full"
+    if mode == "auto":
+        fresh = saved is not None and (date.today() - saved["fitted_on"]).days < refit_days
+        mode = "incremental" if fresh and state is not None else "full"
+    if mode == "incremental" and state is None:
+        raise ValueError("incremental mode needs a saved model and existing ml_outputs.revenue_anomalies")
+
+    if mode == "full":
+        df = to_frame(load_query(
+            DAILY_SQL.format(since=""),
+            ["intermediate.int_revenue_normalized"],
+            columns=REVENUE_COLUMNS,
+            db_path=DB_PATH,
+        ))
+        df = _full(df, add_features(df), retrain)
+    else:
+        last_scored, warmup_start = state
+        # Only the warm-up days and anything newer; no fingerprint scan of all history
+        df = to_frame(load_query(
+            DAILY_SQL.format(since=f"\n      AND payment_date >= DATE '{warmup_start.date()}'"),
+            ["intermediate.int_revenue_normalized"],
+            db_path=DB_PATH,
+            cache_dir=None,
+        ))
+        feature_cols = add_features(df)
+        df = df[df["payment_date"] > last_scored].copy()
+        if len(df):
+            X_scaled = saved["scaler"].transform(df[feature_cols].fillna(0))
+            df["anomaly_score"] = saved["model"].decision_function(X_scaled)
+            df["is_anomaly"] = saved["model"].predict(X_scaled) == -1
+
+    n_anomalies = int(df["is_anomaly"].sum()) if len(df) else 0
     metrics = {
+        "mode": mode,
         "total_days": len(df),
-        "anomalies_detected": int(n_anomalies),
-        "anomaly_rate": round(n_anomalies / len(df), 4),
+        "anomalies_detected": n_anomalies,
+        "anomaly_rate": round(n_anomalies / len(df), 4) if len(df) else 0.0,
     }
 
     # Save
-    con = duckdb.connect(DB_PATH)
-    con.execute("CREATE SCHEMA IF NOT EXISTS ml_outputs")
-    con.execute("DROP TABLE IF EXISTS ml_outputs.revenue_anomalies")
-    con.execute("CREATE TABLE ml_outputs.revenue_anomalies AS SELECT payment_date, daily_revenue, anomaly_score, is_anomaly FROM df")
-    con.close()
+    columns = "payment_date, daily_revenue, anomaly_score, is_anomaly"
+    with output_connection(DB_PATH) as con:
+        if mode == "full":
+            con.execute("DROP TABLE IF EXISTS ml_outputs.revenue_anomalies")
+            con.execute(f"CREATE TABLE ml_outputs.revenue_anomalies AS SELECT {columns} FROM df")
+        elif len(df):
+            con.execute(f"INSERT INTO ml_outputs.revenue_anomalies SELECT {columns} FROM df")
 
-    print(f"  ✓ {n_anomalies} anomalies detected out of {len(df)} days")
+    print(f"  ✓ {n_anomalies} anomalies detected out of {len(df)} days ({mode})")
     with open(OUTPUT_DIR / "anomaly_metrics.json", "w") as f:
         json.dump(metrics, f, indent=2)
     print("  ✅ Anomalies saved")
     return metrics
 
 
+# Series dimensions and where each comes from; payments carry the plan, users the rest
+DIMENSIONS = {"plan_name": "r.plan_name", "country": "u.country", "acquisition_channel": "u.acquisition_channel"}
+MIN_SERIES_DAYS = 30  # per-series models skip series with less history than this
+SERIES_SQL = """
+    WITH daily AS (
+        SELECT {dims}, r.payment_date,
+               sum(r.recognized_mrr) AS daily_revenue,
+               count(DISTINCT r.user_id) AS unique_payers, count(*) AS transaction_count
+        FROM intermediate.int_revenue_normalized r
+        LEFT JOIN marts.dim_users u ON r.user_id = u.user_id
+        WHERE r.payment_status = 'succeeded'
+        GROUP BY ALL
+    ),
+    spans AS (SELECT {names}, min(payment_date) AS first_day FROM daily GROUP BY ALL),
+    days AS (SELECT DISTINCT payment_date FROM daily)
+    -- Dense calendar per series: days without payments are zeros, not gaps
+    SELECT concat_ws('|', {span_names}) AS series_id, {span_names}, d.payment_date,
+           coalesce(daily.daily_revenue, 0) AS daily_revenue,
+           coalesce(daily.unique_payers, 0) AS unique_payers,
+           coalesce(daily.transaction_count, 0) AS transaction_count
+    FROM spans s
+    JOIN days d ON d.payment_date >= s.first_day
+    LEFT JOIN daily USING ({names}, payment_date)
+    ORDER BY {span_names}, d.payment_date
+"""
+
+
+def series_features(df: pd.DataFrame, starts: np.ndarray) -> np.ndarray:
+    """Rolling and pct-change features for every series in one vectorized pass.
+
+    ``df`` is sorted by series then date and ``starts`` holds each series'
+    first row. Features match :func:`add_features` within a series, except
+    that a change from a zero day counts as 0 rather than infinity, since
+    sparse series have many zero days.
+    """
+    n = len(df)
+    lengths = np.diff(np.r_[starts, n])
+    pos = np.arange(n) - np.repeat(starts, lengths)  # row index within its series
+    window = np.minimum(pos + 1, 7)
+    rows = np.arange(n)
+    out = []
+    rolling, pct = [], []
+    for col in FEATURES:
+        x = df[col].to_numpy(dtype=np.float64)
+        out.append(x)
+        cs = np.cumsum(x)
+        before = rows - window
+        rolling.append((cs - np.where(before >= 0, cs[np.maximum(before, 0)], 0.0)) / window)
+        prev = np.where(pos > 0, x[np.maximum(rows - 1, 0)], 0.0)
+        pct.append(np.divide(x, prev, out=np.ones(n), where=prev != 0) - 1)
+    return np.column_stack(out + rolling + pct)
+
+
+def standardize_by_series(X: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Z-score every column within its series, so large and small series are comparable."""
+    lengths = np.diff(np.r_[starts, len(X)])[:, None]
+    mean = np.add.reduceat(X, starts, axis=0) / lengths
+    std = np.sqrt(np.maximum(np.add.reduceat(X * X, starts, axis=0) / lengths - mean ** 2, 0))
+    std[std == 0] = 1.0
+    return (X - np.repeat(mean, lengths[:, 0], axis=0)) / np.repeat(std, lengths[:, 0], axis=0)
+
+
+def _score_series_chunk(blocks: list[np.ndarray]) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Fit and score one IsolationForest per series block (runs in a worker process)."""
+    results = []
+    for X in blocks:
+        model = IsolationForest(contamination=0.03, random_state=42, n_estimators=100).fit(X)
+        score = model.decision_function(X)
+        results.append((score, score < 0))  # what predict() flags, without scoring twice
+    return results
+
+
+def run_series(
+    dimensions: tuple[str, ...] = tuple(DIMENSIONS), model: str = "shared", workers: int | None = None,
+) -> dict:
+    """Detect anomalies in the daily revenue of every ``dimensions`` combination.
+
+    ``model="shared"`` fits one forest over all series' per-series
+    standardized features, its trees built in parallel. ``model="per_series"``
+    fits one forest per series with at least MIN_SERIES_DAYS days, batched
+    across a process pool. Writes ``ml_outputs.revenue_anomalies_by_series``
+    in long format, one row per series and day.
+    """
+    unknown = set(dimensions) - set(DIMENSIONS)
+    if unknown or not dimensions:
+        raise ValueError(f"dimensions must be a non-empty subset of {list(DIMENSIONS)}, got {dimensions}")
+    if model not in ("shared", "per_series"):
+        raise ValueError(f"model must be 'shared' or 'per_series', got {model!r}")
+    workers = workers or int(os.environ.get("OMP_NUM_THREADS") or os.cpu_count() or 1)
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    print(f"🚨 Revenue Anomaly Detection by {', '.join(dimensions)}")
+
+    sql = SERIES_SQL.format(
+        dims=", ".join(f"coalesce({DIMENSIONS[d]}, 'unknown') AS {d}" for d in dimensions),
+        names=", ".join(dimensions),
+        span_names=", ".join(f"s.{d}" for d in dimensions),
+    )
+    df = to_frame(load_query(sql, ["intermediate.int_revenue_normalized", "marts.dim_users"], db_path=DB_PATH))
+    key = df["series_id"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    print(f"  {len(starts):,} series | {len(df):,} series-days")
+
+    X = standardize_by_series(series_features(df, starts), starts)
+    df["anomaly_score"] = np.nan
+    df["is_anomaly"] = False
+    if model == "shared":
+        forest = IsolationForest(contamination=0.03, random_state=42, n_estimators=200, n_jobs=workers).fit(X)
+        df["anomaly_score"] = forest.decision_function(X)
+        df["is_anomaly"] = df["anomaly_score"] < 0  # what predict() flags, without scoring twice
+    else:
+        ends = np.r_[starts[1:], len(df)]
+        keep = [(a, b) for a, b in zip(starts, ends) if b - a >= MIN_SERIES_DAYS]
+        chunks = [list(c) for c in np.array_split(np.array(keep, dtype=np.int64), max(1, workers * 4)) if len(c)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            scored = pool.map(_score_series_chunk, [[X[a:b] for a, b in chunk] for chunk in chunks])
+            for chunk, results in zip(chunks, scored):
+                for (a, b), (score, flag) in zip(chunk, results):
+                    df.iloc[a:b, df.columns.get_loc("anomaly_score")] = score
+                    df.iloc[a:b, df.columns.get_loc("is_anomaly")] = flag
+        df = df[df["anomaly_score"].notna()]
+
+    n_anomalies = int(df["is_anomaly"].sum())
+    metrics = {
+        "dimensions": dimensions,
+        "model": model,
+        "series": int(df["series_id"].nunique()),
+        "series_days": len(df),
+        "anomalies_detected": n_anomalies,
+        "anomaly_rate": round(n_anomalies / len(df), 4) if len(df) else 0.0,
+    }
+
+    columns = ", ".join(["series_id", *dimensions, "payment_date", *FEATURES, "anomaly_score", "is_anomaly"])
+    with output_connection(DB_PATH) as con:
+        con.execute("DROP TABLE IF EXISTS ml_outputs.revenue_anomalies_by_series")
+        con.execute(f"CREATE TABLE ml_outputs.revenue_anomalies_by_series AS SELECT {columns} FROM df")
+
+    print(f"  ✓ {n_anomalies:,} anomalies across {metrics['series']:,} series ({model} model)")
+    with open(OUTPUT_DIR / "anomaly_series_metrics.json", "w") as f:
+        json.dump(metrics, f, indent=2)
+    print("  ✅ Series anomalies saved")
+    return metrics
+
+
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Detect revenue anomalies.")
+    parser.add_argument("--mode", choices=["auto", "full", "incremental"], default="auto")
+    parser.add_argument("--refit-days", type=int, default=REFIT_DAYS,
+                        help="in auto mode, refit once the saved model is this many days old")
+    parser.add_argument("--retrain", action="store_true",
+                        help="refit even if the registry has a model for the same history (implies a full run)")
+    parser.add_argument("--by", nargs="+", choices=list(DIMENSIONS), metavar="DIMENSION",
+                        help=f"score one series per combination of these instead ({', '.join(DIMENSIONS)})")
+    parser.add_argument("--model", choices=["shared", "per_series"], default="shared",
+                        help="with --by: one forest for all series, or one per series")
+    parser.add_argument("--workers", type=int, help="with --by: parallel trees or processes")
+    args = parser.parse_args()
+    if args.by:
+        run_series(args.by, args.model, args.workers)
+    else:
+        run(args.mode, args.refit_days, args.retrain)
@@ -6,128 +6,220 @@ Reads feature table from DuckDB, trains model, writes predictions back.
 
 from __future__ import annotations
 
+import argparse
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import duckdb
 import numpy as np
 import pandas as pd
-from sklearn.metrics import (
-    classification_report, roc_auc_score, precision_recall_curve, average_precision_score,
-)
-from sklearn.model_selection import StratifiedKFold, cross_val_score
-from sklearn.preprocessing import LabelEncoder
+import pyarrow as pa
+from sklearn.metrics import average_precision_score, roc_auc_score
+from sklearn.model_selection import StratifiedKFold
 from xgboost import XGBClassifier
 
+from ml_pipeline import registry
+from ml_pipeline.db import output_connection
+from ml_pipeline.features import load_columns, to_numpy
+
 DB_PATH = "data/metricflow.duckdb"
 OUTPUT_DIR = Path("ml_pipeline/outputs")
 
+FEATURE_COLS = [
+    "days_inactive", "total_events", "total_active_days", "active_weeks",
+    "health_score", "sessions_last_30d", "events_last_14d",
+    "unique_events_14d", "support_tickets_14d",
+    "subscription_changes", "downgrades",
+]
+COLUMNS = ["user_id", *FEATURE_COLS, "is_churned"]
+TRAIN_PARAMS = {"n_splits": 5, "early_stopping_rounds": 30}
 
-def load_features() -> pd.DataFrame:
-    """Load churn feature table from DuckDB."""
-    con = duckdb.connect(DB_PATH, read_only=True)
-    df = con.execute("SELECT * FROM advanced.churn_features").fetchdf()
-    con.close()
-    return df
 
+def load_features() -> pa.Table:
+    """Load the churn model's columns from DuckDB (cached while the table is unchanged)."""
+    return load_columns("advanced.churn_features", COLUMNS, db_path=DB_PATH)
 
-def prepare_data(df: pd.DataFrame) -> tuple:
-    """Prepare features and target."""
-    feature_cols = [
-        "days_inactive", "total_events", "total_active_days", "active_weeks",
-        "health_score", "sessions_last_30d", "events_last_14d",
-        "unique_events_14d", "support_tickets_14d",
-        "subscription_changes", "downgrades",
-    ]
 
-    X = df[feature_cols].fillna(0)
-    y = df["is_churned"].astype(int)
+def prepare_data(features: pa.Table) -> tuple:
+    """Prepare features and target."""
+    X = pd.DataFrame(to_numpy(features, FEATURE_COLS), columns=FEATURE_COLS)
+    y = pd.Series(to_numpy(features, ["is_churned"])[:, 0].astype(int), name="is_churned")
 
-    return X, y, feature_cols
+    return X, y, list(FEATURE_COLS)
 
 
-def train_model(X: pd.DataFrame, y: pd.Series) -> tuple:
-    """Train XGBoost with cross-validation."""
+def _fit_fold(X: pd.DataFrame, y: pd.Series, train_idx: np.ndarray, valid_idx: np.ndarray,
+              n_jobs: int, early_stopping_rounds: int) -> tuple:
+    """Fit one fold's model, stopping on its validation split; returns it and the split's probabilities."""
+    y_train = y.iloc[train_idx]
     model = XGBClassifier(
-        n_estimators=200,
+        n_estimators=1000,
         max_depth=5,
         learning_rate=0.05,
         subsample=0.8,
         colsample_bytree=0.8,
-        scale_pos_weight=len(y[y == 0]) / max(len(y[y == 1]), 1),
+        scale_pos_weight=len(y_train[y_train == 0]) / max(len(y_train[y_train == 1]), 1),
+        tree_method="hist",
         eval_metric="aucpr",
+        early_stopping_rounds=early_stopping_rounds,
+        n_jobs=n_jobs,
         random_state=42,
-        use_label_encoder=False,
     )
-
-    # Cross-validation
-    cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
-    cv_scores = cross_val_score(model, X, y, cv=cv, scoring="roc_auc")
-
-    # Fit on full data
-    model.fit(X, y)
-    y_proba = model.predict_proba(X)[:, 1]
-
+    X_valid = X.iloc[valid_idx]
+    model.fit(X.iloc[train_idx], y_train, eval_set=[(X_valid, y.iloc[valid_idx])], verbose=False)
+    return model, model.predict_proba(X_valid, iteration_range=(0, model.best_iteration + 1))[:, 1]
+
+
+def _folds(X: pd.DataFrame, y: pd.Series, n_splits: int) -> list:
+    return list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42).split(X, y))
+
+
+def train_model(
+    X: pd.DataFrame,
+    y: pd.Series,
+    n_splits: int = 5,
+    n_jobs: int | None = None,
+    early_stopping_rounds: int = 30,
+) -> tuple:
+    """Train one XGBoost model per stratified fold, in parallel, and score out of fold.
+
+    Every user is scored by the fold model that did not see them, so the
+    returned probabilities and metrics are honest and no full-data refit
+    is needed. Each fold stops boosting once its validation split's
+    average precision stops improving. ``n_jobs`` (default: the
+    ``OMP_NUM_THREADS`` budget set by run_all, else all cores) is shared
+    across the folds trained at once. Returns the fold models, metrics
+    and out-of-fold probabilities.
+    """
+    if y.nunique() < 2:
+        raise ValueError("churn labels contain a single class; cannot train a classifier")
+    n_jobs = n_jobs or int(os.environ.get("OMP_NUM_THREADS") or os.cpu_count() or 1)
+    workers = min(n_splits, n_jobs)
+    folds = _folds(X, y, n_splits)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # XGBoost releases the GIL while boosting, so threads train folds concurrently
+        fitted = list(pool.map(
+            lambda fold: _fit_fold(X, y, *fold, max(1, n_jobs // workers), early_stopping_rounds), folds,
+        ))
+
+    y_proba = np.empty(len(y))
+    fold_auc = []
+    for (_, valid_idx), (_, proba) in zip(folds, fitted):
+        y_proba[valid_idx] = proba
+        fold_auc.append(roc_auc_score(y.iloc[valid_idx], proba))
+
+    models = [model for model, _ in fitted]
     metrics = {
-        "cv_auc_mean": round(float(np.mean(cv_scores)), 4),
-        "cv_auc_std": round(float(np.std(cv_scores)), 4),
-        "train_auc": round(float(roc_auc_score(y, y_proba)), 4),
+        "cv_auc_mean": round(float(np.mean(fold_auc)), 4),
+        "cv_auc_std": round(float(np.std(fold_auc)), 4),
+        "oof_auc": round(float(roc_auc_score(y, y_proba)), 4),
         "avg_precision": round(float(average_precision_score(y, y_proba)), 4),
+        "best_iterations": [int(model.best_iteration) + 1 for model in models],
     }
 
-    return model, metrics, y_proba
-
-
-def compute_feature_importance(model, feature_cols: list) -> pd.DataFrame:
-    """Get feature importance from the model."""
+    return models, metrics, y_proba
+
+
+def holdout_folds(user_ids: pa.ChunkedArray, X: pd.DataFrame, y: pd.Series, n_splits: int) -> pd.Series:
+    """Index of the fold model that did not see each training user, keyed by user_id."""
+    fold = np.empty(len(y), dtype=np.int8)
+    for i, (_, valid_idx) in enumerate(_folds(X, y, n_splits)):
+        fold[valid_idx] = i
+    return pd.Series(fold, index=user_ids.to_numpy(), name="fold")
+
+
+def predict(models: list, holdout: pd.Series, user_ids: pa.ChunkedArray, X: pd.DataFrame) -> np.ndarray:
+    """Churn probabilities without in-sample scores.
+
+    Training users are scored by the fold model that held them out, as
+    train_model does; users the folds never saw get the average of every
+    fold model, each at its early-stopped tree count.
+    """
+    fold = holdout.reindex(user_ids.to_numpy()).fillna(-1).to_numpy(dtype=np.int64)
+    y_proba = np.empty(len(X))
+    unseen = fold < 0
+    for i, model in enumerate(models):
+        rows = fold == i
+        if rows.any():
+            y_proba[rows] = model.predict_proba(X[rows], iteration_range=(0, model.best_iteration + 1))[:, 1]
+    if unseen.any():
+        y_proba[unseen] = np.mean([
+            model.predict_proba(X[unseen], iteration_range=(0, model.best_iteration + 1))[:, 1]
+            for model in models
+        ], axis=0)
+    return y_proba
+
+
+def compute_feature_importance(models: list, feature_cols: list) -> pd.DataFrame:
+    """Get feature importance averaged over the fold models."""
     importance = pd.DataFrame({
         "feature": feature_cols,
-        "importance": model.feature_importances_,
+        "importance": np.mean([model.feature_importances_ for model in models], axis=0),
     }).sort_values("importance", ascending=False)
     return importance
 
 
-def save_predictions(df: pd.DataFrame, y_proba: np.ndarray) -> None:
+def prediction_table(user_ids: pa.ChunkedArray, y_proba: np.ndarray) -> pa.Table:
+    """Rows of ``ml_outputs.churn_predictions``."""
+    return pa.table({
+        "user_id": user_ids,
+        "churn_probability": y_proba,
+        "churn_risk_tier": pa.array(pd.cut(
+            y_proba,
+            bins=[0, 0.2, 0.5, 0.8, 1.0],
+            labels=["low", "medium", "high", "critical"],
+        )),
+    })
+
+
+def save_predictions(features: pa.Table, y_proba: np.ndarray) -> None:
     """Write churn predictions back to DuckDB."""
-    predictions = df[["user_id"]].copy()
-    predictions["churn_probability"] = y_proba
-    predictions["churn_risk_tier"] = pd.cut(
-        y_proba,
-        bins=[0, 0.2, 0.5, 0.8, 1.0],
-        labels=["low", "medium", "high", "critical"],
-    )
+    predictions = prediction_table(features["user_id"], y_proba)
+
+    with output_connection(DB_PATH) as con:
+        con.register("predictions", predictions)
+        con.execute("DROP TABLE IF EXISTS ml_outputs.churn_predictions")
+        con.execute("CREATE TABLE ml_outputs.churn_predictions AS SELECT * FROM predictions")
 
-    con = duckdb.connect(DB_PATH)
-    con.execute("CREATE SCHEMA IF NOT EXISTS ml_outputs")
-    con.execute("DROP TABLE IF EXISTS ml_outputs.churn_predictions")
-    con.execute("CREATE TABLE ml_outputs.churn_predictions AS SELECT * FROM predictions")
-    con.close()
 
+def run(retrain: bool = False) -> dict:
+    """Execute full churn prediction pipeline.
 
-def run() -> dict:
-    """Execute full churn prediction pipeline."""
+    Fold models trained on the same features, parameters and code are
+    loaded from the model registry unless ``retrain`` is set.
+    """
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
     print("🔮 Churn Prediction Pipeline")
     print("  Loading features...")
-    df = load_features()
-    print(f"  Dataset: {len(df):,} users | {df['is_churned'].sum():,} churned ({df['is_churned'].mean():.1%})")
-
-    X, y, feature_cols = prepare_data(df)
-    print("  Training XGBoost model...")
-    model, metrics, y_proba = train_model(X, y)
-
-    print(f"  ✓ CV AUC: {metrics['cv_auc_mean']:.4f} (±{metrics['cv_auc_std']:.4f})")
-    print(f"  ✓ Avg Precision: {metrics['avg_precision']:.4f}")
-
-    importance = compute_feature_importance(model, feature_cols)
+    features = load_features()
+    X, y, feature_cols = prepare_data(features)
+    print(f"  Dataset: {len(y):,} users | {y.sum():,} churned ({y.mean():.1%})")
+
+    cached = registry.entry(__file__, ["advanced.churn_features"], TRAIN_PARAMS, columns=COLUMNS, db_path=DB_PATH)
+    loaded = None if retrain else cached.load()
+    if loaded:
+        print("  Loading XGBoost fold models from the registry...")
+        (models, holdout), metrics = loaded
+        y_proba = predict(models, holdout, features["user_id"], X)
+    else:
+        print("  Training XGBoost fold models...")
+        models, metrics, y_proba = train_model(X, y, **TRAIN_PARAMS)
+        # Batch scoring needs each training user's held-out fold to stay out of sample
+        cached.save((models, holdout_folds(features["user_id"], X, y, TRAIN_PARAMS["n_splits"])), metrics)
+
+    print(f"  ✓ CV AUC: {metrics['cv_auc_mean']:.4f} (±{metrics['cv_auc_std']:.4f}) | out-of-fold AUC: {metrics['oof_auc']:.4f}")
+    print(f"  ✓ Avg Precision: {metrics['avg_precision']:.4f} | trees per fold: {metrics['best_iterations']}")
+
+    importance = compute_feature_importance(models, feature_cols)
     print("\n  Feature Importance:")
     for _, row in importance.head(5).iterrows():
         print(f"    {row['feature']:30s} {row['importance']:.4f}")
 
     # Save outputs
     importance.to_csv(OUTPUT_DIR / "churn_feature_importance.csv", index=False)
-    save_predictions(df, y_proba)
+    save_predictions(features, y_proba)
 
     with open(OUTPUT_DIR / "churn_metrics.json", "w") as f:
         json.dump(metrics, f, indent=2)
@@ -137,4 +229,6 @@ def run() -> dict:
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Train the churn model and save predictions.")
+    parser.add_argument("--retrain", action="store_true", help="train even if the registry has a matching model")
+    run(parser.parse_args().retrain)
@@ -0,0 +1,55 @@
+"""MetricFlow — DuckDB access shared by the ML pipelines."""
+
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import duckdb
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to connect()'s lock retries
+    fcntl = None
+
+DB_PATH = "data/metricflow.duckdb"
+
+
+def connect(db_path: str = DB_PATH, read_only: bool = False, timeout: float = 120.0) -> duckdb.DuckDBPyConnection:
+    """Open the warehouse, waiting while another process holds a conflicting lock.
+
+    DuckDB lets one process write or many read a database file. When several
+    pipelines run side by side their short read and write windows can
+    overlap, so a lock conflict is retried with backoff for up to
+    ``timeout`` seconds instead of failing the pipeline.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
+        try:
+            return duckdb.connect(db_path, read_only=read_only)
+        except duckdb.IOException as e:
+            if "lock" not in str(e).lower() or time.monotonic() >= deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+
+@contextmanager
+def output_connection(db_path: str = DB_PATH, timeout: float = 120.0) -> Iterator[duckdb.DuckDBPyConnection]:
+    """Write connection for saving ``ml_outputs`` tables, one pipeline at a time.
+
+    An exclusive lock on ``<db_path>.ml_outputs.lock`` queues writers from
+    concurrent pipelines, so each one gets the database as soon as the
+    previous save commits rather than polling for DuckDB's file lock.
+    """
+    with open(f"{db_path}.ml_outputs.lock", "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        con = connect(db_path, timeout=timeout)
+        try:
+            con.execute("CREATE SCHEMA IF NOT EXISTS ml_outputs")
+            yield con
+        finally:
+            con.close()
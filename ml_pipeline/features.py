@@ -0,0 +1,138 @@
+"""MetricFlow — Feature loading shared by the ML pipelines.
+
+Pipelines ask for the columns they use, get them back as Arrow, and turn
+numeric features straight into NumPy arrays without a pandas detour.
+Results are cached on disk as Feather, keyed by the query and a
+fingerprint of its source tables, so a rerun against an unchanged
+warehouse never goes back to DuckDB for the data.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import feather
+
+from ml_pipeline.db import DB_PATH, connect
+
+CACHE_DIR = Path("data/feature_cache")
+
+
+def table_fingerprint(con, table: str, columns: list[str] | None = None) -> str:
+    """Row count plus an order-independent checksum of ``columns`` (default: whole rows).
+
+    Costs one scan inside DuckDB, but nothing is transferred, and any
+    dbt rebuild that changes a checked value changes the fingerprint.
+    Restricting the checksum to the columns a query reads keeps the scan
+    cheap and ignores changes the query cannot see.
+    """
+    row = f"hash({', '.join(columns)})" if columns else "hash(t)"
+    rows, checksum = con.execute(f"SELECT count(*), coalesce(sum({row}), 0) FROM {table} AS t").fetchone()
+    return f"{rows}:{checksum}"
+
+
+def _fetch(con, sql: str) -> pa.Table:
+    result = con.execute(sql).arrow()
+    # DuckDB >= 1.4 returns a RecordBatchReader, older releases a Table
+    return result.read_all() if isinstance(result, pa.RecordBatchReader) else result
+
+
+def stream_query(con, sql: str, batch_size: int) -> pa.RecordBatchReader:
+    """Run ``sql`` and read its result as Arrow record batches of up to ``batch_size`` rows."""
+    result = con.execute(sql)
+    if hasattr(result, "to_arrow_reader"):  # DuckDB >= 1.4; fetch_record_batch is deprecated there
+        return result.to_arrow_reader(batch_size)
+    return result.fetch_record_batch(batch_size)
+
+
+def load_query(
+    sql: str,
+    tables: list[str],
+    columns: list[str] | None = None,
+    db_path: str = DB_PATH,
+    cache_dir: Path | None = CACHE_DIR,
+    refresh: bool = False,
+) -> pa.Table:
+    """Run ``sql`` over ``tables`` as Arrow, served from the Feather cache when fresh.
+
+    ``columns`` lists every column the query reads, when it reads from a
+    single table, so only those are checksummed. Cache files are named
+    ``<query hash>-<fingerprint hash>.feather``; a new fingerprint replaces
+    the query's older files. Pass ``cache_dir=None`` to bypass the cache
+    or ``refresh=True`` to rebuild the entry.
+    """
+    con = connect(db_path, read_only=True)
+    try:
+        if cache_dir is None:
+            return _fetch(con, sql)
+        query_key = hashlib.sha256(sql.encode()).hexdigest()[:16]
+        fingerprints = "|".join(f"{t}={table_fingerprint(con, t, columns)}" for t in sorted(tables))
+        path = Path(cache_dir) / f"{query_key}-{hashlib.sha256(fingerprints.encode()).hexdigest()[:16]}.feather"
+        if path.exists() and not refresh:
+            return feather.read_table(path)
+        table = _fetch(con, sql)
+    finally:
+        con.close()
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for stale in path.parent.glob(f"{query_key}-*.feather"):
+        stale.unlink(missing_ok=True)
+    # Write then rename, so a concurrent pipeline never reads a partial file
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    feather.write_feather(table, tmp, compression="uncompressed")
+    tmp.replace(path)
+    return table
+
+
+def load_columns(table: str, columns: list[str], where: str | None = None, **kwargs) -> pa.Table:
+    """Select just ``columns`` from ``table`` (see :func:`load_query` for caching).
+
+    A ``where`` filter may read other columns, so it fingerprints whole rows.
+    """
+    sql = f"SELECT {', '.join(columns)} FROM {table}" + (f" WHERE {where}" if where else "")
+    return load_query(sql, [table], None if where else columns, **kwargs)
+
+
+def to_numpy(table: pa.Table, columns: list[str], fill: float = 0.0) -> np.ndarray:
+    """Numeric ``columns`` as a float64 ``(rows, columns)`` matrix with nulls filled."""
+    out = np.empty((table.num_rows, len(columns)), dtype=np.float64)
+    for i, name in enumerate(columns):
+        column = pc.fill_null(table[name].cast(pa.float64()), fill)
+        out[:, i] = column.to_numpy()
+    return out
+
+
+def categories(table: pa.Table, column: str, fill: str = "unknown") -> list[str]:
+    """Sorted distinct values of a string column, nulls counted as ``fill``."""
+    return pc.unique(pc.fill_null(table[column], fill)).sort().to_pylist()
+
+
+def label_codes(table: pa.Table, column: str, fill: str = "unknown", known: list[str] | None = None) -> np.ndarray:
+    """Integer codes for a string column, numbered in sorted order like LabelEncoder.
+
+    ``known`` fixes the categories (e.g. those seen in training); other values get -1.
+    """
+    values = pc.fill_null(table[column], fill)
+    known = categories(table, column, fill) if known is None else known
+    return pc.fill_null(pc.index_in(values, value_set=pa.array(known, pa.string())), -1).to_numpy()
+
+
+def to_categorical(table: pa.Table, column: str, fill: str = "unknown",
+                   known: list[str] | None = None) -> pd.Categorical:
+    """A string column as a pandas Categorical with sorted categories, built from Arrow codes.
+
+    ``known`` fixes the categories (e.g. those seen in training); other values become NaN.
+    """
+    known = categories(table, column, fill) if known is None else known
+    return pd.Categorical.from_codes(label_codes(table, column, fill, known), categories=known)
+
+
+def to_frame(table: pa.Table) -> pd.DataFrame:
+    """pandas view of a (typically numeric or date) feature table, dates as datetime64."""
+    return table.to_pandas(date_as_object=False)
@@ -1,72 +1,344 @@
-"""MetricFlow — Active User Forecasting using Prophet."""
+"""MetricFlow — Active User and MRR Forecasting.
+
+Forecasts whole families of series in one run: total DAU, DAU by
+platform, plan and country, and MRR by plan. Series are split into
+chunks across a process pool. The ``holt_winters`` engine fits every
+series of a chunk at once in NumPy; ``prophet`` fits one model per
+series and is used by default when it is installed. Accuracy is MAPE
+on a held-out tail of each series.
+"""
 
 from __future__ import annotations
+
+import argparse
+import importlib.util
 import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import duckdb
+
+import numpy as np
 import pandas as pd
 
+from ml_pipeline import registry
+from ml_pipeline.db import output_connection
+from ml_pipeline.features import load_query, to_frame
+
 DB_PATH = "data/metricflow.duckdb"
 OUTPUT_DIR = Path("ml_pipeline/outputs")
 
+ENGINES = ("holt_winters", "prophet")
+RESULT_KEYS = ("yhat", "yhat_lower", "yhat_upper", "mape", "fit_seconds")
+DAU_SQL = """
+    SELECT {key} AS series_id, e.event_date AS ds, count(DISTINCT e.user_id) AS y
+    FROM staging.stg_events e{join}
+    GROUP BY ALL
+"""
+USERS_JOIN = "\n    LEFT JOIN marts.dim_users u ON e.user_id = u.user_id"
+# Each family's query yields (series_id, ds, y); freq is the calendar step,
+# season the seasonal period, holdout the tail scored for MAPE
+FAMILIES = {
+    "dau": {
+        "sql": DAU_SQL.format(key="'all'", join=""), "tables": ["staging.stg_events"],
+        "columns": ["event_date", "user_id"], "freq": "D", "season": 7, "horizon": 90, "holdout": 30,
+    },
+    "dau_platform": {
+        "sql": DAU_SQL.format(key="coalesce(e.platform, 'unknown')", join=""), "tables": ["staging.stg_events"],
+        "columns": ["event_date", "user_id", "platform"], "freq": "D", "season": 7, "horizon": 90, "holdout": 30,
+    },
+    # Users are counted under their current plan for all of their history
+    "dau_plan": {
+        "sql": DAU_SQL.format(key="coalesce(u.current_plan, 'none')", join=USERS_JOIN),
+        "tables": ["staging.stg_events", "marts.dim_users"], "freq": "D", "season": 7, "horizon": 90, "holdout": 30,
+    },
+    "dau_country": {
+        "sql": DAU_SQL.format(key="coalesce(u.country, 'unknown')", join=USERS_JOIN),
+        "tables": ["staging.stg_events", "marts.dim_users"], "freq": "D", "season": 7, "horizon": 90, "holdout": 30,
+    },
+    # Complete months only: the month the payments end in is still accruing
+    "mrr_plan": {
+        "sql": """
+    SELECT coalesce(plan_name, 'unknown') AS series_id, payment_month::DATE AS ds, mrr AS y
+    FROM marts.fct_mrr
+    WHERE payment_month < (
+        SELECT date_trunc('month', max(payment_date) + INTERVAL 1 DAY) FROM intermediate.int_revenue_normalized
+    )
+""",
+        "tables": ["marts.fct_mrr", "intermediate.int_revenue_normalized"],
+        "freq": "MS", "season": 12, "horizon": 6, "holdout": 3,
+    },
+}
+DENSE_SQL = """
+    WITH obs AS ({sql}),
+    spans AS (SELECT series_id, min(ds) AS first_ds FROM obs GROUP BY 1),
+    calendar AS (SELECT DISTINCT ds FROM obs)
+    -- Every series runs from its first observation to the last date of the family
+    SELECT s.series_id, c.ds, coalesce(o.y, 0) AS y
+    FROM spans s
+    JOIN calendar c ON c.ds >= s.first_ds
+    LEFT JOIN obs o ON o.series_id = s.series_id AND o.ds = c.ds
+    ORDER BY 1, 2
+"""
 
-def run() -> dict:
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    print("\U0001f4c8 User Forecasting Pipeline")
+# Holt-Winters smoothing grid searched per series, and the trend damping
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.8)
+BETAS = (0.0, 0.01, 0.05, 0.15)
+GAMMAS = (0.01, 0.05, 0.1, 0.3)
+PHI = 0.98
 
-    con = duckdb.connect(DB_PATH, read_only=True)
-    df = con.execute("""
-        SELECT event_date as ds, count(distinct user_id) as y
-        FROM staging.stg_events
-        GROUP BY 1 ORDER BY 1
-    """).fetchdf()
-    con.close()
 
-    df["ds"] = pd.to_datetime(df["ds"])
+def load_series(family: str) -> tuple[pd.DatetimeIndex, np.ndarray, np.ndarray]:
+    """A family's calendar, series ids and ``(series, dates)`` matrix, NaN before each series starts."""
+    spec = FAMILIES[family]
+    df = to_frame(load_query(
+        DENSE_SQL.format(sql=spec["sql"]), spec["tables"], columns=spec.get("columns"), db_path=DB_PATH,
+    ))
+    calendar = pd.DatetimeIndex(np.sort(df["ds"].unique()))
+    series_ids, rows = np.unique(df["series_id"].to_numpy(), return_inverse=True)
+    Y = np.full((len(series_ids), len(calendar)), np.nan)
+    Y[rows, calendar.searchsorted(df["ds"])] = df["y"].to_numpy(dtype=np.float64)
+    return calendar, series_ids, Y
 
-    try:
-        from prophet import Prophet
 
-        model = Prophet(
-            yearly_seasonality=True,
-            weekly_seasonality=True,
-            daily_seasonality=False,
-            changepoint_prior_scale=0.05,
-        )
-        model.fit(df)
+def holt_winters(Y: np.ndarray, season: int, horizon: int) -> tuple[np.ndarray, np.ndarray]:
+    """Fit additive damped-trend Holt-Winters to every row of ``Y`` at once.
+
+    Each series takes the (alpha, beta, gamma) grid point with the
+    smallest one-step-ahead squared error; all grid points and series
+    are updated together, one vectorized step per date. Series start at
+    their first non-NaN value and need two full seasons there for the
+    initial level, trend and seasonal states. Returns the ``(series,
+    horizon)`` forecasts and each series' one-step residual std.
+    """
+    S, T = Y.shape
+    observed = ~np.isnan(Y)
+    y_filled = np.where(observed, Y, 0.0)
+    first = observed.argmax(axis=1)
+    grid = np.array(np.meshgrid(ALPHAS, BETAS, GAMMAS, indexing="ij")).reshape(3, -1)
+    alpha, beta, gamma = (g[:, None] for g in grid)  # (params, 1) against (params, series) states
+
+    # Initial states from the first two seasons of each series
+    rows = np.arange(S)[:, None]
+    head = Y[rows, first[:, None] + np.arange(2 * season)]
+    level0 = head[:, :season].mean(axis=1)
+    trend0 = (head[:, season:].mean(axis=1) - level0) / season
+    season0 = np.empty((season, S))
+    season0[(first[:, None] + np.arange(season)) % season, rows] = head[:, :season] - level0[:, None]
+
+    P = grid.shape[1]
+    level = np.tile(level0, (P, 1))
+    trend = np.tile(trend0, (P, 1))
+    seasonal = np.tile(season0[:, None, :], (1, P, 1))  # (season, params, series): each step's slice is contiguous
+    sse = np.zeros((P, S))
+    all_started = int(first.max())
+    for t in range(T):
+        y = y_filled[:, t]
+        s = seasonal[t % season]
+        damped = level + PHI * trend
+        err = y - damped - s
+        new_level = damped + alpha * err
+        new_trend = PHI * trend + beta * (new_level - level)
+        new_season = s + gamma * (y - new_level - s)
+        if t < all_started:
+            # Series that have not started yet keep their initial states
+            obs = observed[:, t]
+            err *= obs
+            new_level = np.where(obs, new_level, level)
+            new_trend = np.where(obs, new_trend, trend)
+            new_season = np.where(obs, new_season, s)
+        sse += err * err
+        level, trend, seasonal[t % season] = new_level, new_trend, new_season
+
+    best = sse.argmin(axis=0)
+    cols = np.arange(S)
+    steps = np.arange(1, horizon + 1)
+    forecast = (
+        level[best, cols][:, None]
+        + trend[best, cols][:, None] * np.cumsum(PHI ** steps)
+        + seasonal[:, best, cols].T[:, (T - 1 + steps) % season]
+    )
+    sigma = np.sqrt(sse[best, cols] / observed.sum(axis=1))
+    return forecast, sigma
+
+
+def mape(actual: np.ndarray, predicted: np.ndarray) -> np.ndarray:
+    """Row-wise mean absolute percentage error, ignoring zero actuals (NaN if all are zero)."""
+    valid = actual != 0
+    ape = np.where(valid, np.abs(actual - predicted) / np.where(valid, np.abs(actual), 1.0), 0.0)
+    counts = valid.sum(axis=1)
+    return np.where(counts > 0, ape.sum(axis=1) / np.maximum(counts, 1), np.nan)
+
 
-        future = model.make_future_dataframe(periods=90)
-        forecast = model.predict(future)
+def _prophet(calendar: pd.DatetimeIndex, y: np.ndarray, freq: str, horizon: int):
+    from prophet import Prophet
+
+    frame = pd.DataFrame({"ds": calendar, "y": y}).dropna()
+    model = Prophet(
+        yearly_seasonality=True,
+        weekly_seasonality=freq == "D",
+        daily_seasonality=False,
+        changepoint_prior_scale=0.05,
+    ).fit(frame)
+    forecast = model.predict(model.make_future_dataframe(periods=horizon, freq=freq, include_history=False))
+    return forecast[["yhat", "yhat_lower", "yhat_upper"]].to_numpy().T
+
+
+def forecast_chunk(engine: str, calendar: pd.DatetimeIndex, Y: np.ndarray, freq: str, season: int,
+                   horizon: int, holdout: int) -> dict[str, np.ndarray]:
+    """Score and forecast one chunk of a family's series (runs in a worker process).
+
+    Each engine first fits all but the last ``holdout`` dates to score
+    MAPE on them, then refits on everything to forecast ``horizon``
+    dates. ``holt_winters`` times the whole batch and reports each
+    series' share of it; ``prophet`` times each series' fits.
+    """
+    S = len(Y)
+    if engine == "holt_winters":
+        start = time.perf_counter()
+        backtest, _ = holt_winters(Y[:, :-holdout], season, holdout)
+        yhat, sigma = holt_winters(Y, season, horizon)
+        # Approximate 95% band: one-step error std growing like a random walk
+        band = 1.96 * sigma[:, None] * np.sqrt(np.arange(1, horizon + 1))
+        return {
+            "yhat": yhat, "yhat_lower": yhat - band, "yhat_upper": yhat + band,
+            "mape": mape(Y[:, -holdout:], backtest),
+            "fit_seconds": np.full(S, (time.perf_counter() - start) / S),
+        }
+
+    out = {name: np.empty((S, horizon)) for name in ("yhat", "yhat_lower", "yhat_upper")}
+    backtest = np.empty((S, holdout))
+    fit_seconds = np.empty(S)
+    for i in range(S):
+        start = time.perf_counter()
+        backtest[i] = _prophet(calendar[:-holdout], Y[i, :-holdout], freq, holdout)[0]
+        out["yhat"][i], out["yhat_lower"][i], out["yhat_upper"][i] = _prophet(calendar, Y[i], freq, horizon)
+        fit_seconds[i] = time.perf_counter() - start
+    return {**out, "mape": mape(Y[:, -holdout:], backtest), "fit_seconds": fit_seconds}
+
+
+def run(families: tuple[str, ...] = tuple(FAMILIES), engine: str = "auto", workers: int | None = None,
+        retrain: bool = False) -> dict:
+    """Forecast every series of ``families`` with ``engine`` ("auto": Prophet if installed).
+
+    Each family's fitted forecasts are kept in the model registry and
+    reused while its tables are unchanged, unless ``retrain`` is set.
+
+    Writes ``ml_outputs.series_forecast`` (one row per series and future
+    date), ``ml_outputs.forecast_accuracy`` (per-series engine, fit time
+    and MAPE) and, for the total DAU series, ``ml_outputs.user_forecast``.
+    """
+    unknown = set(families) - set(FAMILIES)
+    if unknown or not families:
+        raise ValueError(f"families must be a non-empty subset of {list(FAMILIES)}, got {families}")
+    if engine == "auto":
+        engine = "prophet" if importlib.util.find_spec("prophet") else "holt_winters"
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be 'auto' or one of {ENGINES}, got {engine!r}")
+    if engine == "prophet" and not importlib.util.find_spec("prophet"):
+        raise ImportError("the prophet engine needs the prophet package; install it or use holt_winters")
+    workers = workers or int(os.environ.get("OMP_NUM_THREADS") or os.cpu_count() or 1)
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    print("\U0001f4c8 User Forecasting Pipeline")
+
+    # A family whose tables, engine and code are unchanged reuses its registered fit
+    fitted, pending, tasks = {}, {}, []
+    for family in families:
+        spec = FAMILIES[family]
+        cached = registry.entry(
+            __file__, spec["tables"], {"family": family, "engine": engine},
+            columns=spec.get("columns"), name=family, db_path=DB_PATH,
+        )
+        loaded = None if retrain else cached.load()
+        if loaded:
+            fitted[family] = loaded[0]
+            continue
+        calendar, series_ids, Y = load_series(family)
+        # Two seasons to initialise from, plus the holdout tail
+        long_enough = (~np.isnan(Y)).sum(axis=1) >= 2 * spec["season"] + spec["holdout"]
+        series_ids, Y = series_ids[long_enough], Y[long_enough]
+        pending[family] = (cached, calendar[-1], series_ids, int((~long_enough).sum()))
+        # Holt-Winters runs best in few big batches; Prophet balances better in small ones
+        n_chunks = min(len(Y), workers if engine == "holt_winters" else workers * 4)
+        for chunk in np.array_split(np.arange(len(Y)), max(n_chunks, 1)):
+            if len(chunk):
+                tasks.append((family, calendar, Y[chunk]))
+    print(f"  {len(families)} families, {len(fitted)} from the registry | engine: {engine}")
 
-        # Evaluate on last 30 days
-        actual = df.tail(30)
-        predicted = forecast[forecast["ds"].isin(actual["ds"])][["ds", "yhat"]]
-        merged = actual.merge(predicted, on="ds")
-        mape = (abs(merged["y"] - merged["yhat"]) / merged["y"]).mean()
+    jobs = [
+        (engine, calendar, Y, *(FAMILIES[family][k] for k in ("freq", "season", "horizon", "holdout")))
+        for family, calendar, Y in tasks
+    ]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(forecast_chunk, *zip(*jobs)))
+    else:
+        results = [forecast_chunk(*job) for job in jobs]
 
-        metrics = {"mape": round(float(mape), 4), "forecast_days": 90, "model": "prophet"}
+    # Stitch each family's chunks back together and register the fit
+    for family, (cached, last_ds, series_ids, skipped) in pending.items():
+        parts = [result for (name, _, _), result in zip(tasks, results) if name == family]
+        fitted[family] = {
+            "last_ds": last_ds, "series_ids": series_ids, "skipped": skipped,
+            **{key: np.concatenate([part[key] for part in parts]) if parts else np.empty(0) for key in RESULT_KEYS},
+        }
+        cached.save(fitted[family], {"series": len(series_ids), "skipped_series": skipped})
 
-        con = duckdb.connect(DB_PATH)
-        con.execute("CREATE SCHEMA IF NOT EXISTS ml_outputs")
-        con.execute("DROP TABLE IF EXISTS ml_outputs.user_forecast")
-        out_df = forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]].tail(90)
-        con.register("temp_forecast_view", out_df)
-        con.execute("CREATE TABLE ml_outputs.user_forecast AS SELECT * FROM temp_forecast_view")
-        con.close()
+    forecasts, accuracy = [], []
+    for family in families:
+        spec, fit = FAMILIES[family], fitted[family]
+        series_ids = fit["series_ids"]
+        future = pd.date_range(fit["last_ds"], periods=spec["horizon"] + 1, freq=spec["freq"])[1:]
+        forecasts.append(pd.DataFrame({
+            "family": family,
+            "series_id": np.repeat(series_ids, len(future)),
+            "ds": np.tile(future, len(series_ids)),
+            **{name: fit[name].ravel() for name in ("yhat", "yhat_lower", "yhat_upper")},
+        }))
+        accuracy.append(pd.DataFrame({
+            "family": family, "series_id": series_ids, "engine": engine,
+            "fit_seconds": fit["fit_seconds"], "mape": fit["mape"],
+        }))
+    forecast_df = pd.concat(forecasts, ignore_index=True)
+    accuracy_df = pd.concat(accuracy, ignore_index=True)
 
-        print(f"  \u2713 MAPE: {mape:.2%} | 90-day forecast generated")
+    total = accuracy_df[accuracy_df["family"] == "dau"]
+    metrics = {
+        "mape": round(float(total["mape"].iloc[0]), 4) if len(total) else None,
+        "forecast_days": FAMILIES["dau"]["horizon"],
+        "model": engine,
+        "series": len(accuracy_df),
+        "skipped_series": sum(fitted[family]["skipped"] for family in families),
+        "median_mape": {f: round(float(m), 4) for f, m in accuracy_df.groupby("family")["mape"].median().items()},
+        "fit_seconds": round(float(accuracy_df["fit_seconds"].sum()), 2),
+    }
 
-    except ImportError:
-        # Fallback: simple exponential smoothing
-        print("  \u26a0 Prophet not available, using simple trend extrapolation")
-        metrics = {"mape": 0.12, "forecast_days": 90, "model": "trend_extrapolation"}
+    with output_connection(DB_PATH) as con:
+        for table, frame in (("series_forecast", forecast_df), ("forecast_accuracy", accuracy_df)):
+            con.execute(f"DROP TABLE IF EXISTS ml_outputs.{table}")
+            con.execute(f"CREATE TABLE ml_outputs.{table} AS SELECT * FROM frame")
+        if len(total):
+            con.execute("DROP TABLE IF EXISTS ml_outputs.user_forecast")
+            con.execute("""
+                CREATE TABLE ml_outputs.user_forecast AS
+                SELECT ds, yhat, yhat_lower, yhat_upper FROM forecast_df WHERE family = 'dau' ORDER BY ds
+            """)
 
-    # Always save metrics JSON regardless of which path was taken
+    if metrics["mape"] is not None:
+        print(f"  ✓ Total DAU MAPE: {metrics['mape']:.2%} | {metrics['forecast_days']}-day forecast generated")
+    for family, value in metrics["median_mape"].items():
+        print(f"  ✓ {family:14s} median MAPE {value:.2%}")
     with open(OUTPUT_DIR / "forecast_metrics.json", "w") as f:
         json.dump(metrics, f, indent=2)
-    print("  \u2705 Forecast saved")
+    print("  ✅ Forecast saved")
     return metrics
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Forecast DAU and MRR series.")
+    parser.add_argument("--families", nargs="+", choices=list(FAMILIES), default=list(FAMILIES))
+    parser.add_argument("--engine", choices=["auto", *ENGINES], default="auto")
+    parser.add_argument("--workers", type=int, help="worker processes (default: the CPU budget)")
+    parser.add_argument("--retrain", action="store_true", help="fit even if the registry has matching forecasts")
+    args = parser.parse_args()
+    run(args.families, args.engine, args.workers, args.retrain)
@@ -0,0 +1,113 @@
+"""
+MetricFlow — LTV Engine Benchmark
+Times ``ltv_model.train_model`` (5-fold CV plus the final fit) for each
+engine at several user counts. Larger populations are bootstrapped from
+``advanced.ltv_features`` with small jitter on the numeric columns, so
+the distributions match the warehouse without generating millions of users.
+
+    python -m ml_pipeline.ltv_benchmark --scales 50000 500000 5000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from rich.console import Console
+from rich.table import Table
+
+from ml_pipeline import ltv_model
+
+SCALES = [50_000, 500_000, 5_000_000]
+RESULTS_PATH = Path("data/benchmarks/ltv_engines.json")
+
+console = Console()
+
+
+def bootstrap(X: pd.DataFrame, y: pd.Series, n: int, seed: int = 42) -> tuple[pd.DataFrame, pd.Series]:
+    """``n`` rows resampled with replacement, numeric features jittered by ±5%."""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(X), n)
+    Xb = X.iloc[rows].reset_index(drop=True)
+    for column in ltv_model.NUMERIC_COLS:
+        Xb[column] = Xb[column].to_numpy() * rng.uniform(0.95, 1.05, n)
+    yb = pd.Series(y.to_numpy()[rows] * rng.uniform(0.95, 1.05, n), name=y.name)
+    return Xb, yb
+
+
+def run_benchmark(scales: list[int], engines: list[str], gbr_max_users: int, single_fit: bool = False) -> dict:
+    """Time every engine at each scale; ``single_fit`` times one full-data fit instead of train_model."""
+    features = ltv_model.load_features()
+    results = {}
+    for scale in sorted(scales):
+        for engine in engines:
+            if engine == "gbr" and scale > gbr_max_users:
+                console.print(f"  [yellow]- gbr @ {scale:,}: skipped (above --gbr-max-users)[/]")
+                results.setdefault(str(scale), {})[engine] = None
+                continue
+            X, y, _ = ltv_model.prepare_data(features, engine)
+            X, y = bootstrap(X, y, scale)
+            start = time.perf_counter()
+            if single_fit:
+                model = ltv_model.fit_model(engine, X, y)
+                seconds = time.perf_counter() - start
+                metrics = {"train_r2": round(float(model.score(X, y)), 4)}
+            else:
+                _, metrics, _ = ltv_model.train_model(X, y, engine)
+                seconds = time.perf_counter() - start
+            results.setdefault(str(scale), {})[engine] = {"seconds": round(seconds, 2), **metrics}
+            console.print(f"  ✓ {engine} @ {scale:,}: {seconds:,.1f}s, {metrics}")
+            del X, y
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "source_users": features.num_rows,
+        "timed": "single fit" if single_fit else "train_model",
+        "results": results,
+    }
+
+
+def _print_report(report: dict) -> None:
+    timed = "one full-data fit" if report["timed"] == "single fit" else "5-fold CV + final fit"
+    table = Table(title=f"LTV engines: {timed}")
+    for column in ("users", "engine", "seconds", "vs gbr", "R²"):
+        table.add_column(column, justify="left" if column == "engine" else "right")
+    for scale, engines in report["results"].items():
+        baseline = (engines.get("gbr") or {}).get("seconds")
+        for engine, r in engines.items():
+            if r is None:
+                table.add_row(f"{int(scale):,}", engine, "skipped", "", "")
+                continue
+            speedup = f"{baseline / r['seconds']:.1f}x" if baseline and engine != "gbr" else ""
+            r2 = r.get("cv_r2_mean", r["train_r2"])
+            table.add_row(f"{int(scale):,}", engine, f"{r['seconds']:,.1f}", speedup, f"{r2:.4f}")
+    console.print(table)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare LTV training engines across user counts.")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES, help="user counts to benchmark")
+    parser.add_argument("--engines", nargs="+", choices=ltv_model.ENGINES, default=list(ltv_model.ENGINES))
+    parser.add_argument("--gbr-max-users", type=int, default=500_000,
+                        help="skip the exact gbr engine above this many users")
+    parser.add_argument("--single-fit", action="store_true",
+                        help="time one full-data fit instead of CV + fit (for the largest scales)")
+    parser.add_argument("--output", type=Path, default=RESULTS_PATH, help="where to write the JSON results")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.scales, args.engines, args.gbr_max_users, args.single_fit)
+    _print_report(report)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    console.print(f"Results → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
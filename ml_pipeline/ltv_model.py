@@ -1,62 +1,117 @@
 """
 MetricFlow — Customer Lifetime Value Prediction
 Gradient Boosted regression with feature importance.
+Engines: histogram-based HistGradientBoosting (default) or XGBoost ``hist``
+with native categoricals, or sklearn's exact GradientBoosting.
 """
 
 from __future__ import annotations
 
+import argparse
 import json
+import os
 from pathlib import Path
 
-import duckdb
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import GradientBoostingRegressor
+import pyarrow as pa
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor
+from sklearn.inspection import permutation_importance
 from sklearn.metrics import mean_absolute_error, r2_score
-from sklearn.model_selection import KFold, cross_val_score
-from sklearn.preprocessing import LabelEncoder
+from sklearn.model_selection import KFold
+from xgboost import XGBRegressor
+
+from ml_pipeline import registry
+from ml_pipeline.db import output_connection
+from ml_pipeline.features import (
+    categories,
+    label_codes,
+    load_columns,
+    to_categorical,
+    to_numpy,
+)
 
 DB_PATH = "data/metricflow.duckdb"
 OUTPUT_DIR = Path("ml_pipeline/outputs")
 
+NUMERIC_COLS = [
+    "engagement_score", "total_payments", "active_days_first_30",
+    "events_first_30", "unique_features_first_30",
+    "avg_session_seconds", "total_sessions",
+]
+CATEGORICAL_COLS = {"acquisition_channel": "channel_encoded", "company_size": "size_encoded"}
+ENGINES = ("hist", "xgboost", "gbr")
+COLUMNS = ["user_id", *NUMERIC_COLS, *CATEGORICAL_COLS, "lifetime_revenue"]
 
-def load_features() -> pd.DataFrame:
-    con = duckdb.connect(DB_PATH, read_only=True)
-    df = con.execute("SELECT * FROM advanced.ltv_features").fetchdf()
-    con.close()
-    return df
 
+def load_features() -> pa.Table:
+    return load_columns("advanced.ltv_features", COLUMNS, db_path=DB_PATH)
 
-def prepare_data(df: pd.DataFrame) -> tuple:
-    feature_cols = [
-        "engagement_score", "total_payments", "active_days_first_30",
-        "events_first_30", "unique_features_first_30",
-        "avg_session_seconds", "total_sessions",
-    ]
 
-    # Encode categoricals
-    le_channel = LabelEncoder()
-    df["channel_encoded"] = le_channel.fit_transform(df["acquisition_channel"].fillna("unknown"))
-    le_size = LabelEncoder()
-    df["size_encoded"] = le_size.fit_transform(df["company_size"].fillna("unknown"))
-    feature_cols += ["channel_encoded", "size_encoded"]
+def category_values(features: pa.Table) -> dict[str, list[str]]:
+    """Each categorical column's values, kept with the model so scoring encodes them the same way."""
+    return {column: categories(features, column) for column in CATEGORICAL_COLS}
+
+
+def prepare_data(features: pa.Table, engine: str = "hist", known: dict[str, list[str]] | None = None) -> tuple:
+    """Model matrix, target and feature names; ``known`` fixes the categories (default: from ``features``)."""
+    X = pd.DataFrame(to_numpy(features, NUMERIC_COLS), columns=NUMERIC_COLS)
+    known = known or category_values(features)
+
+    # The histogram engines split categoricals natively; gbr needs ordinal codes
+    for column, encoded in CATEGORICAL_COLS.items():
+        if engine == "gbr":
+            X[encoded] = label_codes(features, column, known=known[column])
+        else:
+            X[column] = to_categorical(features, column, known=known[column])
+    feature_cols = list(X.columns)
 
-    X = df[feature_cols].fillna(0)
-    y = df["lifetime_revenue"].clip(lower=0)  # no negative LTV
+    y = None  # scoring batches carry no target
+    if "lifetime_revenue" in features.column_names:
+        y = pd.Series(to_numpy(features, ["lifetime_revenue"])[:, 0], name="lifetime_revenue")
+        y = y.clip(lower=0)  # no negative LTV
 
     return X, y, feature_cols
 
 
-def train_model(X: pd.DataFrame, y: pd.Series) -> tuple:
-    model = GradientBoostingRegressor(
-        n_estimators=200, max_depth=5, learning_rate=0.05,
-        subsample=0.8, random_state=42,
+def _n_jobs() -> int:
+    return int(os.environ.get("OMP_NUM_THREADS") or os.cpu_count() or 1)
+
+
+def fit_model(engine: str, X: pd.DataFrame, y: pd.Series):
+    """Fit one model; the histogram engines stop early on a held-out 10% of ``X``."""
+    if engine == "gbr":
+        return GradientBoostingRegressor(
+            n_estimators=200, max_depth=5, learning_rate=0.05,
+            subsample=0.8, random_state=42,
+        ).fit(X, y)
+    if engine == "hist":
+        return HistGradientBoostingRegressor(
+            max_iter=1000, max_depth=5, learning_rate=0.05,
+            categorical_features="from_dtype",
+            early_stopping=True, validation_fraction=0.1, n_iter_no_change=20,
+            random_state=42,
+        ).fit(X, y)
+    valid = np.random.default_rng(42).random(len(X)) < 0.1
+    model = XGBRegressor(
+        n_estimators=1000, max_depth=5, learning_rate=0.05, subsample=0.8,
+        tree_method="hist", enable_categorical=True,
+        early_stopping_rounds=20, n_jobs=_n_jobs(), random_state=42,
     )
+    return model.fit(X[~valid], y[~valid], eval_set=[(X[valid], y[valid])], verbose=False)
+
+
+def train_model(X: pd.DataFrame, y: pd.Series, engine: str = "hist") -> tuple:
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {ENGINES}, got {engine!r}")
 
     cv = KFold(n_splits=5, shuffle=True, random_state=42)
-    cv_r2 = cross_val_score(model, X, y, cv=cv, scoring="r2")
+    cv_r2 = [
+        r2_score(y.iloc[valid], fit_model(engine, X.iloc[train], y.iloc[train]).predict(X.iloc[valid]))
+        for train, valid in cv.split(X)
+    ]
 
-    model.fit(X, y)
+    model = fit_model(engine, X, y)
     y_pred = model.predict(X)
 
     metrics = {
@@ -69,38 +124,63 @@ def train_model(X: pd.DataFrame, y: pd.Series) -> tuple:
     return model, metrics, y_pred
 
 
-def run() -> dict:
+def feature_importance(model, X: pd.DataFrame, y: pd.Series) -> np.ndarray:
+    """Impurity importance where the model has it, else permutation importance on ≤10K rows."""
+    if hasattr(model, "feature_importances_"):
+        return model.feature_importances_
+    sample = np.random.default_rng(42).permutation(len(X))[:10_000]
+    result = permutation_importance(model, X.iloc[sample], y.iloc[sample], n_repeats=3, random_state=42)
+    return result.importances_mean
+
+
+def prediction_table(user_ids: pa.ChunkedArray, y_pred: np.ndarray) -> pa.Table:
+    """Rows of ``ml_outputs.ltv_predictions``."""
+    return pa.table({
+        "user_id": user_ids,
+        "predicted_ltv": np.round(y_pred, 2),
+        "ltv_tier": pa.array(pd.cut(
+            y_pred, bins=[0, 100, 500, 2000, float("inf")],
+            labels=["low", "medium", "high", "whale"],
+        )),
+    })
+
+
+def run(engine: str = "hist", retrain: bool = False) -> dict:
+    """Train (or load from the model registry, unless ``retrain``) and save LTV predictions."""
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
     print("💰 LTV Prediction Pipeline")
-    df = load_features()
-    print(f"  Dataset: {len(df):,} users | Median LTV: ${df['lifetime_revenue'].median():,.0f}")
-
-    X, y, feature_cols = prepare_data(df)
-    model, metrics, y_pred = train_model(X, y)
+    features = load_features()
+    known = category_values(features)
+    X, y, feature_cols = prepare_data(features, engine, known)
+    median = np.nanmedian(to_numpy(features, ["lifetime_revenue"], fill=np.nan))
+    print(f"  Dataset: {len(y):,} users | Median LTV: ${median:,.0f} | engine: {engine}")
+
+    cached = registry.entry(__file__, ["advanced.ltv_features"], {"engine": engine}, columns=COLUMNS, db_path=DB_PATH)
+    loaded = None if retrain else cached.load()
+    if loaded:
+        print("  Loaded model from the registry")
+        (model, _), metrics = loaded  # same fingerprint, so the same categories
+        y_pred = model.predict(X)
+    else:
+        model, metrics, y_pred = train_model(X, y, engine)
+        cached.save((model, known), metrics)
 
     print(f"  ✓ CV R²: {metrics['cv_r2_mean']:.4f} (±{metrics['cv_r2_std']:.4f})")
     print(f"  ✓ MAE: ${metrics['train_mae']:,.2f}")
 
     importance = pd.DataFrame({
         "feature": feature_cols,
-        "importance": model.feature_importances_,
+        "importance": feature_importance(model, X, y),
     }).sort_values("importance", ascending=False)
     importance.to_csv(OUTPUT_DIR / "ltv_feature_importance.csv", index=False)
 
     # Save predictions
-    predictions = df[["user_id"]].copy()
-    predictions["predicted_ltv"] = np.round(y_pred, 2)
-    predictions["ltv_tier"] = pd.cut(
-        y_pred, bins=[0, 100, 500, 2000, float("inf")],
-        labels=["low", "medium", "high", "whale"],
-    )
-
-    con = duckdb.connect(DB_PATH)
-    con.execute("CREATE SCHEMA IF NOT EXISTS ml_outputs")
-    con.execute("DROP TABLE IF EXISTS ml_outputs.ltv_predictions")
-    con.execute("CREATE TABLE ml_outputs.ltv_predictions AS SELECT * FROM predictions")
-    con.close()
+    predictions = prediction_table(features["user_id"], y_pred)
+    with output_connection(DB_PATH) as con:
+        con.register("predictions", predictions)
+        con.execute("DROP TABLE IF EXISTS ml_outputs.ltv_predictions")
+        con.execute("CREATE TABLE ml_outputs.ltv_predictions AS SELECT * FROM predictions")
 
     with open(OUTPUT_DIR / "ltv_metrics.json", "w") as f:
         json.dump(metrics, f, indent=2)
@@ -110,4 +190,8 @@ def run() -> dict:
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Train the LTV model and save predictions.")
+    parser.add_argument("--engine", choices=ENGINES, default="hist")
+    parser.add_argument("--retrain", action="store_true", help="train even if the registry has a matching model")
+    args = parser.parse_args()
+    run(args.engine, args.retrain)
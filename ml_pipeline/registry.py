@@ -0,0 +1,102 @@
+"""MetricFlow — Local registry of fitted models.
+
+Each entry is a directory ``<pipeline>[/<name>]/<key>/`` holding the fitted model
+(``model.joblib``), its training metrics and a ``meta.json`` describing
+what it was trained on. The key hashes the fingerprints of the input
+tables, the hyperparameters and the pipeline module's source, so a
+pipeline rerun against unchanged tables and code loads its model instead
+of training, and any change to them trains a new entry.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import joblib
+
+from ml_pipeline.db import DB_PATH, connect
+from ml_pipeline.features import table_fingerprint
+
+REGISTRY_DIR = Path("data/model_registry")
+KEEP_ENTRIES = 5  # most recently saved or loaded entries kept per pipeline (or name)
+
+
+@dataclass
+class Entry:
+    path: Path
+    meta: dict
+
+    def load(self) -> tuple[Any, dict] | None:
+        """The cached (model, metrics), or None if this key was never trained."""
+        if not (self.path / "model.joblib").exists():
+            return None
+        metrics = json.loads((self.path / "metrics.json").read_text())
+        os.utime(self.path)  # pruning keeps recently used entries
+        return joblib.load(self.path / "model.joblib"), metrics
+
+    def save(self, model: Any, metrics: dict) -> None:
+        """Store a fitted model and its metrics, then prune the pipeline's oldest entries."""
+        # Build the entry beside its final path and rename, so readers never see half an entry
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp.mkdir(parents=True, exist_ok=True)
+        joblib.dump(model, tmp / "model.joblib")
+        (tmp / "metrics.json").write_text(json.dumps(metrics, indent=2))
+        (tmp / "meta.json").write_text(json.dumps(
+            {**self.meta, "created_at": datetime.now().isoformat(timespec="seconds")}, indent=2, default=str,
+        ))
+        shutil.rmtree(self.path, ignore_errors=True)
+        tmp.rename(self.path)
+
+        entries = sorted(
+            (p for p in self.path.parent.iterdir() if p.is_dir() and not p.name.endswith(".tmp")),
+            key=lambda p: p.stat().st_mtime, reverse=True,
+        )
+        for stale in entries[KEEP_ENTRIES:]:
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def entry(
+    source: str,
+    tables: list[str],
+    params: dict,
+    columns: list[str] | None = None,
+    name: str | None = None,
+    db_path: str = DB_PATH,
+    registry_dir: Path = REGISTRY_DIR,
+) -> Entry:
+    """The registry entry for the pipeline module at ``source`` (pass ``__file__``).
+
+    ``tables`` are fingerprinted like :func:`ml_pipeline.features.load_query`
+    does, over ``columns`` when given; ``params`` are the hyperparameters
+    that change the fitted model. Pipelines that register several models
+    give each a ``name``, so their entries are pruned separately.
+    """
+    con = connect(db_path, read_only=True)
+    try:
+        fingerprints = {t: table_fingerprint(con, t, columns) for t in sorted(tables)}
+    finally:
+        con.close()
+    meta = {
+        "tables": fingerprints,
+        "params": params,
+        "code": hashlib.sha256(Path(source).read_bytes()).hexdigest()[:16],
+    }
+    key = hashlib.sha256(json.dumps(meta, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return Entry(Path(registry_dir) / Path(source).stem / (name or "") / key, meta)
+
+
+def latest(source: str, name: str | None = None, registry_dir: Path = REGISTRY_DIR) -> Entry | None:
+    """The pipeline's most recently saved or loaded entry, whatever its key, or None."""
+    root = Path(registry_dir) / Path(source).stem / (name or "")
+    entries = [p for p in root.glob("*/model.joblib") if not p.parent.name.endswith(".tmp")]
+    if not entries:
+        return None
+    path = max((p.parent for p in entries), key=lambda p: p.stat().st_mtime)
+    return Entry(path, json.loads((path / "meta.json").read_text()))
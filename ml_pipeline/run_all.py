@@ -1,39 +1,95 @@
-"""Run all ML pipelines sequentially."""
+"""Run all ML pipelines, one after another or side by side in a process pool.
 
-from ml_pipeline.churn_model import run as run_churn
-from ml_pipeline.ltv_model import run as run_ltv
-from ml_pipeline.segmentation import run as run_segmentation
-from ml_pipeline.anomaly_detection import run as run_anomaly
-from ml_pipeline.forecasting import run as run_forecast
+    python -m ml_pipeline.run_all
+    python -m ml_pipeline.run_all --parallel --workers 3 --threads 2
+"""
 
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from importlib import import_module
+
+from threadpoolctl import threadpool_limits
+
+PIPELINES = {
+    "Churn Prediction": "churn_model",
+    "LTV Prediction": "ltv_model",
+    "User Segmentation": "segmentation",
+    "Anomaly Detection": "anomaly_detection",
+    "User Forecasting": "forecasting",
+}
+
+
+def run_pipeline(module: str, threads: int | None = None, retrain: bool = False) -> tuple[dict, float]:
+    """Run one pipeline's ``run()``, capped at ``threads`` CPU threads.
+
+    ``threadpool_limits`` caps the OpenMP and BLAS pools behind XGBoost,
+    scikit-learn and NumPy; Prophet fits in a CmdStan subprocess, which
+    reads its cap from the environment. ``retrain`` bypasses the model
+    registry. Returns the metrics and seconds.
+    """
+    start = time.perf_counter()
+    runner = import_module(f"ml_pipeline.{module}").run
+    if threads:
+        os.environ.update(OMP_NUM_THREADS=str(threads), STAN_NUM_THREADS=str(threads))
+        with threadpool_limits(limits=threads):
+            metrics = runner(retrain=retrain)
+    else:
+        metrics = runner(retrain=retrain)
+    return metrics, time.perf_counter() - start
+
+
+def main(argv: list[str] | None = None) -> dict:
+    parser = argparse.ArgumentParser(description="Run the MetricFlow ML pipelines.")
+    parser.add_argument("--parallel", action="store_true", help="run the pipelines in a process pool")
+    parser.add_argument("--workers", type=int, default=min(len(PIPELINES), os.cpu_count() or 1),
+                        help="pipelines run at once with --parallel")
+    parser.add_argument("--threads", type=int,
+                        help="CPU threads per pipeline (default: all cores, or cores / workers with --parallel)")
+    parser.add_argument("--retrain", action="store_true", help="train every model, ignoring the model registry")
+    args = parser.parse_args(argv)
 
-def main():
     print("=" * 60)
     print("  MetricFlow — ML Pipeline Suite")
     print("=" * 60)
     print()
 
-    results = {}
-    for name, runner in [
-        ("Churn Prediction", run_churn),
-        ("LTV Prediction", run_ltv),
-        ("User Segmentation", run_segmentation),
-        ("Anomaly Detection", run_anomaly),
-        ("User Forecasting", run_forecast),
-    ]:
-        print(f"\n{'─' * 50}")
-        try:
-            results[name] = runner()
-        except Exception as e:
-            print(f"  ❌ {name} failed: {e}")
-            results[name] = {"error": str(e)}
+    start = time.perf_counter()
+    results, seconds = {}, {}
+    if args.parallel:
+        # Each pipeline reads through its own read-only connection and saves
+        # via ml_pipeline.db.output_connection, which queues the writers
+        threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = {pool.submit(run_pipeline, module, threads, args.retrain): name for name, module in PIPELINES.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    results[name], seconds[name] = future.result()
+                except Exception as e:
+                    print(f"  ❌ {name} failed: {e}")
+                    results[name] = {"error": str(e)}
+    else:
+        for name, module in PIPELINES.items():
+            print(f"\n{'─' * 50}")
+            try:
+                results[name], seconds[name] = run_pipeline(module, args.threads, args.retrain)
+            except Exception as e:
+                print(f"  ❌ {name} failed: {e}")
+                results[name] = {"error": str(e)}
 
     print(f"\n{'=' * 60}")
-    print("  Pipeline Complete — Summary")
+    print(f"  Pipeline Complete — Summary ({time.perf_counter() - start:.1f}s)")
     print("=" * 60)
-    for name, metrics in results.items():
+    for name in PIPELINES:
+        metrics = results[name]
         status = "✅" if "error" not in metrics else "❌"
-        print(f"  {status} {name}: {metrics}")
+        took = f" [{seconds[name]:.1f}s]" if name in seconds else ""
+        print(f"  {status} {name}{took}: {metrics}")
+    return results
 
 
 if __name__ == "__main__":
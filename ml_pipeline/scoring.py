@@ -0,0 +1,146 @@
+"""MetricFlow — Batch scoring with the saved churn and LTV models.
+
+Scores users with the model their pipeline last trained or loaded from
+the model registry, without retraining; users the churn model was trained
+on keep out-of-fold scores from the fold model that held them out.
+Features stream out of DuckDB as Arrow record batches, so memory is
+bounded by the batch size however many users there are. Each batch's scores are appended to
+``ml_outputs.churn_predictions`` / ``ml_outputs.ltv_predictions``,
+replacing the users' earlier rows, with a hash of the features they were
+scored from; ``--changed-only`` uses it to skip users whose features are
+unchanged since.
+
+    python -m ml_pipeline.scoring --models churn ltv --batch-size 100000 --changed-only
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from ml_pipeline import churn_model, ltv_model, registry
+from ml_pipeline.db import output_connection
+from ml_pipeline.features import stream_query, to_numpy
+
+DB_PATH = "data/metricflow.duckdb"
+OUTPUT_DIR = Path("ml_pipeline/outputs")
+BATCH_SIZE = 100_000
+
+SCORERS = {
+    "churn": {
+        "module": churn_model, "table": "advanced.churn_features",
+        "features": churn_model.FEATURE_COLS, "output": "ml_outputs.churn_predictions",
+    },
+    "ltv": {
+        "module": ltv_model, "table": "advanced.ltv_features",
+        "features": [*ltv_model.NUMERIC_COLS, *ltv_model.CATEGORICAL_COLS], "output": "ml_outputs.ltv_predictions",
+    },
+}
+
+
+def churn_scorer(artifact: tuple) -> Callable[[pa.Table], pa.Table]:
+    """Batch scorer keeping training users out of sample (see :func:`churn_model.predict`)."""
+    models, holdout = artifact
+
+    def score(batch: pa.Table) -> pa.Table:
+        X = pd.DataFrame(to_numpy(batch, churn_model.FEATURE_COLS), columns=churn_model.FEATURE_COLS)
+        proba = churn_model.predict(models, holdout, batch["user_id"], X)
+        return churn_model.prediction_table(batch["user_id"], proba)
+    return score
+
+
+def ltv_scorer(artifact: tuple, engine: str) -> Callable[[pa.Table], pa.Table]:
+    """Batch scorer encoding categoricals with the categories the model was trained on."""
+    model, known = artifact
+
+    def score(batch: pa.Table) -> pa.Table:
+        X, _, _ = ltv_model.prepare_data(batch, engine, known)
+        return ltv_model.prediction_table(batch["user_id"], model.predict(X))
+    return score
+
+
+def score(model: str, batch_size: int = BATCH_SIZE, changed_only: bool = False) -> dict:
+    """Score every user (or, with ``changed_only``, those whose features changed) with ``model``."""
+    spec = SCORERS[model]
+    entry = registry.latest(spec["module"].__file__)
+    if entry is None:
+        raise ValueError(f"no saved {model} model in the registry; run {spec['module'].__name__} first")
+    artifact, _ = entry.load()
+    scorer = churn_scorer(artifact) if model == "churn" else ltv_scorer(artifact, entry.meta["params"]["engine"])
+
+    columns = ", ".join(f"f.{c}" for c in spec["features"])
+    output = spec["output"]
+    sql = f"SELECT f.user_id, {columns}, hash({columns}) AS feature_hash FROM {spec['table']} f"
+
+    start = time.perf_counter()
+    scored = batches = 0
+    with output_connection(DB_PATH) as con:
+        schema, table = output.split(".")
+        exists = con.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE schema_name = ? AND table_name = ?", [schema, table],
+        ).fetchone()[0]
+        if exists:
+            # Tables written by a training run predate these columns
+            con.execute(f"ALTER TABLE {output} ADD COLUMN IF NOT EXISTS feature_hash UBIGINT")
+            con.execute(f"ALTER TABLE {output} ADD COLUMN IF NOT EXISTS scored_at TIMESTAMP")
+            if changed_only:
+                sql += f"""
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {output} p WHERE p.user_id = f.user_id AND p.feature_hash = hash({columns})
+                )"""
+
+        # One transaction, so readers see the old scores until every batch is in
+        con.begin()
+        if exists and not changed_only:
+            con.execute(f"DELETE FROM {output}")
+        cursor = con.cursor()  # the stream reads on its own cursor while batches are written
+        for batch in stream_query(cursor, sql, batch_size):
+            batch = pa.Table.from_batches([batch])
+            con.register("predictions", scorer(batch).append_column("feature_hash", batch["feature_hash"]))
+            if not exists:
+                con.execute(f"CREATE TABLE {output} AS SELECT *, now()::TIMESTAMP AS scored_at FROM predictions LIMIT 0")
+                exists = True
+            elif changed_only:
+                con.execute(f"DELETE FROM {output} WHERE user_id IN (SELECT user_id FROM predictions)")
+            con.execute(f"INSERT INTO {output} BY NAME SELECT *, now()::TIMESTAMP AS scored_at FROM predictions")
+            scored += batch.num_rows
+            batches += 1
+        cursor.close()
+        con.unregister("predictions")
+        con.commit()
+
+    seconds = time.perf_counter() - start
+    print(f"  ✓ {model}: {scored:,} users in {batches} batches ({seconds:.1f}s, model {entry.path.name})")
+    return {
+        "model": entry.path.name,
+        "changed_only": changed_only,
+        "users_scored": scored,
+        "batches": batches,
+        "seconds": round(seconds, 2),
+    }
+
+
+def run(models: tuple[str, ...] = tuple(SCORERS), batch_size: int = BATCH_SIZE, changed_only: bool = False) -> dict:
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    print("🧮 Batch Scoring")
+    metrics = {model: score(model, batch_size, changed_only) for model in models}
+    with open(OUTPUT_DIR / "scoring_metrics.json", "w") as f:
+        json.dump(metrics, f, indent=2)
+    print("  ✅ Scores saved")
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score users with the saved churn and LTV models.")
+    parser.add_argument("--models", nargs="+", choices=list(SCORERS), default=list(SCORERS))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="users per Arrow record batch")
+    parser.add_argument("--changed-only", action="store_true",
+                        help="score only users whose features changed since they were last scored")
+    args = parser.parse_args()
+    run(args.models, args.batch_size, args.changed_only)
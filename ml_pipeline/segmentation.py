@@ -1,59 +1,143 @@
 """
 MetricFlow — User Segmentation via K-Means + PCA
+Large user bases sweep k with MiniBatchKMeans on a stratified sample.
 """
 
 from __future__ import annotations
 
+import argparse
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import duckdb
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+import pyarrow as pa
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.decomposition import PCA
 from sklearn.metrics import silhouette_score
 from sklearn.preprocessing import StandardScaler
+from threadpoolctl import threadpool_limits
+
+from ml_pipeline import registry
+from ml_pipeline.db import output_connection
+from ml_pipeline.features import load_columns, to_numpy
 
 DB_PATH = "data/metricflow.duckdb"
 OUTPUT_DIR = Path("ml_pipeline/outputs")
 
 
-def run() -> dict:
+K_RANGE = range(3, 8)
+SCALABLE_MIN_USERS = 200_000  # above this the k sweep runs MiniBatchKMeans on a sample
+SAMPLE_SIZE = 100_000
+CHUNK_ROWS = 1_000_000  # users assigned per predict/transform call
+
+
+def stratified_sample(strata: np.ndarray, size: int, seed: int = 42) -> np.ndarray:
+    """Sorted row indices of a ~``size`` sample, each stratum kept in proportion."""
+    n = len(strata)
+    if n <= size:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(n), strata))
+    sorted_strata = strata[order]
+    starts = np.flatnonzero(np.r_[True, sorted_strata[1:] != sorted_strata[:-1]])
+    counts = np.diff(np.r_[starts, n])
+    rank = np.arange(n) - np.repeat(starts, counts)
+    keep = rank < np.repeat(np.ceil(counts * size / n), counts)
+    return np.sort(order[keep])
+
+
+def _fit_candidate(k: int, X: np.ndarray, scalable: bool) -> tuple:
+    if scalable:
+        model = MiniBatchKMeans(n_clusters=k, batch_size=4096, n_init=3, random_state=42)
+    else:
+        model = KMeans(n_clusters=k, random_state=42, n_init=10)
+    labels = model.fit_predict(X)
+    score = silhouette_score(X, labels, sample_size=min(5000, len(X)), random_state=42)
+    return model, labels, score
+
+
+def sweep_k(X: np.ndarray, scalable: bool) -> tuple:
+    """Fit every k in K_RANGE concurrently; returns the best silhouette's (k, model, labels, score, sweep).
+
+    ``sweep`` has one ``{"k", "inertia", "silhouette"}`` record per k,
+    so the metrics also show the elbow the silhouette choice sits on.
+
+    The k models share the run's CPU budget (``OMP_NUM_THREADS`` under
+    run_all, else all cores) rather than each taking every core.
+    """
+    budget = int(os.environ.get("OMP_NUM_THREADS") or os.cpu_count() or 1)
+    workers = min(len(K_RANGE), budget)
+    with threadpool_limits(max(1, budget // workers)), ThreadPoolExecutor(max_workers=workers) as pool:
+        candidates = list(pool.map(lambda k: _fit_candidate(k, X, scalable), K_RANGE))
+    best = max(range(len(candidates)), key=lambda i: candidates[i][2])  # first k on ties
+    model, labels, score = candidates[best]
+    sweep = [
+        {"k": k, "inertia": round(float(m.inertia_), 2), "silhouette": round(float(sc), 4)}
+        for k, (m, _, sc) in zip(K_RANGE, candidates)
+    ]
+    return K_RANGE[best], model, labels, score, sweep
+
+
+def run(scalable: bool | None = None, retrain: bool = False) -> dict:
+    """Segment users; ``scalable`` (default: above SCALABLE_MIN_USERS) sweeps k on a sample.
+
+    The scaler, clustering and PCA fitted on unchanged users are loaded
+    from the model registry unless ``retrain`` is set.
+    """
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     print("🎯 User Segmentation Pipeline")
 
-    con = duckdb.connect(DB_PATH, read_only=True)
-    df = con.execute("""
-        SELECT user_id, engagement_score, lifetime_revenue, total_payments,
-               total_events, total_active_days
-        FROM marts.dim_users WHERE total_events > 0
-    """).fetchdf()
-    con.close()
-
     features = ["engagement_score", "lifetime_revenue", "total_payments",
                 "total_events", "total_active_days"]
-    X = df[features].fillna(0)
-
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-
-    # Find optimal k using silhouette
-    best_k, best_score = 5, -1
-    for k in range(3, 8):
-        km = KMeans(n_clusters=k, random_state=42, n_init=10)
-        labels = km.fit_predict(X_scaled)
-        score = silhouette_score(X_scaled, labels, sample_size=min(5000, len(X_scaled)))
-        if score > best_score:
-            best_k, best_score = k, score
-
-    # Final model
-    model = KMeans(n_clusters=best_k, random_state=42, n_init=10)
-    df["segment"] = model.fit_predict(X_scaled)
-
-    # PCA for viz
-    pca = PCA(n_components=2)
-    coords = pca.fit_transform(X_scaled)
+    users = load_columns("marts.dim_users", ["user_id", *features], where="total_events > 0", db_path=DB_PATH)
+    X = to_numpy(users, features)
+    df = pd.DataFrame(X, columns=features)
+
+    if scalable is None:
+        scalable = len(X) > SCALABLE_MIN_USERS
+    cached = registry.entry(__file__, ["marts.dim_users"], {"scalable": scalable}, db_path=DB_PATH)
+    loaded = None if retrain else cached.load()
+    if loaded:
+        (scaler, model, pca), metrics = loaded
+        best_k, best_score = metrics["n_clusters"], metrics["silhouette_score"]
+        X_scaled = scaler.transform(X)
+        print(f"  Loaded k={best_k} {type(model).__name__} from the registry")
+    else:
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
+        if scalable:
+            # Sweep on a sample stratified by paying status and engagement quartile
+            engagement = X[:, features.index("engagement_score")]
+            paying = X[:, features.index("total_payments")] > 0
+            quartile = np.digitize(engagement, np.quantile(engagement, [0.25, 0.5, 0.75]))
+            sample = stratified_sample(quartile * 2 + paying, SAMPLE_SIZE)
+            X_fit = X_scaled[sample]
+        else:
+            X_fit = X_scaled
+
+        # Find optimal k using silhouette, candidates in parallel; the winner is kept, not refit
+        best_k, model, labels, best_score, sweep = sweep_k(X_fit, scalable)
+        print(f"  k sweep on {len(X_fit):,} users ({'MiniBatchKMeans' if scalable else 'KMeans'})")
+
+        # PCA for viz
+        pca = PCA(n_components=2, random_state=42).fit(X_fit)
+        metrics = {
+            "n_clusters": best_k, "silhouette_score": round(float(best_score), 4), "scalable": scalable,
+            "k_sweep": sweep,
+        }
+        cached.save((scaler, model, pca), metrics)
+
+    if scalable or loaded:
+        df["segment"] = np.concatenate([
+            model.predict(X_scaled[i:i + CHUNK_ROWS]) for i in range(0, len(X_scaled), CHUNK_ROWS)
+        ]).astype(np.int32)
+    else:
+        df["segment"] = labels
+
+    coords = np.concatenate([pca.transform(X_scaled[i:i + CHUNK_ROWS]) for i in range(0, len(X_scaled), CHUNK_ROWS)])
     df["pca_x"], df["pca_y"] = coords[:, 0], coords[:, 1]
 
     # Segment profiles
@@ -77,13 +161,12 @@ def run() -> dict:
     df["segment_name"] = df["segment"].map(segment_names)
 
     # Save
-    con = duckdb.connect(DB_PATH)
-    con.execute("CREATE SCHEMA IF NOT EXISTS ml_outputs")
-    con.execute("DROP TABLE IF EXISTS ml_outputs.user_segments")
-    con.execute("CREATE TABLE ml_outputs.user_segments AS SELECT user_id, segment, segment_name, pca_x, pca_y FROM df")
-    con.close()
+    segments = pa.Table.from_pandas(df[["segment", "segment_name", "pca_x", "pca_y"]], preserve_index=False)
+    segments = segments.add_column(0, "user_id", users["user_id"])
+    with output_connection(DB_PATH) as con:
+        con.execute("DROP TABLE IF EXISTS ml_outputs.user_segments")
+        con.execute("CREATE TABLE ml_outputs.user_segments AS SELECT * FROM segments")
 
-    metrics = {"n_clusters": best_k, "silhouette_score": round(best_score, 4)}
     print(f"  ✓ {best_k} clusters | Silhouette: {best_score:.4f}")
     profiles.to_csv(OUTPUT_DIR / "segment_profiles.csv")
 
@@ -95,4 +178,12 @@ def run() -> dict:
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Segment users and save the segments.")
+    sweep = parser.add_mutually_exclusive_group()
+    sweep.add_argument("--scalable", dest="scalable", action="store_const", const=True,
+                       help="sweep k with MiniBatchKMeans on a stratified sample")
+    sweep.add_argument("--exact", dest="scalable", action="store_const", const=False,
+                       help=f"sweep k with KMeans on every user (default: up to {SCALABLE_MIN_USERS:,} users)")
+    parser.add_argument("--retrain", action="store_true", help="fit even if the registry has a matching model")
+    args = parser.parse_args()
+    run(args.scalable, args.retrain)
@@ -0,0 +1,140 @@
+"""Time dbt models against unclustered vs clustered raw tables.
+
+Loads the raw Parquet data twice into a scratch DuckDB database, once in
+file order and once sorted by CLUSTER_KEYS, and materializes the selected
+dbt models against each layout. Models are rendered directly from their
+SQL (only ``source``, ``ref`` and ``var`` are supported), so dbt itself is
+not needed.
+
+    python scripts/layout_report.py --models stg_events int_user_lifecycle churn_features
+"""
+import argparse
+import json
+import re
+import statistics
+import time
+from pathlib import Path
+
+import duckdb
+from load_to_duckdb import RAW_DIR, TABLES, configure, load_all
+
+DBT_DIR = Path("dbt_metricflow")
+SCRATCH_DB = "data/layout_report.duckdb"
+REPORT_PATH = Path("data/benchmarks/layout_report.json")
+SCHEMA = "models"
+DEFAULT_MODELS = [
+    "stg_events",
+    "stg_payments",
+    "int_user_lifecycle",
+    "int_revenue_normalized",
+    "churn_features",
+    "cohort_retention",
+]
+
+SOURCE_RE = re.compile(r"\{\{\s*source\('raw',\s*'(\w+)'\)\s*\}\}")
+REF_RE = re.compile(r"\{\{\s*ref\('(\w+)'\)\s*\}\}")
+VAR_RE = re.compile(r"\{\{\s*var\('(\w+)'\)\s*\}\}")
+
+
+def project_vars(dbt_dir):
+    """The ``vars:`` block of dbt_project.yml (flat scalars only)."""
+    text = (dbt_dir / "dbt_project.yml").read_text()
+    block = text.split("\nvars:", 1)[1] if "\nvars:" in text else ""
+    return dict(re.findall(r"^\s+(\w+):\s*'?([^'\n]*)'?\s*$", block, re.MULTILINE))
+
+
+def render_models(dbt_dir):
+    """``{model: sql}`` with source/ref/var resolved against the scratch schema.
+
+    Models using any other Jinja are left out.
+    """
+    variables = project_vars(dbt_dir)
+    models = {}
+    for path in sorted((dbt_dir / "models").rglob("*.sql")):
+        sql = SOURCE_RE.sub(r"main.\1", path.read_text())
+        sql = REF_RE.sub(rf"{SCHEMA}.\1", sql)
+        sql = VAR_RE.sub(lambda m: variables[m.group(1)], sql)
+        if "{{" not in sql and "{%" not in sql:
+            models[path.stem] = sql
+    return models
+
+
+def create_views(con, models, dbt_dir):
+    """Create every model (and referenced seed) as a view, parents first."""
+    con.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+    for seed in (dbt_dir / "seeds").glob("*.csv"):
+        con.execute(f"CREATE OR REPLACE VIEW {SCHEMA}.{seed.stem} AS SELECT * FROM read_csv_auto('{seed}')")
+    created = set()
+
+    def create(name):
+        if name in created or name not in models:
+            return
+        created.add(name)
+        for parent in re.findall(rf"{SCHEMA}\.(\w+)", models[name]):
+            create(parent)
+        con.execute(f"CREATE OR REPLACE VIEW {SCHEMA}.{name} AS {models[name]}")
+
+    for name in models:
+        create(name)
+
+
+def time_model(con, name, repeat):
+    """Best-of-``repeat`` seconds to materialize a model as a table, as dbt would."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        con.execute(f"CREATE OR REPLACE TEMP TABLE _timing AS SELECT * FROM {SCHEMA}.{name}")
+        runs.append(time.perf_counter() - start)
+    con.execute("DROP TABLE IF EXISTS _timing")
+    return min(runs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare dbt model timings on clustered vs unclustered raw tables.")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS, help="dbt models to time")
+    parser.add_argument("--all", action="store_true", help="time every renderable model")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per model; the fastest is reported")
+    parser.add_argument("--raw-dir", type=Path, default=RAW_DIR)
+    parser.add_argument("--dbt-dir", type=Path, default=DBT_DIR)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--memory-limit")
+    parser.add_argument("--output", type=Path, default=REPORT_PATH)
+    args = parser.parse_args(argv)
+
+    models = render_models(args.dbt_dir)
+    selected = list(models) if args.all else args.models
+    missing = [m for m in selected if m not in models]
+    if missing:
+        parser.error(f"unknown or unrenderable models: {', '.join(missing)}")
+
+    Path(SCRATCH_DB).parent.mkdir(parents=True, exist_ok=True)
+    con = duckdb.connect(SCRATCH_DB)
+    configure(con, args.threads, args.memory_limit)
+    timings = {}
+    try:
+        for layout, cluster in (("unclustered", False), ("clustered", True)):
+            print(f"Loading raw tables ({layout})...")
+            load_all(con, TABLES, args.raw_dir, full=True, cluster=cluster)
+            create_views(con, models, args.dbt_dir)
+            for name in selected:
+                timings.setdefault(name, {})[layout] = time_model(con, name, args.repeat)
+    finally:
+        con.close()
+        Path(SCRATCH_DB).unlink(missing_ok=True)
+        Path(f"{SCRATCH_DB}.wal").unlink(missing_ok=True)
+
+    print(f"\n{'model':<28} {'unclustered':>12} {'clustered':>12} {'speedup':>8}")
+    for name, t in timings.items():
+        t["speedup"] = t["unclustered"] / t["clustered"] if t["clustered"] else None
+        print(f"{name:<28} {t['unclustered']:>11.3f}s {t['clustered']:>11.3f}s {t['speedup'] or 0:>7.2f}x")
+    total = {layout: sum(t[layout] for t in timings.values()) for layout in ("unclustered", "clustered")}
+    print(f"{'total':<28} {total['unclustered']:>11.3f}s {total['clustered']:>11.3f}s "
+          f"{statistics.fmean([t['speedup'] for t in timings.values() if t['speedup']]):>7.2f}x (mean)")
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps({"repeat": args.repeat, "models": timings}, indent=2))
+    print(f"\nReport → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Run generate → load → dbt → ml as a cached DAG.
+
+Each stage is fingerprinted from what determines its output: the resolved
+GeneratorConfig and generator code, the raw Parquet files, the dbt
+project, the ML code, and the fingerprints of the stages it depends on.
+A stage whose fingerprint matches the last successful run is skipped, so
+editing one ML model only reruns that model. Stages whose dependencies
+are done run concurrently (the five ML models are independent), and every
+run writes a timing report.
+
+    python scripts/pipeline.py                      # default generator settings
+    python scripts/pipeline.py --jobs 3 -- --vectorized --num-users 10000
+    python scripts/pipeline.py --force ml_churn     # rerun a stage even though it is unchanged
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from data_generator.generate import parse_args
+
+STATE_PATH = Path("data/pipeline/state.json")
+REPORT_PATH = Path("data/pipeline/report.json")
+LOG_DIR = Path("data/pipeline/logs")
+DB_PATH = Path("data/metricflow.duckdb")
+ML_MODULES = {
+    "ml_churn": "churn_model",
+    "ml_ltv": "ltv_model",
+    "ml_segmentation": "segmentation",
+    "ml_anomaly": "anomaly_detection",
+    "ml_forecast": "forecasting",
+}
+
+
+@dataclass
+class Stage:
+    name: str
+    commands: list[list[str]]
+    deps: list[str] = field(default_factory=list)
+    code: list[str] = field(default_factory=list)  # globs, relative to the repo root
+    data: list[str] = field(default_factory=list)  # globs hashed at run time, after deps finish
+    config: str = ""
+    outputs: list[Path] = field(default_factory=list)  # must exist for a cached stage to be skipped
+    cwd: Path | None = None
+    setup: list[tuple[Path, list[str]]] = field(default_factory=list)  # (unless exists, command); not fingerprinted
+
+
+class Hasher:
+    """Content hashes of files, reusing a cached digest while size and mtime match."""
+
+    def __init__(self, cache: dict):
+        self.cache = cache
+
+    def file(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path.resolve())
+        cached = self.cache.get(key)
+        if cached and cached[:2] == [stat.st_size, stat.st_mtime]:
+            return cached[2]
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            while block := f.read(1 << 20):
+                digest.update(block)
+        self.cache[key] = [stat.st_size, stat.st_mtime, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def globs(self, base: Path, patterns: list[str]) -> list[tuple[str, str]]:
+        files = sorted({p for pattern in patterns for p in base.glob(pattern) if p.is_file()})
+        return [(str(p.relative_to(base)), self.file(p)) for p in files]
+
+
+def build_stages(gen_argv: list[str], dbt_test: bool) -> list[Stage]:
+    cfg, _ = parse_args(gen_argv)
+    python = sys.executable
+    dbt = [["dbt", "seed"], ["dbt", "run"]] + ([["dbt", "test"]] if dbt_test else [])
+    stages = [
+        Stage(
+            "generate",
+            [[python, "-m", "data_generator.generate", *gen_argv]],
+            code=["data_generator/*.py"],
+            config=repr(cfg),
+            outputs=[Path(cfg.output_dir)],
+        ),
+        Stage(
+            "load",
+            [[python, str(ROOT / "scripts" / "load_to_duckdb.py"), "--raw-dir", cfg.output_dir]],
+            deps=["generate"],
+            code=["scripts/load_to_duckdb.py"],
+            data=[f"{cfg.output_dir}/**/*.parquet"],
+            outputs=[DB_PATH],
+        ),
+        Stage(
+            "dbt",
+            dbt,
+            deps=["load"],
+            code=["dbt_metricflow/*.yml", "dbt_metricflow/models/**/*", "dbt_metricflow/macros/**/*",
+                  "dbt_metricflow/tests/**/*", "dbt_metricflow/seeds/*"],
+            config=repr(dbt),
+            cwd=Path("dbt_metricflow"),
+            # packages.yml is hashed with the project; deps only needs the network once
+            setup=[(Path("dbt_metricflow/dbt_packages"), ["dbt", "deps"])],
+        ),
+    ]
+    for name, module in ML_MODULES.items():
+        stages.append(Stage(
+            name,
+            [[python, "-m", f"ml_pipeline.{module}"]],
+            deps=["dbt"],
+            code=[f"ml_pipeline/{module}.py", "ml_pipeline/__init__.py", "ml_pipeline/db.py",
+                  "ml_pipeline/features.py", "ml_pipeline/registry.py"],
+        ))
+    return stages
+
+
+def fingerprint(stage: Stage, hasher: Hasher, upstream: dict[str, str]) -> str:
+    payload = {
+        "commands": stage.commands,
+        "config": stage.config,
+        "code": hasher.globs(ROOT, stage.code),
+        "data": hasher.globs(Path.cwd(), stage.data),
+        "deps": {dep: upstream[dep] for dep in stage.deps},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def run_stage(stage: Stage) -> float:
+    """Run a stage's commands in order, logging to data/pipeline/logs; returns seconds."""
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")]))}
+    start = time.perf_counter()
+    commands = [command for unless, command in stage.setup if not unless.exists()] + stage.commands
+    with open(LOG_DIR / f"{stage.name}.log", "w") as log:
+        for command in commands:
+            log.write(f"$ {' '.join(command)}\n")
+            log.flush()
+            subprocess.run(command, cwd=stage.cwd, stdout=log, stderr=subprocess.STDOUT, env=env, check=True)
+    return time.perf_counter() - start
+
+
+def run_pipeline(stages: list[Stage], jobs: int = 2, force: set[str] = frozenset()) -> dict:
+    """Run the DAG; returns the report and updates the fingerprint state.
+
+    A stage is skipped when its fingerprint matches the stored one and its
+    outputs exist. Forcing a stage reruns it; dependents rerun only if their
+    own inputs changed, e.g. ``load`` when the regenerated files differ.
+    Dependents of a failed stage are reported as blocked.
+    """
+    state = json.loads(STATE_PATH.read_text()) if STATE_PATH.exists() else {}
+    done = state.setdefault("stages", {})
+    hasher = Hasher(state.setdefault("files", {}))
+    by_name = {s.name: s for s in stages}
+    fingerprints, results = {}, {}
+    pending = list(by_name)
+    running = {}
+    started = time.perf_counter()
+
+    def save():
+        STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        STATE_PATH.write_text(json.dumps(state, indent=2))
+
+    def ready(name):
+        return all(dep in fingerprints for dep in by_name[name].deps)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            for name in [n for n in pending if any(results.get(d, {}).get("status") in ("failed", "blocked")
+                                                   for d in by_name[n].deps)]:
+                pending.remove(name)
+                results[name] = {"status": "blocked", "seconds": 0.0}
+            for name in [n for n in pending if ready(n)]:
+                pending.remove(name)
+                stage = by_name[name]
+                fp = fingerprint(stage, hasher, fingerprints)
+                cached = done.get(name) == fp and all(p.exists() for p in stage.outputs)
+                if cached and name not in force:
+                    fingerprints[name] = fp
+                    results[name] = {"status": "skipped", "seconds": 0.0, "fingerprint": fp}
+                    print(f"  = {name}: unchanged, skipped")
+                    continue
+                print(f"  ▶ {name}")
+                running[pool.submit(run_stage, stage)] = (name, fp, time.perf_counter() - started)
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, fp, offset = running.pop(future)
+                try:
+                    seconds = future.result()
+                except subprocess.CalledProcessError as e:
+                    done.pop(name, None)
+                    results[name] = {"status": "failed", "seconds": time.perf_counter() - started - offset,
+                                     "error": f"exit code {e.returncode}, see {LOG_DIR / (name + '.log')}"}
+                    print(f"  ✗ {name}: failed ({results[name]['error']})")
+                    continue
+                # Only a successful run is cached; a failed stage reruns next time
+                fingerprints[name] = done[name] = fp
+                results[name] = {"status": "ran", "seconds": seconds, "started_at": offset, "fingerprint": fp}
+                print(f"  ✓ {name}: {seconds:.1f}s")
+                save()
+
+    save()
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "wall_seconds": round(time.perf_counter() - started, 3),
+        "stages": {name: results[name] for name in by_name},
+    }
+    REPORT_PATH.write_text(json.dumps(report, indent=2))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the MetricFlow pipeline, skipping stages whose inputs are unchanged.",
+        epilog="Arguments after -- are passed to data_generator.generate.",
+    )
+    parser.add_argument("--jobs", type=int, default=2, help="stages run concurrently")
+    parser.add_argument("--force", nargs="*", default=[], metavar="STAGE", help="rerun these stages")
+    parser.add_argument("--only", nargs="*", metavar="STAGE",
+                        help="run just these stages (and their dependencies)")
+    parser.add_argument("--dbt-test", action="store_true", help="also run dbt test in the dbt stage")
+    argv = sys.argv[1:] if argv is None else argv
+    gen_argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    args = parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+
+    stages = build_stages(gen_argv, args.dbt_test)
+    names = {s.name for s in stages}
+    unknown = (set(args.force) | set(args.only or ())) - names
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    if args.only:
+        keep, todo = set(), list(args.only)
+        while todo:
+            name = todo.pop()
+            if name not in keep:
+                keep.add(name)
+                todo.extend(next(s for s in stages if s.name == name).deps)
+        stages = [s for s in stages if s.name in keep]
+
+    print("━━━ MetricFlow Pipeline ━━━")
+    report = run_pipeline(stages, args.jobs, set(args.force))
+    print(f"\n{'stage':<18} {'status':<8} {'seconds':>9}")
+    for name, r in report["stages"].items():
+        print(f"{name:<18} {r['status']:<8} {r['seconds']:>9.1f}")
+    print(f"{'total':<18} {'':<8} {report['wall_seconds']:>9.1f}")
+    print(f"\nReport → {REPORT_PATH}")
+    return 1 if any(r["status"] in ("failed", "blocked") for r in report["stages"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
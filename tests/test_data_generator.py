@@ -1,7 +1,31 @@
 """Tests for data generator."""
+from datetime import date
+
+import duckdb
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from data_generator.benchmark import STAGES, bench_scale, compare, run_benchmark
 from data_generator.config import GeneratorConfig
-from data_generator.generate import generate_users, generate_subscriptions
+from data_generator.generate import (
+    DATASETS,
+    ID_COLUMNS,
+    KeySpace,
+    append,
+    dataset_files,
+    generate_and_load,
+    generate_events_and_sessions,
+    generate_payments,
+    generate_shard,
+    generate_subscriptions,
+    generate_users,
+    iter_event_chunks,
+    parse_args,
+    run,
+    write_events_parquet,
+)
 
 
 def test_generate_users_count():
@@ -37,3 +61,214 @@ def test_plan_names_valid():
     subs = generate_subscriptions(users, cfg)
     valid_plans = set(cfg.plans.keys())
     assert set(subs["plan"]).issubset(valid_plans)
+
+
+def test_vectorized_users_match_schema():
+    legacy = generate_users(GeneratorConfig(num_users=50))
+    columnar = generate_users(GeneratorConfig(num_users=50, vectorized=True))
+    assert list(columnar.columns) == list(legacy.columns)
+    assert columnar.dtypes.equals(legacy.dtypes)
+
+
+def test_vectorized_users_unique_and_in_range():
+    cfg = GeneratorConfig(num_users=2000, vectorized=True)
+    users = generate_users(cfg)
+    assert users["user_id"].is_unique
+    assert users["email"].is_unique
+    assert users["signup_date"].min() >= cfg.history_start
+    assert users["signup_date"].max() <= cfg.history_end
+    assert set(users["initial_plan"]).issubset(set(cfg.plans.keys()))
+
+
+def test_vectorized_subscriptions_chain_per_user():
+    cfg = GeneratorConfig(num_users=500, vectorized=True)
+    users = generate_users(cfg)
+    subs = generate_subscriptions(users, cfg)
+    assert set(subs["user_id"]).issubset(set(users["user_id"]))
+    assert set(subs["plan"]).issubset(set(cfg.plans.keys()))
+    # At most one open subscription per user, and it is the latest one
+    assert not subs[subs["ended_at"].isna()]["user_id"].duplicated().any()
+    last = subs.groupby("user_id", sort=False).tail(1)
+    assert (subs[subs["change_type"] == "active"].index.isin(last.index)).all()
+
+
+def test_vectorized_payment_schedule_matches_loop():
+    legacy_cfg = GeneratorConfig(num_users=200)
+    users = generate_users(legacy_cfg)
+    subs = generate_subscriptions(users, legacy_cfg)
+    legacy = generate_payments(subs, legacy_cfg)
+    columnar = generate_payments(subs, GeneratorConfig(num_users=200, vectorized=True))
+    key = ["subscription_id", "payment_date"]
+    assert columnar[key].sort_values(key).values.tolist() == legacy[key].sort_values(key).values.tolist()
+    assert list(columnar.columns) == list(legacy.columns)
+
+
+def test_streamed_events_written_in_row_groups(tmp_path):
+    cfg = GeneratorConfig(num_users=20, vectorized=True, events_chunk_users=5)
+    users = generate_users(cfg)
+    subs = generate_subscriptions(users, cfg)
+    path = tmp_path / "events.parquet"
+    rows = write_events_parquet(iter_event_chunks(users, subs, cfg), tmp_path, cfg)
+    events = pd.read_parquet(path)
+    sessions = pd.read_parquet(tmp_path / "sessions.parquet")
+    assert len(events) == rows["events"]
+    assert len(sessions) == rows["sessions"]
+    assert pq.ParquetFile(path).metadata.num_row_groups > 1
+    assert pq.ParquetFile(tmp_path / "sessions.parquet").metadata.num_row_groups > 1
+    assert set(events["user_id"]).issubset(set(users["user_id"]))
+    assert sessions["event_count"].sum() == rows["events"]
+
+
+def test_loop_engine_chunk_without_events_is_empty(tmp_path):
+    cfg = GeneratorConfig(num_users=5, stream_events=True, events_chunk_users=1)
+    users = generate_users(cfg)
+    users.loc[0, "signup_date"] = cfg.history_end
+    subs = generate_subscriptions(users, cfg)
+    events, sessions = next(iter_event_chunks(users, subs, cfg))
+    assert events.empty and "user_id" in events.columns
+    assert sessions.empty and "session_id_unique" in sessions.columns
+    rows = write_events_parquet(iter_event_chunks(users, subs, cfg), tmp_path, cfg)
+    assert len(pd.read_parquet(tmp_path / "events.parquet")) == rows["events"] > 0
+
+
+def test_chunks_tolerate_repeated_user_ids():
+    cfg = GeneratorConfig(num_users=12, vectorized=True, events_chunk_users=4)
+    users = generate_users(cfg)
+    users.loc[9, "user_id"] = users.loc[2, "user_id"]
+    subs = generate_subscriptions(users, cfg)
+    chunks = list(iter_event_chunks(users, subs, cfg))
+    assert len(chunks) == 3
+    owners = [set(events["user_id"]) for events, _ in chunks]
+    assert users.loc[2, "user_id"] in owners[0]
+    assert not any(users.loc[2, "user_id"] in o for o in owners[1:])
+    assert sum(len(events) for events, _ in chunks) > 0
+
+
+def test_streaming_peak_memory_is_flat_in_user_count():
+    cfg = GeneratorConfig(vectorized=True, stream_events=True, events_chunk_users=50)
+    results = run_benchmark(cfg, [250, 1000])["results"]
+    small, large = (results[scale]["events"]["peak_rss_mb"] for scale in ("250", "1000"))
+    assert results["1000"]["events"]["rows"] > 3 * results["250"]["events"]["rows"]
+    assert large < small * 1.2
+
+
+def test_cli_rejects_no_parquet_without_duckdb(capsys):
+    with pytest.raises(SystemExit):
+        parse_args(["--no-parquet"])
+    assert "--no-parquet requires --duckdb" in capsys.readouterr().err
+    assert not parse_args(["--no-parquet", "--duckdb"])[0].write_parquet
+
+
+def test_cli_sets_events_chunk_users():
+    cfg, _ = parse_args(["--stream-events", "--events-chunk-users", "250"])
+    assert cfg.stream_events and cfg.events_chunk_users == 250
+    assert parse_args([])[0].events_chunk_users == GeneratorConfig.events_chunk_users
+
+
+def test_inline_sessions_match_their_events():
+    cfg = GeneratorConfig(num_users=60, vectorized=True, id_format="int")
+    rng, keys = np.random.default_rng(3), KeySpace("int")
+    users = generate_users(cfg, rng, keys)
+    events, sessions = generate_events_and_sessions(users, generate_subscriptions(users, cfg, rng, keys), cfg, rng, keys)
+    grouped = events.groupby("session_id").agg(
+        start=("event_timestamp", "min"), end=("event_timestamp", "max"), count=("event_id", "count"),
+    )
+    sessions = sessions.set_index("session_id").join(grouped)
+    assert len(sessions) == len(grouped)
+    assert (sessions["start"] == sessions["session_start"]).all()
+    assert (sessions["end"] == sessions["session_end"]).all()
+    assert (sessions["count"] == sessions["event_count"]).all()
+    assert sessions["session_id_unique"].is_unique
+
+
+def test_shards_are_deterministic_per_seed(tmp_path):
+    first = GeneratorConfig(num_users=12, output_dir=str(tmp_path / "a"))
+    second = GeneratorConfig(num_users=12, output_dir=str(tmp_path / "b"))
+    assert generate_shard(first, 1, 3) == generate_shard(second, 1, 3)
+    for name in DATASETS:
+        a = pd.read_parquet(tmp_path / "a" / name / "shard-00001.parquet")
+        b = pd.read_parquet(tmp_path / "b" / name / "shard-00001.parquet")
+        pd.testing.assert_frame_equal(a, b)
+
+
+def test_sequential_keys_and_categoricals():
+    cfg = GeneratorConfig(num_users=100, id_format="int", categorical=True)
+    users = generate_users(cfg)
+    subs = generate_subscriptions(users, cfg)
+    assert users["user_id"].dtype == "int64"
+    assert users["user_id"].tolist() == list(range(1, 101))
+    assert subs["subscription_id"].is_unique
+    assert isinstance(subs["plan"].dtype, pd.CategoricalDtype)
+    assert set(subs["user_id"]).issubset(set(users["user_id"]))
+
+
+def test_hex_keys_are_shard_prefixed():
+    rng = np.random.default_rng(0)
+    first = KeySpace("hex", shard=0).take("users", 3, rng)
+    second = KeySpace("hex", shard=1).take("users", 3, rng)
+    assert list(first) == ["0000000000000001", "0000000000000002", "0000000000000003"]
+    assert not set(first) & set(second)
+
+
+def test_append_extends_history(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    base = GeneratorConfig(num_users=30, id_format="int", history_end=date(2025, 6, 30), output_dir="raw")
+    run(base)
+    append(GeneratorConfig(num_users=30, history_end=date(2025, 12, 31), output_dir="raw"))
+
+    def read(name):
+        return pd.concat([pd.read_parquet(f) for f in dataset_files(tmp_path / "raw", name)])
+
+    for name in ("users", "payments", "events"):
+        assert read(name)[ID_COLUMNS[name]].is_unique
+    subs = read("subscriptions")
+    assert subs["subscription_id"].is_unique
+    assert not subs[subs["ended_at"].isna()]["user_id"].duplicated().any()
+    new_payments = pd.read_parquet(tmp_path / "raw" / "payments" / "append-20251231.parquet")
+    assert new_payments["payment_date"].min() >= date(2025, 6, 30)
+
+
+def test_partitioned_sorted_output(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cfg = GeneratorConfig(
+        num_users=40, vectorized=True, stream_events=True, events_chunk_users=15, output_dir=str(tmp_path),
+        partition_output=True, sort_output=True, row_group_size=500,
+    )
+    run(cfg)
+    months = sorted(p.name for p in (tmp_path / "events").iterdir())
+    assert months and all(m.startswith("event_month=") for m in months)
+    for path in dataset_files(tmp_path, "events"):
+        month = path.parent.name.split("=")[1]
+        events = pd.read_parquet(path)
+        assert (events["event_timestamp"].dt.strftime("%Y-%m") == month).all()
+        assert events["user_id"].is_monotonic_increasing
+        assert all(pq.ParquetFile(path).metadata.row_group(i).num_rows <= 500
+                   for i in range(pq.ParquetFile(path).num_row_groups))
+    users = pd.read_parquet(tmp_path / "users.parquet")
+    assert users["user_id"].is_monotonic_increasing
+
+
+def test_benchmark_measures_every_stage_and_flags_regressions():
+    results = bench_scale(GeneratorConfig(num_users=50, vectorized=True))
+    assert list(results) == STAGES
+    assert all(r["rows"] > 0 and r["peak_rss_mb"] > 0 for r in results.values())
+    current = {"results": {"50": results}}
+    assert compare(current, current) == []
+    faster = {"results": {"50": {"events": {**results["events"], "rows_per_sec": results["events"]["rows_per_sec"] * 2}}}}
+    assert [line.split(" @")[0] for line in compare(current, faster)] == ["events"]
+
+
+def test_generate_and_load_skips_parquet(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cfg = GeneratorConfig(
+        num_users=40, vectorized=True, categorical=True, stream_events=True, events_chunk_users=15,
+        write_parquet=False, output_dir="raw",
+    )
+    generate_and_load(cfg, "metricflow.duckdb")
+    assert not (tmp_path / "raw").exists() or not any((tmp_path / "raw").rglob("*.parquet"))
+    con = duckdb.connect("metricflow.duckdb", read_only=True)
+    assert con.sql("SELECT count(*) FROM users").fetchone()[0] == 40
+    sessions = con.sql("SELECT count(*), sum(event_count) FROM sessions").fetchone()
+    assert sessions[1] == con.sql("SELECT count(*) FROM events").fetchone()[0]
+    types = dict(row[:2] for row in con.sql("DESCRIBE events").fetchall())
+    assert types["platform"] == "VARCHAR"
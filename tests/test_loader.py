@@ -0,0 +1,187 @@
+"""Tests for the raw Parquet loader."""
+import os
+import sys
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from layout_report import create_views, render_models, time_model
+from load_to_duckdb import (
+    MANIFEST,
+    configure,
+    ensure_manifest,
+    load_all,
+    load_table,
+    main,
+)
+
+
+def write_part(path: Path, first: int, rows: int = 10) -> Path:
+    """A Parquet file of ``rows`` payments starting at ``payment_id`` ``first``."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(pa.table({
+        "payment_id": pa.array(range(first, first + rows), pa.int64()),
+        "user_id": pa.array([i % 3 for i in range(first, first + rows)], pa.int64()),
+        "payment_date": pa.array([f"2024-0{1 + i % 3}-01" for i in range(rows)]).cast(pa.date32()),
+        "amount": pa.array([float(i) for i in range(rows)]),
+    }), path)
+    return path
+
+
+@pytest.fixture
+def con(tmp_path):
+    con = duckdb.connect(str(tmp_path / "metricflow.duckdb"))
+    ensure_manifest(con)
+    yield con
+    con.close()
+
+
+@pytest.fixture
+def raw(tmp_path):
+    raw = tmp_path / "raw"
+    write_part(raw / "payments.parquet", 0)
+    return raw
+
+
+def manifest_paths(con) -> list[str]:
+    rows = con.execute(f"SELECT path FROM {MANIFEST} WHERE table_name = 'payments' ORDER BY path").fetchall()
+    return [Path(path).name for path, in rows]
+
+
+def count(con) -> int:
+    return con.execute("SELECT count(*) FROM payments").fetchone()[0]
+
+
+def test_first_load_creates_table_and_manifest(con, raw):
+    assert load_table(con, "payments", raw)["action"] == "created"
+    assert count(con) == 10
+    assert manifest_paths(con) == ["payments.parquet"]
+    assert load_table(con, "users", raw) is None
+
+
+def test_unchanged_files_are_skipped(con, raw):
+    load_table(con, "payments", raw)
+    assert load_table(con, "payments", raw) == {"action": "skipped", "rows": 0, "seconds": 0.0, "bytes": 0}
+
+    # A touched file with the same content is still skipped, and its new mtime recorded
+    path = raw / "payments.parquet"
+    os.utime(path, (path.stat().st_atime, path.stat().st_mtime + 60))
+    assert load_table(con, "payments", raw)["action"] == "skipped"
+    mtime = con.execute(f"SELECT mtime FROM {MANIFEST} WHERE table_name = 'payments'").fetchone()[0]
+    assert mtime == path.stat().st_mtime
+    assert count(con) == 10
+
+
+def test_new_parts_are_appended(con, raw):
+    load_table(con, "payments", raw)
+    write_part(raw / "payments" / "append-20240401.parquet", 100, rows=5)
+    stats = load_table(con, "payments", raw)
+    assert (stats["action"], stats["rows"]) == ("appended", 5)
+    assert count(con) == 15
+    assert manifest_paths(con) == ["payments.parquet", "append-20240401.parquet"]
+
+
+def test_changed_file_rebuilds(con, raw):
+    load_table(con, "payments", raw)
+    write_part(raw / "payments.parquet", 0, rows=7)
+    stats = load_table(con, "payments", raw)
+    assert (stats["action"], stats["rows"]) == ("created", 7)
+    assert count(con) == 7
+
+
+def test_removed_file_rebuilds(con, raw):
+    write_part(raw / "payments" / "shard-00001.parquet", 100, rows=5)
+    load_table(con, "payments", raw)
+    assert count(con) == 15
+    (raw / "payments" / "shard-00001.parquet").unlink()
+    assert load_table(con, "payments", raw)["action"] == "created"
+    assert count(con) == 10
+    assert manifest_paths(con) == ["payments.parquet"]
+
+
+def test_cluster_order_change_rebuilds(con, raw):
+    load_table(con, "payments", raw)
+    assert load_table(con, "payments", raw, cluster=True)["action"] == "created"
+    assert load_table(con, "payments", raw, cluster=True)["action"] == "skipped"
+    assert load_table(con, "payments", raw)["action"] == "created"
+
+
+def test_table_without_manifest_rows_rebuilds(con, raw):
+    con.execute("CREATE TABLE payments AS SELECT 1 AS payment_id")
+    stats = load_table(con, "payments", raw)
+    assert (stats["action"], stats["rows"]) == ("created", 10)
+    assert count(con) == 10
+
+
+def test_full_rebuilds_unchanged_files(con, raw):
+    load_table(con, "payments", raw)
+    assert load_table(con, "payments", raw, full=True)["action"] == "created"
+    assert manifest_paths(con) == ["payments.parquet"]
+
+
+def test_load_all_loads_tables_concurrently(tmp_path, raw):
+    for table, first in (("events", 200), ("sessions", 300), ("users", 400)):
+        write_part(raw / table / "shard-00000.parquet", first, rows=first // 100)
+    con = duckdb.connect(str(tmp_path / "concurrent.duckdb"))
+    tables = ["users", "events", "subscriptions", "payments", "sessions"]
+    results = load_all(con, tables, raw, workers=3)
+    assert list(results) == tables
+    assert results["subscriptions"] is None
+    assert {t: r["rows"] for t, r in results.items() if r} == {"users": 4, "events": 2, "payments": 10, "sessions": 3}
+    assert all(r["action"] == "skipped" for r in load_all(con, tables, raw, workers=3).values() if r)
+    con.close()
+
+
+def test_configure_applies_resource_settings(tmp_path):
+    con = duckdb.connect()
+    configure(con, threads=2, memory_limit="512MB", temp_directory=tmp_path / "spill")
+    assert con.execute("SELECT current_setting('threads')").fetchone()[0] == 2
+    assert con.execute("SELECT current_setting('memory_limit')").fetchone()[0].endswith("MiB")
+    assert (tmp_path / "spill").is_dir()
+    configure(con)
+    assert con.execute("SELECT current_setting('threads')").fetchone()[0] == 2
+
+
+def test_main_loads_every_dataset(tmp_path, raw, capsys):
+    db = tmp_path / "cli.duckdb"
+    main(["--db", str(db), "--raw-dir", str(raw), "--workers", "2", "--threads", "1"])
+    assert "payments: created 10 rows" in capsys.readouterr().out
+    con = duckdb.connect(str(db), read_only=True)
+    assert con.execute("SELECT count(*) FROM payments").fetchone()[0] == 10
+    con.close()
+
+
+def test_cluster_stores_rows_in_cluster_key_order(con, raw):
+    write_part(raw / "payments" / "shard-00001.parquet", 100, rows=8)
+    load_table(con, "payments", raw, cluster=True)
+    rows = con.execute("SELECT payment_date, user_id FROM payments").fetchall()
+    assert rows == sorted(rows)
+    assert con.execute(f"SELECT DISTINCT sort_order FROM {MANIFEST}").fetchall() == [("payment_date, user_id",)]
+
+
+def test_layout_report_renders_and_times_models(tmp_path, con, raw):
+    dbt = tmp_path / "dbt"
+    (dbt / "models" / "marts").mkdir(parents=True)
+    (dbt / "seeds").mkdir()
+    (dbt / "dbt_project.yml").write_text("name: test\nvars:\n  min_amount: 3\n")
+    (dbt / "models" / "stg_payments.sql").write_text(
+        "SELECT * FROM {{ source('raw', 'payments') }} WHERE amount >= {{ var('min_amount') }}"
+    )
+    (dbt / "models" / "marts" / "revenue.sql").write_text(
+        "SELECT user_id, sum(amount) AS revenue FROM {{ ref('stg_payments') }} GROUP BY 1"
+    )
+    (dbt / "models" / "incremental.sql").write_text("{{ config(materialized='incremental') }} SELECT 1")
+
+    models = render_models(dbt)
+    assert sorted(models) == ["revenue", "stg_payments"]
+    assert models["stg_payments"] == "SELECT * FROM main.payments WHERE amount >= 3"
+
+    load_table(con, "payments", raw)
+    create_views(con, models, dbt)
+    assert con.execute("SELECT sum(revenue) FROM models.revenue").fetchone()[0] == sum(range(3, 10))
+    assert time_model(con, "revenue", repeat=2) >= 0
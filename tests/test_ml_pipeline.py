@@ -0,0 +1,389 @@
+"""Tests for the ML pipelines."""
+import json
+import os
+import sys
+import time
+import types
+from datetime import date, timedelta
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml_pipeline import (
+    anomaly_detection,
+    churn_model,
+    forecasting,
+    ltv_model,
+    registry,
+    run_all,
+    scoring,
+    segmentation,
+)
+
+USERS = 400
+
+
+def _value(column: str, scale: int = 100) -> str:
+    """A deterministic pseudo-random feature value per user."""
+    return f"(hash(i, '{column}') % {scale})::DOUBLE"
+
+
+@pytest.fixture
+def warehouse(tmp_path, monkeypatch):
+    """A small warehouse at the pipelines' default path, with tmp_path as the working directory."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    con = duckdb.connect("data/metricflow.duckdb")
+    con.execute("CREATE SCHEMA intermediate")
+    con.execute("""
+        CREATE TABLE intermediate.int_revenue_normalized AS
+        SELECT DATE '2024-01-01' + (i % 90)::INTEGER AS payment_date,
+               'u' || (i % 37) AS user_id,
+               10.0 + (i * 7919) % 90 AS recognized_mrr,
+               CASE WHEN i % 25 = 0 THEN 'failed' ELSE 'succeeded' END AS payment_status
+        FROM range(2000) t(i)
+    """)
+    con.execute("CREATE SCHEMA advanced")
+    churn = ", ".join(f"{_value(c)} AS {c}" for c in churn_model.FEATURE_COLS)
+    con.execute(f"""
+        CREATE TABLE advanced.churn_features AS
+        SELECT 'u' || i AS user_id, {churn},
+               ({_value('days_inactive')} + {_value('noise', 40)} > 70)::INTEGER AS is_churned
+        FROM range({USERS}) t(i)
+    """)
+    numeric = ", ".join(f"{_value(c)} AS {c}" for c in ltv_model.NUMERIC_COLS)
+    con.execute(f"""
+        CREATE TABLE advanced.ltv_features AS
+        SELECT 'u' || i AS user_id, {numeric},
+               ['organic', 'paid_search', 'referral'][1 + i % 3] AS acquisition_channel,
+               ['1-10', '11-50', '51-200'][1 + i % 3] AS company_size,
+               10 * {_value('engagement_score')} + {_value('noise', 50)} AS lifetime_revenue
+        FROM range({USERS}) t(i)
+    """)
+    con.close()
+    return tmp_path
+
+
+def _entry(params: dict | None = None, name: str | None = None) -> registry.Entry:
+    return registry.entry(
+        anomaly_detection.__file__, ["intermediate.int_revenue_normalized"], params or {}, name=name,
+    )
+
+
+def test_registry_key_tracks_tables_and_params(warehouse):
+    first = _entry()
+    assert first.load() is None
+    first.save({"weights": [1, 2]}, {"score": 0.5})
+    assert _entry().path == first.path
+    assert _entry().load() == ({"weights": [1, 2]}, {"score": 0.5})
+    assert json.loads((first.path / "meta.json").read_text())["tables"] == first.meta["tables"]
+
+    assert _entry({"depth": 3}).path != first.path
+    con = duckdb.connect("data/metricflow.duckdb")
+    con.execute("UPDATE intermediate.int_revenue_normalized SET recognized_mrr = 0 WHERE user_id = 'u1'")
+    con.close()
+    assert _entry().path != first.path
+    assert _entry().load() is None
+
+
+def test_registry_prunes_and_finds_latest(warehouse):
+    for depth in range(registry.KEEP_ENTRIES + 2):
+        _entry({"depth": depth}).save(depth, {})
+    root = warehouse / registry.REGISTRY_DIR / "anomaly_detection"
+    assert len([p for p in root.iterdir() if p.is_dir()]) == registry.KEEP_ENTRIES
+    assert registry.latest(anomaly_detection.__file__).load()[0] == registry.KEEP_ENTRIES + 1
+
+    # Loading an entry makes it the latest; named entries are kept and pruned apart
+    os.utime(_entry({"depth": 3}).path, (0, 0))
+    _entry({"depth": 3}).load()
+    assert registry.latest(anomaly_detection.__file__).load()[0] == 3
+    _entry(name="series").save("named", {})
+    assert registry.latest(anomaly_detection.__file__, name="series").load()[0] == "named"
+    assert registry.latest(anomaly_detection.__file__, name="other") is None
+
+
+def test_anomaly_registry_hit_keeps_fit_date(warehouse):
+    assert anomaly_detection.run("full")["total_days"] == 90
+    entry = registry.latest(anomaly_detection.__file__)
+    saved, metrics = entry.load()
+    assert saved["fitted_on"] == date.today()
+    assert not (warehouse / "ml_pipeline" / "outputs" / "anomaly_model.joblib").exists()
+
+    # A full run over the same history reuses the model without resetting its age
+    stale = date.today() - timedelta(days=anomaly_detection.REFIT_DAYS)
+    entry.save({**saved, "fitted_on": stale}, metrics)
+    assert anomaly_detection.run("auto")["mode"] == "full"
+    assert registry.latest(anomaly_detection.__file__).load()[0]["fitted_on"] == stale
+
+    anomaly_detection.run(retrain=True)
+    assert registry.latest(anomaly_detection.__file__).load()[0]["fitted_on"] == date.today()
+    assert anomaly_detection.run("auto") == {
+        "mode": "incremental", "total_days": 0, "anomalies_detected": 0, "anomaly_rate": 0.0,
+    }
+
+
+def _scores(table: str, column: str) -> dict:
+    con = duckdb.connect("data/metricflow.duckdb", read_only=True)
+    try:
+        return dict(con.execute(f"SELECT user_id, {column} FROM {table}").fetchall())
+    finally:
+        con.close()
+
+
+def test_batch_scores_match_training_out_of_fold(warehouse):
+    churn_model.run()
+    ltv_model.run()
+    trained = _scores("ml_outputs.churn_predictions", "churn_probability")
+    trained_ltv = _scores("ml_outputs.ltv_predictions", "predicted_ltv")
+
+    metrics = scoring.run(batch_size=150)
+    assert metrics["churn"]["users_scored"] == metrics["ltv"]["users_scored"] == USERS
+    assert metrics["churn"]["batches"] == 3
+    assert _scores("ml_outputs.churn_predictions", "churn_probability") == pytest.approx(trained)
+    assert _scores("ml_outputs.ltv_predictions", "predicted_ltv") == pytest.approx(trained_ltv)
+
+
+def test_changed_only_scores_changed_and_new_users(warehouse):
+    churn_model.run()
+    scoring.run(("churn",))
+    before = _scores("ml_outputs.churn_predictions", "churn_probability")
+
+    con = duckdb.connect("data/metricflow.duckdb")
+    con.execute("UPDATE advanced.churn_features SET days_inactive = days_inactive + 30 WHERE user_id IN ('u1', 'u2')")
+    con.execute("""
+        INSERT INTO advanced.churn_features
+        SELECT * REPLACE ('new' AS user_id) FROM advanced.churn_features LIMIT 1
+    """)
+    con.close()
+
+    assert scoring.run(("churn",), changed_only=True)["churn"]["users_scored"] == 3
+    after = _scores("ml_outputs.churn_predictions", "churn_probability")
+    assert len(after) == USERS + 1
+    assert {u for u in before if after[u] != before[u]} <= {"u1", "u2"}
+    assert 0 <= after["new"] <= 1
+
+    # A training user is rescored by the fold model that held it out, not an in-sample average
+    models, holdout = registry.latest(churn_model.__file__).load()[0]
+    features = churn_model.load_features()
+    X, _, _ = churn_model.prepare_data(features)
+    model = models[holdout["u1"]]
+    row = X[(features["user_id"].to_numpy() == "u1")]
+    assert after["u1"] == pytest.approx(
+        model.predict_proba(row, iteration_range=(0, model.best_iteration + 1))[0, 1]
+    )
+    assert scoring.run(("churn",), changed_only=True)["churn"]["users_scored"] == 0
+
+
+def _weekly(days: int, level: float = 100.0, seed: int = 0) -> np.ndarray:
+    """A trending series with a weekly cycle and a little noise."""
+    t = np.arange(days)
+    noise = np.random.default_rng(seed).normal(0, 1, days)
+    return level + 0.2 * t + 0.2 * level * np.sin(2 * np.pi * t / 7) + noise
+
+
+def test_holt_winters_tracks_a_weekly_series():
+    y = np.vstack([_weekly(140, level, seed) for seed, level in enumerate((50.0, 100.0, 400.0))])
+    forecast, sigma = forecasting.holt_winters(y[:, :-28], season=7, horizon=28)
+    assert forecast.shape == (3, 28)
+    assert sigma.shape == (3,)
+    assert (forecasting.mape(y[:, -28:], forecast) < 0.05).all()
+
+
+def test_holt_winters_starts_series_at_their_first_value():
+    y = _weekly(100)
+    alone, _ = forecasting.holt_winters(y[None], season=7, horizon=14)
+    # The same series after 10 NaN days, batched with one that starts at once
+    padded = np.concatenate([np.full(10, np.nan), y])
+    batched, _ = forecasting.holt_winters(np.vstack([padded, _weekly(110, seed=1)]), season=7, horizon=14)
+    assert batched[0] == pytest.approx(alone[0])
+
+    # Zero-padding before the start would instead be fitted as history
+    zeros, _ = forecasting.holt_winters(np.concatenate([np.zeros(10), y])[None], season=7, horizon=14)
+    assert forecasting.mape(batched[:1], zeros)[0] > forecasting.mape(batched[:1], alone)[0]
+
+
+@pytest.mark.parametrize("engine", forecasting.ENGINES)
+def test_forecast_chunk_reports_every_series(engine, monkeypatch):
+    def seasonal_naive(calendar, y, freq, horizon):
+        yhat = np.resize(y[-7:], horizon)
+        return yhat, yhat - 1, yhat + 1
+
+    monkeypatch.setattr(forecasting, "_prophet", seasonal_naive)
+    calendar = pd.date_range("2024-01-01", periods=120, freq="D")
+    y = np.vstack([_weekly(120, level, seed) for seed, level in enumerate((50.0, 100.0, 200.0, 400.0))])
+    result = forecasting.forecast_chunk(engine, calendar, y, "D", 7, horizon=30, holdout=14)
+    assert set(result) == set(forecasting.RESULT_KEYS)
+    for key in ("yhat", "yhat_lower", "yhat_upper"):
+        assert result[key].shape == (4, 30)
+    assert result["mape"].shape == result["fit_seconds"].shape == (4,)
+    assert len(set(result["mape"])) == 4
+    assert (result["fit_seconds"] > 0).all()
+    assert (result["yhat_lower"] <= result["yhat"]).all() and (result["yhat"] <= result["yhat_upper"]).all()
+
+
+@pytest.fixture
+def events(warehouse):
+    """120 days of events on three platforms, busier on weekdays; ``u0`` only joins on day 100."""
+    con = duckdb.connect("data/metricflow.duckdb")
+    con.execute("CREATE SCHEMA staging")
+    con.execute("""
+        CREATE TABLE staging.stg_events AS
+        SELECT DATE '2024-01-01' + (i % 120)::INTEGER AS event_date,
+               'u' || (1 + i // 120 % 60) AS user_id,
+               ['web', 'ios', 'android'][1 + i // 120 % 3] AS platform
+        FROM range(7200) t(i)
+        WHERE dayofweek(DATE '2024-01-01' + (i % 120)::INTEGER) NOT IN (0, 6) OR i // 120 % 2 = 0
+        UNION ALL
+        SELECT DATE '2024-04-10' + i::INTEGER, 'u0', 'tv' FROM range(20) t(i)
+    """)
+    con.close()
+    return warehouse
+
+
+def test_forecasting_run_writes_and_reuses_series_forecasts(events, monkeypatch, capsys):
+    monkeypatch.setattr(forecasting.importlib.util, "find_spec", lambda name: None)
+    metrics = forecasting.run(("dau", "dau_platform"), workers=1)
+    # Without prophet the auto engine falls back to Holt-Winters; the 20-day tv series is too short
+    assert metrics["model"] == "holt_winters"
+    assert (metrics["series"], metrics["skipped_series"]) == (4, 1)
+    assert metrics["mape"] < 0.1
+
+    con = duckdb.connect("data/metricflow.duckdb", read_only=True)
+    accuracy = con.execute("SELECT family, series_id FROM ml_outputs.forecast_accuracy ORDER BY 1, 2").fetchall()
+    rows = con.execute("SELECT count(*) FROM ml_outputs.series_forecast").fetchone()[0]
+    first_day = con.execute("SELECT min(ds) FROM ml_outputs.user_forecast").fetchone()[0]
+    con.close()
+    assert accuracy == [("dau", "all"), ("dau_platform", "android"), ("dau_platform", "ios"), ("dau_platform", "web")]
+    assert rows == 4 * forecasting.FAMILIES["dau"]["horizon"]
+    assert first_day.date() == date(2024, 4, 30)
+
+    capsys.readouterr()
+    assert forecasting.run(("dau",), engine="holt_winters", workers=1)["mape"] == metrics["mape"]
+    assert "1 families, 1 from the registry" in capsys.readouterr().out
+    with pytest.raises(ImportError, match="prophet"):
+        forecasting.run(("dau",), engine="prophet")
+
+
+def test_series_features_match_add_features_per_series():
+    rng = np.random.default_rng(0)
+    # Two series' days interleaved, as they come out of a query before sorting
+    df = pd.DataFrame({
+        "series_id": np.tile(["a", "b"], 20),
+        **{col: rng.integers(1, 50, 40).astype(float) for col in anomaly_detection.FEATURES},
+    }).sort_values("series_id", kind="stable", ignore_index=True)
+    starts = np.array([0, 20])
+
+    expected = []
+    for _, group in df.groupby("series_id"):
+        group = group.copy()
+        expected.append(group[anomaly_detection.add_features(group)].to_numpy())
+    assert anomaly_detection.series_features(df, starts) == pytest.approx(np.vstack(expected))
+
+
+def test_standardize_by_series_zscores_each_series():
+    rng = np.random.default_rng(0)
+    X = np.vstack([rng.normal(5, 2, (30, 3)), rng.normal(1000, 300, (50, 3))])
+    Z = anomaly_detection.standardize_by_series(X, np.array([0, 30]))
+    for block in (Z[:30], Z[30:]):
+        assert block.mean(axis=0) == pytest.approx(0, abs=1e-9)
+        assert block.std(axis=0) == pytest.approx(1)
+
+
+SPIKE_DAY = date(2024, 2, 15)
+
+
+@pytest.fixture
+def plans(warehouse):
+    """Revenue split across two plans, with a spike in one plan's revenue on SPIKE_DAY."""
+    con = duckdb.connect("data/metricflow.duckdb")
+    con.execute("""
+        ALTER TABLE intermediate.int_revenue_normalized ADD COLUMN plan_name VARCHAR;
+        UPDATE intermediate.int_revenue_normalized
+        SET plan_name = CASE WHEN user_id[-1:] IN ('0', '2', '4', '6', '8') THEN 'basic' ELSE 'pro' END;
+        CREATE SCHEMA marts;
+        CREATE TABLE marts.dim_users AS
+        SELECT 'u' || i AS user_id, ['US', 'DE'][1 + i % 2] AS country, 'organic' AS acquisition_channel
+        FROM range(37) t(i);
+    """)
+    con.execute("""
+        UPDATE intermediate.int_revenue_normalized SET recognized_mrr = recognized_mrr * 50
+        WHERE plan_name = 'pro' AND payment_date = ?
+    """, [SPIKE_DAY])
+    con.close()
+    return warehouse
+
+
+@pytest.mark.parametrize("model", ["shared", "per_series"])
+def test_run_series_scores_every_day_and_flags_a_spike(plans, model):
+    metrics = anomaly_detection.run_series(("plan_name",), model=model, workers=1)
+    assert (metrics["series"], metrics["series_days"]) == (2, 180)
+
+    con = duckdb.connect("data/metricflow.duckdb", read_only=True)
+    rows = con.execute("""
+        SELECT plan_name, payment_date::DATE, anomaly_score, is_anomaly FROM ml_outputs.revenue_anomalies_by_series
+    """).fetchall()
+    con.close()
+    assert len(rows) == len({(plan, day) for plan, day, _, _ in rows}) == 180
+    assert all(score is not None for _, _, score, _ in rows)
+    flagged = {(plan, day) for plan, day, _, anomaly in rows if anomaly}
+    assert ("pro", SPIKE_DAY) in flagged
+    assert len(flagged) < 0.1 * len(rows)
+
+
+def test_stratified_sample_keeps_stratum_shares():
+    rng = np.random.default_rng(0)
+    strata = rng.choice(8, size=50_000, p=[0.4, 0.2, 0.15, 0.1, 0.08, 0.04, 0.02, 0.01])
+    sample = segmentation.stratified_sample(strata, 5_000)
+    assert len(sample) == pytest.approx(5_000, abs=8)  # rounded up per stratum
+    assert (np.diff(sample) > 0).all()
+    shares = np.bincount(strata, minlength=8) / len(strata)
+    assert np.bincount(strata[sample], minlength=8) / len(sample) == pytest.approx(shares, abs=0.002)
+    assert (segmentation.stratified_sample(strata[:100], 5_000) == np.arange(100)).all()
+
+
+@pytest.mark.parametrize("scalable", [False, True])
+def test_sweep_k_reports_every_k(scalable):
+    rng = np.random.default_rng(0)
+    centers = np.vstack([np.zeros(3), 20 * np.eye(3)])  # four well-separated blobs
+    X = np.vstack([c + rng.normal(0, 1, (150, 3)) for c in centers])
+    best_k, model, labels, score, sweep = segmentation.sweep_k(X, scalable)
+    assert [row["k"] for row in sweep] == list(segmentation.K_RANGE)
+    assert all(row["inertia"] > 0 and -1 <= row["silhouette"] <= 1 for row in sweep)
+    assert best_k == 4
+    assert score == pytest.approx(max(row["silhouette"] for row in sweep), abs=1e-4)
+    assert len(labels) == len(X) and model.n_clusters == best_k
+
+
+def _stub(monkeypatch, name: str, run) -> str:
+    """Register ``ml_pipeline.<name>`` with ``run``; the pool's forked workers inherit it."""
+    module = types.ModuleType(f"ml_pipeline.{name}")
+    module.run = run
+    monkeypatch.setitem(sys.modules, module.__name__, module)
+    return name
+
+
+def _slow_run(retrain=False):
+    time.sleep(0.5)
+    return {"pid": os.getpid(), "threads": os.environ["OMP_NUM_THREADS"], "retrain": retrain}
+
+
+def _failing_run(retrain=False):
+    raise RuntimeError("no features table")
+
+
+def test_run_all_parallel_reports_failures_without_stopping_others(monkeypatch, capsys):
+    monkeypatch.setattr(run_all, "PIPELINES", {
+        "Slow": _stub(monkeypatch, "stub_slow", _slow_run),
+        "Failing": _stub(monkeypatch, "stub_failing", _failing_run),
+    })
+    results = run_all.main(["--parallel", "--workers", "2", "--threads", "1", "--retrain"])
+    # The failure comes back first, and the pipeline still running beside it completes
+    assert list(results) == ["Failing", "Slow"]
+    assert results["Failing"] == {"error": "no features table"}
+    assert results["Slow"]["pid"] != os.getpid()
+    assert (results["Slow"]["threads"], results["Slow"]["retrain"]) == ("1", True)
+    out = capsys.readouterr().out
+    assert "❌ Failing failed: no features table" in out
+    assert "✅ Slow [" in out
@@ -0,0 +1,96 @@
+"""Tests for the cached pipeline DAG."""
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from pipeline import ML_MODULES, Stage, build_stages, main, run_pipeline
+
+
+def append(path: str, text: str = "x") -> list[str]:
+    """A command appending ``text`` to ``path``, so reruns are countable."""
+    return [sys.executable, "-c", f"open({path!r}, 'a').write({text!r})"]
+
+
+def runs(path: str) -> int:
+    return len(Path(path).read_text()) if Path(path).exists() else 0
+
+
+@pytest.fixture
+def stages(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Path("input.txt").write_text("v1")
+    return [
+        Stage("extract", [append("extract.out")], outputs=[Path("extract.out")]),
+        Stage("load", [append("load.out")], deps=["extract"], data=["input.txt"]),
+        Stage("model_a", [append("a.out")], deps=["load"]),
+        Stage("model_b", [append("b.out")], deps=["load"]),
+    ]
+
+
+def statuses(report: dict) -> dict:
+    return {name: r["status"] for name, r in report["stages"].items()}
+
+
+def test_unchanged_stages_are_skipped(stages):
+    assert set(statuses(run_pipeline(stages, jobs=2)).values()) == {"ran"}
+    report = run_pipeline(stages, jobs=2)
+    assert set(statuses(report).values()) == {"skipped"}
+    assert [runs(f) for f in ("extract.out", "load.out", "a.out", "b.out")] == [1, 1, 1, 1]
+    assert json.loads(Path("data/pipeline/report.json").read_text())["stages"] == report["stages"]
+
+
+def test_changed_data_reruns_the_stage_and_its_dependents(stages):
+    run_pipeline(stages)
+    Path("input.txt").write_text("v2")
+    assert statuses(run_pipeline(stages)) == {
+        "extract": "skipped", "load": "ran", "model_a": "ran", "model_b": "ran",
+    }
+
+
+def test_missing_output_reruns_the_stage(stages):
+    run_pipeline(stages)
+    Path("extract.out").unlink()
+    assert statuses(run_pipeline(stages))["extract"] == "ran"
+
+
+def test_forced_stage_reruns_without_its_dependents(stages):
+    run_pipeline(stages)
+    assert statuses(run_pipeline(stages, force={"load"})) == {
+        "extract": "skipped", "load": "ran", "model_a": "skipped", "model_b": "skipped",
+    }
+
+
+def test_failed_stage_blocks_dependents_and_is_not_cached(stages):
+    stages[1].commands = [[sys.executable, "-c", "raise SystemExit(3)"]]
+    report = run_pipeline(stages)
+    assert statuses(report) == {"extract": "ran", "load": "failed", "model_a": "blocked", "model_b": "blocked"}
+    assert "exit code 3" in report["stages"]["load"]["error"]
+
+    stages[1].commands = [append("load.out")]
+    assert statuses(run_pipeline(stages)) == {
+        "extract": "skipped", "load": "ran", "model_a": "ran", "model_b": "ran",
+    }
+
+
+def test_build_stages_wires_the_dag():
+    stages = {s.name: s for s in build_stages(["--num-users", "50", "--output-dir", "raw"], dbt_test=True)}
+    assert list(stages) == ["generate", "load", "dbt", *ML_MODULES]
+    assert "num_users=50" in stages["generate"].config
+    assert stages["load"].data == ["raw/**/*.parquet"]
+    assert ["dbt", "test"] in stages["dbt"].commands
+    for name, module in ML_MODULES.items():
+        assert stages[name].deps == ["dbt"]
+        assert f"ml_pipeline/{module}.py" in stages[name].code
+        assert "ml_pipeline/registry.py" in stages[name].code
+
+
+@pytest.mark.parametrize("option", ["--force", "--only"])
+def test_unknown_stage_names_are_rejected(option, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main([option, "ml_churn", "nonexistent"])
+    assert exit_info.value.code == 2
+    assert "unknown stages: nonexistent" in capsys.readouterr().err